@@ -0,0 +1,100 @@
+# Measures the SQLite catalog: the load rate of a synthetic central directory
+# stored under many URLs (10M entries by default), the time taken to build
+# its indexes, then the latency of the queries answered from them and of the
+# reconstruction of the index of one ZIP.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import build_central_directory
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+)
+
+from lib.catalog import Catalog
+from lib.central_directory_index import parse_central_directory
+
+
+def measure(label, function, runs=5):
+    # Prints the best time of function over runs runs, and returns its result.
+    best = None
+    for _ in range(runs):
+        begin = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"\t- {label}: {best * 1000:.2f}ms")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--archives", action="store", default=100, type=int,
+                        help="Number of ZIPs loaded")
+    parser.add_argument("--entries", action="store", default=100000, type=int,
+                        help="Number of entries of each ZIP")
+    parser.add_argument("--path", action="store", default=None, type=str,
+                        help="Catalog file [default: temporary file]")
+
+    args = parser.parse_args()
+    index = parse_central_directory(
+        build_central_directory(args.entries),
+        args.entries
+    )
+    total = args.archives * args.entries
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or os.path.join(directory, "catalog.sqlite")
+        with Catalog(path) as catalog:
+            print(f"[*] Loading {args.archives} ZIP(s) of {args.entries} " + \
+                  f"entries ({total} entries).")
+            begin = time.perf_counter()
+            for i in range(args.archives):
+                catalog.store(
+                    f"http://127.0.0.1/archive_{i}.zip",
+                    args.entries * 1000,
+                    f"ETag: \"{i}\"",
+                    None,
+                    index
+                )
+            load_time = time.perf_counter() - begin
+            print(f"[*] Loaded in {load_time:.2f}s " + \
+                  f"({total / load_time:.0f} entries/s).")
+
+            begin = time.perf_counter()
+            catalog.build_indexes()
+            print("[*] Indexes built in " + \
+                  f"{time.perf_counter() - begin:.2f}s.")
+            size = sum(
+                os.path.getsize(path + suffix)
+                for suffix in ("", "-wal")
+                if os.path.exists(path + suffix)
+            )
+            print(f"[*] Catalog size: {size} bytes " + \
+                  f"({size / total:.1f} bytes per entry).")
+
+            name = f"directory_7/file_{args.entries // 2 + 7}.txt"
+            print("[*] Queries (best of 5 runs):")
+            matches = measure(
+                "exact name",
+                lambda: catalog.find(glob=name)
+            )
+            assert len(matches) == args.archives
+            measure(
+                "name prefix",
+                lambda: catalog.find(
+                    glob=f"directory_1/file_{args.entries // 2 + 1}*"
+                )
+            )
+            measure("CRC-32", lambda: catalog.find(crc32=args.entries // 3))
+            # Every synthetic entry is 200 bytes long (uncompressed).
+            measure("size range", lambda: catalog.find(min_size=201))
+            measure(
+                f"index of one ZIP ({args.entries} entries)",
+                lambda: catalog.load("http://127.0.0.1/archive_0.zip"),
+                runs=1
+            )
@@ -0,0 +1,46 @@
+# Measures the memory used by one CentralDirectoryFileHeader and the time
+# needed to decode it and to call its most used getters.
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from lib.central_directory_file_header import CentralDirectoryFileHeader
+from synthetic import build_central_directory
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("entries", action="store",
+                    default=100000, type=int,
+                    nargs="?", help="Number of headers to decode")
+
+args = parser.parse_args()
+datas = build_central_directory(args.entries)
+
+offsets = []
+start = 0
+for _ in range(args.entries):
+    offsets.append(start)
+    start += CentralDirectoryFileHeader(datas, start).StructLength
+
+tracemalloc.start()
+begin = time.perf_counter()
+cdfhs = [CentralDirectoryFileHeader(datas, offset) for offset in offsets]
+elapsed = time.perf_counter() - begin
+memory = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+print(f"[*] Decode: {elapsed / args.entries * 1e9:.0f}ns per header, " + \
+      f"{memory / args.entries:.0f} bytes per header."
+)
+
+begin = time.perf_counter()
+for cdfh in cdfhs:
+    cdfh.get_file_name(1)
+    cdfh.get_relative_offset_of_local_file_header(1)
+    cdfh.get_compressed_size(1)
+    cdfh.get_file_modification_date()
+elapsed = time.perf_counter() - begin
+print(f"[*] Getters: {elapsed / args.entries * 1e9:.0f}ns per header.")
@@ -0,0 +1,28 @@
+# Measures how the time needed to index a central directory grows with the
+# number of entries. The central directories are generated in memory, so no
+# server is needed.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from lib.central_directory_index import parse_central_directory
+from synthetic import build_central_directory
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("entries", action="store",
+                    default=[1000, 10000, 100000, 200000], type=int,
+                    nargs="*", help="Number of entries to index")
+
+args = parser.parse_args()
+for entries in args.entries:
+    datas = build_central_directory(entries)
+    begin = time.perf_counter()
+    index = parse_central_directory(datas, entries)
+    elapsed = time.perf_counter() - begin
+    print(f"[*] {entries} entries indexed in {elapsed:.3f}s " + \
+          f"({elapsed / entries * 1e9:.0f}ns per entry)."
+    )
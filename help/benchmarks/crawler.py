@@ -0,0 +1,91 @@
+# Measures the throughput of the batch mode. Small synthetic archives are
+# served by the lab server with the requested latency, then indexed by
+# "main.py --batch" at several concurrency levels. With a latency of L
+# seconds, a sequential crawl can't index more than 1 / L archives per
+# second; the concurrent crawl should scale with the concurrency until the
+# limit of requests in flight per host is reached.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from suite import wait_for_server
+from synthetic import build_archive
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--archives", action="store", default=200, type=int,
+                        help="Number of archives indexed")
+    parser.add_argument("--entries", action="store", default=100, type=int,
+                        help="Number of entries of each archive")
+    parser.add_argument("--latency", action="store", default=50, type=float,
+                        help="Latency of the lab server, in milliseconds")
+    parser.add_argument("--concurrency", action="store", default=[1, 4, 16, 64],
+                        type=int, nargs="+",
+                        help="Concurrency levels measured")
+    parser.add_argument("--max-requests-per-host", action="store", default=64,
+                        type=int,
+                        help="Maximum number of requests in flight to the " + \
+                             "lab server")
+    parser.add_argument("--port", action="store", default=8126, type=int,
+                        help="Port of the lab server")
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"[*] Generating {args.archives} archive(s) of " + \
+              f"{args.entries} entries.")
+        build_archive(os.path.join(directory, "crawl.zip"), args.entries, 32,
+                      256)
+        # The archives are identical, only their URL differs.
+        for i in range(1, args.archives):
+            os.link(
+                os.path.join(directory, "crawl.zip"),
+                os.path.join(directory, f"crawl-{i}.zip")
+            )
+        urls = os.path.join(directory, "urls.txt")
+        with open(urls, "w") as f:
+            f.write(f"http://127.0.0.1:{args.port}/crawl.zip\n")
+            for i in range(1, args.archives):
+                f.write(f"http://127.0.0.1:{args.port}/crawl-{i}.zip\n")
+
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "help", "server", "main.py"),
+                str(args.port), "--bind", "127.0.0.1",
+                "--latency", str(args.latency)
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(args.port)
+            print(f"[*] Latency of {args.latency}ms, at most " + \
+                  f"{1000 / args.latency:.1f} archive(s)/s sequentially." \
+                  if args.latency else "[*] No latency.")
+            for concurrency in args.concurrency:
+                begin = time.perf_counter()
+                subprocess.run(
+                    [
+                        sys.executable, os.path.join(ROOT, "main.py"),
+                        "--batch", urls, "--no-cache", "--no-entries",
+                        "--index-output", os.devnull,
+                        "--concurrency", str(concurrency),
+                        "--max-requests-per-host",
+                        str(args.max_requests_per_host)
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    check=True
+                )
+                wall_time = time.perf_counter() - begin
+                print(f"\t- Concurrency {concurrency}: {wall_time:.2f}s " + \
+                      f"({args.archives / wall_time:.1f} archive(s)/s)")
+        finally:
+            server.terminate()
@@ -0,0 +1,154 @@
+# Measures how the extraction of a ZIP of compressible members scales with the
+# number of decompression processes. A ZIP of members compressed with the
+# chosen method is served by the lab server, then all its members are
+# downloaded with --decompress-processes 1 (decompression in the download
+# threads), 2, 4, ... up to the number of cores, from the block cache so that
+# the network doesn't hide the decompression time.
+import argparse
+import filecmp
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+from suite import wait_for_server
+from synthetic import get_member_name
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+METHODS = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+
+def get_text(i, member_size):
+    # Returns member_size bytes of words drawn at random, which compress about
+    # as well as text.
+    generator = random.Random(i)
+    words = [
+        generator.randbytes(generator.randint(2, 10)).hex().encode()
+        for _ in range(1000)
+    ]
+    text = b" ".join(generator.choices(words, k=member_size // 8 + 1))
+    return text[:member_size]
+
+
+def build_text_archive(path, entries, member_size, method):
+    with zipfile.ZipFile(path, "w", METHODS[method]) as z:
+        for i in range(entries):
+            z.writestr(get_member_name(i), get_text(i, member_size))
+
+
+def get_process_counts(max_processes):
+    # Returns 1, 2, 4, ... up to max_processes.
+    counts = [1]
+    while counts[-1] * 2 <= max_processes:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_processes:
+        counts.append(max_processes)
+    return counts
+
+
+def get_wall_time(arguments):
+    begin = time.perf_counter()
+    subprocess.run(arguments, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - begin
+
+
+def compare_outputs(left, right):
+    # Returns True if the directories left and right hold the same files.
+    comparison = filecmp.dircmp(left, right)
+    if comparison.left_only or comparison.right_only or \
+        filecmp.cmpfiles(
+            left, right, comparison.common_files, shallow=False
+        )[1:] != ([], []):
+        return False
+    return all(
+        compare_outputs(os.path.join(left, d), os.path.join(right, d))
+        for d in comparison.common_dirs
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", action="store", default=64, type=int,
+                        help="Number of members of the ZIP")
+    parser.add_argument("--member-size", action="store", default=4194304,
+                        type=int, help="Uncompressed size of each member")
+    parser.add_argument("--method", action="store", default="lzma",
+                        choices=sorted(METHODS),
+                        help="Compression method of the members")
+    parser.add_argument("--runs", action="store", default=3, type=int,
+                        help="Number of runs of each measure")
+    parser.add_argument("--max-processes", action="store",
+                        default=os.cpu_count() or 1, type=int,
+                        help="Largest number of decompression processes " + \
+                             "[default: number of cores]")
+    parser.add_argument("--port", action="store", default=8126, type=int,
+                        help="Port of the lab server")
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"[*] Building a ZIP of {args.entries} {args.method} " + \
+              f"member(s) of {args.member_size} bytes.")
+        build_text_archive(
+            os.path.join(directory, "decompression.zip"),
+            args.entries,
+            args.member_size,
+            args.method
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "help", "server", "main.py"),
+                str(args.port), "--bind", "127.0.0.1"
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(args.port)
+            url = f"http://127.0.0.1:{args.port}/decompression.zip"
+            extraction = [
+                sys.executable, os.path.join(ROOT, "main.py"), url,
+                "--cache-dir", os.path.join(directory, "cache"),
+                "--block-cache-dir", os.path.join(directory, "blocks"),
+                "--glob", "*"
+            ]
+            # The first run fills the index cache and the block cache.
+            get_wall_time(
+                extraction + ["--output-dir", os.path.join(directory, "warm")]
+            )
+
+            print(f"[*] Extraction (median of {args.runs} run(s)):")
+            reference = None
+            for processes in get_process_counts(args.max_processes):
+                output = os.path.join(directory, f"output_{processes}")
+                wall_time = statistics.median(
+                    get_wall_time(
+                        extraction + [
+                            "--output-dir", output,
+                            "--decompress-processes", str(processes)
+                        ]
+                    )
+                    for _ in range(args.runs)
+                )
+                reference = reference or wall_time
+                if not compare_outputs(output, os.path.join(directory, "warm")):
+                    print(f"[x] The files written by {processes} " + \
+                          "process(es) differ.")
+                    exit(-1)
+                print(f"\t- {processes} process(es): " + \
+                      f"{wall_time * 1000:.1f}ms " + \
+                      f"(x{reference / wall_time:.2f})"
+                )
+        finally:
+            server.terminate()
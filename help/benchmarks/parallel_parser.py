@@ -0,0 +1,52 @@
+# Measures how the time needed to index a large central directory changes
+# with the number of parsing processes, and checks that the parallel parse
+# gives the same index as the sequential one.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from lib.central_directory_index import parse_central_directory
+from lib.parallel_parser import parse_central_directory_parallel
+from synthetic import build_central_directory
+
+
+if __name__ == "__main__":
+    # The guard keeps the processes started by multiprocessing (spawned on
+    # macOS) from running the benchmark again.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("entries", action="store", default=500000, type=int,
+                        nargs="?", help="Number of entries to index")
+    parser.add_argument("--processes", action="store", default=os.cpu_count(),
+                        type=int, help="Maximum number of processes")
+
+    args = parser.parse_args()
+    datas = build_central_directory(args.entries)
+    print(f"[*] Central directory of {args.entries} entries " + \
+          f"({len(datas)} bytes)."
+    )
+
+    begin = time.perf_counter()
+    reference = parse_central_directory(datas, args.entries)
+    sequential = time.perf_counter() - begin
+    print(f"[*] Sequential: {sequential:.3f}s.")
+
+    for processes in range(1, args.processes + 1):
+        begin = time.perf_counter()
+        index = parse_central_directory_parallel(
+            datas,
+            args.entries,
+            processes
+        )
+        elapsed = time.perf_counter() - begin
+        if index.get_file_names() != reference.get_file_names() or any(
+            getattr(index, name) != getattr(reference, name)
+            for name in index.Columns
+        ):
+            print(f"[x] {processes} process(es): index differs.")
+            continue
+        print(f"[*] {processes} process(es): {elapsed:.3f}s " + \
+              f"(x{sequential / elapsed:.2f})."
+        )
@@ -0,0 +1,126 @@
+# Checks that the peak memory used to download a member does not grow with its
+# size, on each download path: a single range request (streaming), a
+# multi-range request (multipart) and several connections (segmented). ZIPs
+# holding a member of increasing size, followed by a member downloaded with a
+# separate range, are served by the lab server, and the peak RSS of main.py is
+# measured for each of them.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from suite import wait_for_server
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+# Options of main.py selecting each download path. The gap member between
+# member.bin and tail.txt makes them two ranges of a multi-range request.
+PATHS = {
+    "streaming": ["--segmented-threshold", str(2 ** 62)],
+    "multipart": [
+        "--segmented-threshold", str(2 ** 62),
+        "--max-gap", "0", "--ranges-per-request", "8"
+    ],
+    "segmented": ["--segmented-threshold", "0"],
+}
+
+
+def build_zip(path, size, compress_type):
+    # Writes a ZIP holding member.bin, made of size pseudo-random bytes, then
+    # gap.bin and tail.txt.
+    block = os.urandom(1024 * 1024)
+    with zipfile.ZipFile(path, "w", compress_type) as z:
+        with z.open("member.bin", "w", force_zip64=True) as f:
+            written = 0
+            while written < size:
+                f.write(block[:size - written])
+                written += len(block)
+        z.writestr("gap.bin", block)
+        z.writestr("tail.txt", b"Tail of the archive.\n" * 100)
+
+
+def run(url, output_directory, options):
+    # Runs main.py with options and returns its peak RSS in bytes.
+    p = subprocess.Popen(
+        [
+            sys.executable, os.path.join(ROOT, "main.py"), url,
+            "--no-cache", "--no-block-cache",
+            "--members", "member.bin", "tail.txt",
+            "--output-dir", output_directory
+        ] + options,
+        stdout=subprocess.DEVNULL
+    )
+    _, status, rusage = os.wait4(p.pid, 0)
+    if status != 0:
+        print(f"[x] main.py failed on {url}.")
+        exit(-1)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("sizes", action="store",
+                    default=[16, 64, 256], type=int,
+                    nargs="*", help="Sizes of the members in MiB")
+parser.add_argument("--port", action="store",
+                    default=8123, type=int,
+                    help="Port of the lab server")
+parser.add_argument("--tolerance", action="store",
+                    default=32, type=int,
+                    help="Maximum growth of the peak RSS in MiB")
+
+args = parser.parse_args()
+with tempfile.TemporaryDirectory() as directory:
+    for size in args.sizes:
+        for name, compress_type in (
+            ("stored", zipfile.ZIP_STORED),
+            ("deflated", zipfile.ZIP_DEFLATED)
+        ):
+            build_zip(
+                os.path.join(directory, f"{name}_{size}.zip"),
+                size * 1024 * 1024,
+                compress_type
+            )
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "help", "server", "main.py"),
+            str(args.port), "--bind", "127.0.0.1"
+        ],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(args.port)
+        peaks = {}
+        for size in args.sizes:
+            for name in ("stored", "deflated"):
+                for path, options in PATHS.items():
+                    peak = run(
+                        f"http://127.0.0.1:{args.port}/{name}_{size}.zip",
+                        os.path.join(directory, "outputs"),
+                        options
+                    )
+                    peaks.setdefault((name, path), []).append(peak)
+                    print(f"[*] {name} member of {size} MiB, {path}: " + \
+                          f"peak RSS of {peak / 1024 / 1024:.1f} MiB."
+                    )
+    finally:
+        server.terminate()
+
+failed = False
+for (name, path), values in peaks.items():
+    growth = (max(values) - values[0]) / 1024 / 1024
+    if growth > args.tolerance:
+        print(f"[x] Peak RSS grows by {growth:.1f} MiB with the size of " + \
+              f"{name} members ({path}).")
+        failed = True
+if failed:
+    exit(-1)
+print("[+] Peak RSS does not depend on the member size.")
@@ -0,0 +1,142 @@
+# Measures the random reads of a large deflated member with RemoteZipMember.
+# A ZIP holding a single text member is served by the lab server, then 1 MiB
+# is read at random positions of the member: from byte zero (no seek index),
+# while its seek index is built, and once it is stored, when only the data
+# from the closest seek point is downloaded and decompressed.
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+from decompression import get_text
+from suite import wait_for_server
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.insert(0, ROOT)
+
+from lib.bootstrap import bootstrap
+from lib.central_directory_index import CentralDirectoryParser
+from lib.downloader import Downloader
+from lib.remote_member import RemoteZipMember
+
+
+def measure(label, reads, open_member):
+    # Reads each (position, length) of reads from a member returned by
+    # open_member(), and prints the median time and volumes per read.
+    times = []
+    received = []
+    decompressed = []
+    member = None
+    for position, length in reads:
+        opened = open_member(member)
+        if member is not None and opened is not member:
+            member.close()
+        member = opened
+        begin = time.perf_counter()
+        received_before = member.Reader.Received
+        decompressed_before = member.Decompressed
+        member.seek(position)
+        member.read(length)
+        times.append(time.perf_counter() - begin)
+        received.append(member.Reader.Received - received_before)
+        decompressed.append(member.Decompressed - decompressed_before)
+    member.close()
+    print(f"\t- {label}: {statistics.median(times) * 1000:.1f}ms, " + \
+          f"{statistics.median(received) / 1024 / 1024:.2f} MiB received, " + \
+          f"{statistics.median(decompressed) / 1024 / 1024:.2f} MiB " + \
+          "decompressed (medians per read)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--member-size", action="store", default=256,
+                        type=int,
+                        help="Uncompressed size of the member, in MiB")
+    parser.add_argument("--reads", action="store", default=10, type=int,
+                        help="Number of random reads of each measure")
+    parser.add_argument("--read-size", action="store", default=1048576,
+                        type=int, help="Number of bytes of each read")
+    parser.add_argument("--latency", action="store", default=20, type=float,
+                        help="Latency of the lab server, in milliseconds")
+    parser.add_argument("--port", action="store", default=8127, type=int,
+                        help="Port of the lab server")
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"[*] Building a ZIP of a {args.member_size} MiB text member.")
+        with zipfile.ZipFile(
+            os.path.join(directory, "seek.zip"),
+            "w",
+            zipfile.ZIP_DEFLATED
+        ) as z:
+            with z.open("member.txt", "w", force_zip64=True) as f:
+                for i in range(args.member_size):
+                    f.write(get_text(i, 1024 * 1024))
+
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "help", "server", "main.py"),
+                str(args.port), "--bind", "127.0.0.1",
+                "--latency", str(args.latency)
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(args.port)
+            url = f"http://127.0.0.1:{args.port}/seek.zip"
+            metadata = bootstrap(url, 65536)
+            central_directory_parser = CentralDirectoryParser()
+            for datas in metadata.iter_central_directory():
+                central_directory_parser.feed(datas)
+            index = central_directory_parser.Index
+            downloader = Downloader(
+                url,
+                zip_size=metadata.ZipSize,
+                validator=metadata.Validator
+            )
+            seek_index_directory = os.path.join(directory, "seek")
+
+            size = args.member_size * 1024 * 1024
+            generator = random.Random(0)
+            reads = [
+                (generator.randrange(size - args.read_size), args.read_size)
+                for _ in range(args.reads)
+            ]
+            print(f"[*] Reads of {args.read_size} bytes at {args.reads} " + \
+                  f"random position(s), {args.latency}ms of latency:")
+            measure(
+                "from byte zero",
+                reads,
+                lambda member: RemoteZipMember(downloader, index, 0, None)
+            )
+            measure(
+                "building the seek index",
+                reads,
+                lambda member: member or RemoteZipMember(
+                    downloader,
+                    index,
+                    0,
+                    seek_index_directory
+                )
+            )
+            measure(
+                "with the seek index stored",
+                reads,
+                lambda member: RemoteZipMember(
+                    downloader,
+                    index,
+                    0,
+                    seek_index_directory
+                )
+            )
+        finally:
+            server.terminate()
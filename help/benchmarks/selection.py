@@ -0,0 +1,83 @@
+# Checks the names selected by --glob, --regex and --prefix on a central
+# directory generated in memory, where a directory name ends with another one
+# (dir/ and emptydir/): a glob has to match the whole name, a regular
+# expression anywhere in it. select() and matches() must agree. No server is
+# needed.
+import io
+import os
+import struct
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from lib.central_directory_index import parse_central_directory
+from lib.selection import Selection
+
+
+NAMES = [
+    "dir/",
+    "dir/a.txt",
+    "dir/b.bin",
+    "dir/sub/c.txt",
+    "emptydir/",
+    "emptydir/d.txt",
+    "other/dir/e.txt",
+    "readme.txt",
+]
+
+# Criteria (globs, regexes, prefixes) and the names they select.
+CASES = [
+    (["dir/*"], [], [], ["dir/", "dir/a.txt", "dir/b.bin", "dir/sub/c.txt"]),
+    (["*dir/*.txt"], [], [], [
+        "dir/a.txt", "dir/sub/c.txt", "emptydir/d.txt", "other/dir/e.txt"
+    ]),
+    (["*.txt"], [], [], [
+        "dir/a.txt", "dir/sub/c.txt", "emptydir/d.txt", "other/dir/e.txt",
+        "readme.txt"
+    ]),
+    (["dir/*.bin"], [], [], ["dir/b.bin"]),
+    ([], ["dir/"], [], [
+        "dir/", "dir/a.txt", "dir/b.bin", "dir/sub/c.txt", "emptydir/",
+        "emptydir/d.txt", "other/dir/e.txt"
+    ]),
+    (["dir/*.bin"], ["^readme"], [], ["dir/b.bin", "readme.txt"]),
+    (["readme.*"], [], ["emptydir/"], [
+        "emptydir/", "emptydir/d.txt", "readme.txt"
+    ]),
+]
+
+
+def build_index(names):
+    # Returns the index of the central directory of a ZIP holding names.
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        for name in names:
+            z.writestr(name, b"" if name.endswith("/") else name.encode())
+    datas = buffer.getvalue()
+    eocd = datas.rfind(b"\x50\x4b\x05\x06")
+    size, offset = struct.unpack_from("<2I", datas, eocd + 12)
+    return parse_central_directory(datas[offset:offset + size], len(names))
+
+
+if __name__ == "__main__":
+    index = build_index(NAMES)
+    failed = False
+    for globs, regexes, prefixes, expected in CASES:
+        selection = Selection(globs=globs, regexes=regexes, prefixes=prefixes)
+        selected = [index.get_file_name(i) for i in selection.select(index)]
+        matched = [
+            index.get_file_name(i) for i in range(len(index))
+            if selection.matches(index, i)
+        ]
+        label = f"globs {globs}, regexes {regexes}, prefixes {prefixes}"
+        if selected != expected or matched != expected:
+            print(f"[x] {label}: {selected} selected and {matched} " + \
+                  f"matched instead of {expected}.")
+            failed = True
+        else:
+            print(f"[*] {label}: {len(expected)} name(s).")
+
+    if failed:
+        exit(-1)
+    print("[+] The names selected are the expected ones.")
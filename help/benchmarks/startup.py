@@ -0,0 +1,120 @@
+# Measures how fast main.py starts. The import time of main.py (and of the
+# requests transport) is taken from "python -X importtime", then a ZIP served
+# by the lab server is listed from the index cache, with and without
+# revalidation, with each transport. The median wall time of the cached
+# listing is checked against a target.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from suite import wait_for_server
+from synthetic import build_archive
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def get_import_time(module):
+    # Returns the cumulative import time of module in seconds, measured in a
+    # new interpreter.
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    for line in reversed(p.stderr.splitlines()):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    return None
+
+
+def get_wall_time(arguments):
+    begin = time.perf_counter()
+    subprocess.run(arguments, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - begin
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", action="store", default=20, type=int,
+                        help="Number of runs of each measure")
+    parser.add_argument("--entries", action="store", default=1000, type=int,
+                        help="Number of entries of the listed ZIP")
+    parser.add_argument("--port", action="store", default=8125, type=int,
+                        help="Port of the lab server")
+    parser.add_argument("--target", action="store", default=100, type=float,
+                        help="Target of the cached listing, in milliseconds")
+
+    args = parser.parse_args()
+    print("[*] Import time (median of " + \
+          f"{args.runs} run(s), in a new interpreter):")
+    for module in ("main", "requests"):
+        times = [get_import_time(module) for _ in range(args.runs)]
+        print(f"\t- {module}: {statistics.median(times) * 1000:.1f}ms")
+    baseline = statistics.median(
+        get_wall_time([sys.executable, "-c", "pass"])
+        for _ in range(args.runs)
+    )
+    print(f"[*] Interpreter startup: {baseline * 1000:.1f}ms.")
+
+    with tempfile.TemporaryDirectory() as directory:
+        build_archive(
+            os.path.join(directory, "startup.zip"),
+            args.entries,
+            32,
+            256
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "help", "server", "main.py"),
+                str(args.port), "--bind", "127.0.0.1"
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(args.port)
+            url = f"http://127.0.0.1:{args.port}/startup.zip"
+            cache_dir = os.path.join(directory, "cache")
+            listing = [
+                sys.executable, os.path.join(ROOT, "main.py"), url,
+                "--cache-dir", cache_dir, "--dry-run", "--glob", "*"
+            ]
+            # The first run indexes the ZIP and fills the cache.
+            get_wall_time(listing)
+
+            failed = False
+            print("[*] Cached listing of " + \
+                  f"{args.entries} entries (median of {args.runs} run(s)):")
+            for transport in ("http.client", "requests"):
+                for revalidate in (True, False):
+                    arguments = listing + ["--transport", transport]
+                    if not revalidate:
+                        arguments.append("--no-revalidate")
+                    wall_time = statistics.median(
+                        get_wall_time(arguments) for _ in range(args.runs)
+                    )
+                    within = wall_time * 1000 <= args.target
+                    failed |= transport == "http.client" and not within
+                    print(f"\t[{'*' if within else 'x'}] {transport}, " + \
+                          ("with" if revalidate else "without") + \
+                          f" revalidation: {wall_time * 1000:.1f}ms " + \
+                          f"({(wall_time - baseline) * 1000:.1f}ms above " + \
+                          "the interpreter startup)"
+                    )
+        finally:
+            server.terminate()
+
+    if failed:
+        print(f"[x] The cached listing takes more than {args.target}ms.")
+        exit(-1)
+    print(f"[+] The cached listing takes less than {args.target}ms.")
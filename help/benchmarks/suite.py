@@ -0,0 +1,256 @@
+# Runs the standard scenarios (list, fetch one, fetch 1%, fetch 50%) on
+# synthetic archives of several shapes, served by the lab server with the
+# requested latency, bandwidth and multi-range support. For each run, the
+# wall time, the number of requests (round trips), the bytes sent by the
+# server and the peak RSS of main.py are written to a JSON file, which can be
+# compared with the results of another commit.
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import build_archive, get_member_name
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+# Shapes of the generated archives.
+SHAPES = {
+    "small": dict(entries=1000, name_length=32, member_size=4096),
+    "many": dict(entries=100000, name_length=48, member_size=64),
+    "large": dict(entries=64, name_length=32, member_size=4 * 1024 * 1024),
+    "long-names": dict(entries=20000, name_length=200, member_size=256),
+    "zip64": dict(entries=70000, name_length=32, member_size=64, zip64=True),
+    "comment": dict(
+        entries=1000, name_length=32, member_size=4096, comment_length=60000
+    ),
+}
+
+SCENARIOS = ("list", "one", "1%", "50%")
+
+# Metrics compared between two result files.
+METRICS = ("wall_time", "round_trips", "bytes", "peak_rss")
+
+
+def get_archive(directory, name, shape):
+    # Generates the archive of shape once per work directory.
+    filename = f"{name}-" + "-".join(
+        f"{key}={value}" for key, value in sorted(shape.items())
+    ) + ".zip"
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        print(f"[*] Generating {filename}.")
+        # The archive is built by another process, so that the peak RSS of
+        # this one (inherited by main.py when it is forked) stays low.
+        process = multiprocessing.Process(
+            target=build_archive,
+            args=(path + ".tmp",),
+            kwargs=shape
+        )
+        process.start()
+        process.join()
+        os.replace(path + ".tmp", path)
+    return filename
+
+
+def get_members(scenario, shape):
+    # Returns the names selected by scenario, None to list the archive.
+    entries = shape["entries"]
+    name_length = shape["name_length"]
+    if scenario == "list":
+        return None
+    if scenario == "one":
+        return [get_member_name(entries // 2, name_length)]
+    step = {"1%": 100, "50%": 2}[scenario]
+    return [get_member_name(i, name_length) for i in range(0, entries, step)]
+
+
+def wait_for_server(port, timeout=10):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    print("[x] The lab server did not start.")
+    exit(-1)
+
+
+def read_stats(path):
+    # Returns the number of requests and the bytes sent, then resets the file.
+    requests = sent = 0
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                requests += 1
+                sent += json.loads(line)["bytes"]
+        os.remove(path)
+    return requests, sent
+
+
+def run(url, members, directory, stats, extra_args):
+    # Runs main.py once and returns its metrics.
+    arguments = [
+        sys.executable, os.path.join(ROOT, "main.py"), url, "--no-cache",
+        "--output-dir", os.path.join(directory, "outputs")
+    ] + extra_args
+    if members is None:
+        arguments += ["--dry-run", "--glob", "*"]
+    else:
+        members_file = os.path.join(directory, "members.txt")
+        with open(members_file, "w") as f:
+            f.write("\n".join(members) + "\n")
+        arguments += ["--members-file", members_file]
+
+    read_stats(stats)
+    begin = time.perf_counter()
+    p = subprocess.Popen(arguments, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(p.pid, 0)
+    wall_time = time.perf_counter() - begin
+    round_trips, sent = read_stats(stats)
+    subprocess.run(["rm", "-rf", os.path.join(directory, "outputs")])
+    return {
+        "status": os.waitstatus_to_exitcode(status),
+        "wall_time": wall_time,
+        "round_trips": round_trips,
+        "bytes": sent,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        "peak_rss": rusage.ru_maxrss * \
+            (1 if sys.platform == "darwin" else 1024),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    # Prints the ratio of each metric to the one of the results in path.
+    with open(path) as f:
+        previous = json.load(f)
+    reference = {
+        (result["shape"], result["scenario"]): result
+        for result in previous["results"]
+    }
+    print(f"[*] Compared with {previous.get('commit')} " + \
+          "(new / old, > 1 is worse):")
+    for result in results["results"]:
+        old = reference.get((result["shape"], result["scenario"]))
+        if old is None:
+            continue
+        ratios = ", ".join(
+            f"{metric} x{result[metric] / old[metric]:.2f}"
+            if old[metric] else f"{metric} {result[metric]}"
+            for metric in METRICS
+        )
+        print(f"\t- {result['shape']} / {result['scenario']}: {ratios}")
+
+
+if __name__ == "__main__":
+    # The guard keeps the processes started by multiprocessing (spawned on
+    # macOS) from running the benchmark again.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shapes", action="store", default=list(SHAPES),
+                        choices=list(SHAPES), nargs="+",
+                        help="Shapes of the archives")
+    parser.add_argument("--scenarios", action="store", default=list(SCENARIOS),
+                        choices=SCENARIOS, nargs="+", help="Scenarios to run")
+    parser.add_argument("--latency", action="store", default=0, type=float,
+                        help="Latency of the lab server, in milliseconds")
+    parser.add_argument("--bandwidth", action="store", default=0, type=int,
+                        help="Bytes per second per connection of the lab " + \
+                             "server")
+    parser.add_argument("--multirange", action="store_true",
+                        help="Enable multi-range requests on the lab server")
+    parser.add_argument("--port", action="store", default=8124, type=int,
+                        help="Port of the lab server")
+    parser.add_argument("--work-dir", action="store", default=None, type=str,
+                        help="Directory where the archives are kept " + \
+                             "between runs")
+    parser.add_argument("--output", action="store", default="results.json",
+                        type=str,
+                        help="JSON file where the results are written")
+    parser.add_argument("--compare", action="store", default=None, type=str,
+                        help="JSON file of previous results to compare with")
+    parser.add_argument("main_args", action="store", nargs="*",
+                        help="Extra arguments of main.py (after --)")
+
+    args = parser.parse_args()
+    work_dir = args.work_dir or tempfile.mkdtemp()
+    os.makedirs(work_dir, exist_ok=True)
+    stats = os.path.join(work_dir, "stats.jsonl")
+    archives = {
+        name: get_archive(work_dir, name, SHAPES[name]) for name in args.shapes
+    }
+
+    server = subprocess.Popen(
+        [
+            sys.executable, os.path.join(ROOT, "help", "server", "main.py"),
+            str(args.port), "--latency", str(args.latency),
+            "--bandwidth", str(args.bandwidth), "--stats", stats
+        ] + ([] if args.multirange else ["--no-multirange"]),
+        cwd=work_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(args.port)
+        results = {
+            "commit": get_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": {
+                "latency": args.latency,
+                "bandwidth": args.bandwidth,
+                "multirange": args.multirange,
+            },
+            "main_args": args.main_args,
+            "results": [],
+        }
+        for name in args.shapes:
+            url = f"http://127.0.0.1:{args.port}/{archives[name]}"
+            archive_size = os.path.getsize(
+                os.path.join(work_dir, archives[name])
+            )
+            for scenario in args.scenarios:
+                members = get_members(scenario, SHAPES[name])
+                result = run(url, members, work_dir, stats, args.main_args)
+                result.update({
+                    "shape": name,
+                    "scenario": scenario,
+                    "entries": SHAPES[name]["entries"],
+                    "archive_size": archive_size,
+                })
+                results["results"].append(result)
+                status = "*" if result["status"] == 0 else "x"
+                print(f"[{status}] {name} / " + \
+                      f"{scenario}: {result['wall_time']:.3f}s, " + \
+                      f"{result['round_trips']} round trip(s), " + \
+                      f"{result['bytes']} bytes, peak RSS " + \
+                      f"{result['peak_rss'] / 1024 / 1024:.1f} MiB."
+                )
+    finally:
+        server.terminate()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[+] Results written to {args.output}.")
+    if args.compare is not None:
+        compare(results, args.compare)
@@ -0,0 +1,73 @@
+# Helpers generating synthetic ZIP structures and archives for the benchmarks.
+import os
+import random
+import struct
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from make_zip64 import Zip64Writer
+
+
+def build_central_directory(entries):
+    # Returns a central directory made of entries deflated files named
+    # directory_<x>/file_<i>.txt.
+    datas = bytearray()
+    for i in range(entries):
+        name = f"directory_{i % 100}/file_{i}.txt".encode()
+        datas += struct.pack(
+            "<4s6H3I5H2I",
+            b"\x50\x4b\x01\x02", 0x031e, 20, 0, 8, 0x6000, 0x5721,
+            i, 100, 200, len(name), 0, 0, 0, 0, 0, i * 100
+        )
+        datas += name
+    return bytes(datas)
+
+
+def get_member_name(i, name_length=32):
+    # Returns the name of member i, padded to name_length characters.
+    name = f"directory_{i % 100}/file_{i:08d}"
+    return name + "_" * max(name_length - len(name) - 4, 0) + ".bin"
+
+
+def get_member_datas(i, member_size):
+    # Returns member_size bytes, made of random blocks of 512 bytes each
+    # repeated once, so that the members compress to about half of their size.
+    datas = random.Random(i).randbytes((member_size + 1) // 2)
+    return b"".join(
+        datas[j:j + 512] * 2 for j in range(0, len(datas), 512)
+    )[:member_size]
+
+
+def build_archive(
+    path,
+    entries,
+    name_length=32,
+    member_size=1024,
+    zip64=False,
+    comment_length=0
+):
+    """
+    This function writes a ZIP of entries deflated members of member_size
+    bytes, named by get_member_name(). If zip64 is True, the archive ends with
+    ZIP64 end of central directory records, whatever its size.
+    """
+
+    if zip64:
+        writer = Zip64Writer(path)
+        for i in range(entries):
+            writer.add_file(
+                get_member_name(i, name_length),
+                get_member_datas(i, member_size)
+            )
+        writer.close()
+        return
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(entries):
+            z.writestr(
+                get_member_name(i, name_length),
+                get_member_datas(i, member_size)
+            )
+        z.comment = b"c" * comment_length
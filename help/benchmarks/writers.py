@@ -0,0 +1,181 @@
+# Checks that the files extracted by the tool are identical to the ones archived,
+# whatever wrote the ZIP: Python's zipfile (seekable and streamed, with data
+# descriptors), Info-ZIP (zip, and zip writing to a pipe, also with data
+# descriptors) and bsdtar (whose "./" entries have an empty name once
+# sanitized). Each archive is served by the lab server and downloaded with
+# several sets of options (single ranges, multi-range requests, resolved
+# extents, segmented downloads), to the default relative output directory.
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from decompression import compare_outputs, get_text
+from suite import wait_for_server
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+# Options of main.py selecting each download path.
+OPTIONS = {
+    "single ranges": [],
+    "multi-range": ["--max-gap", "0", "--ranges-per-request", "8"],
+    "resolved extents": ["--resolve-extents"],
+    "segmented": ["--segmented-threshold", "0"],
+}
+
+
+def build_tree(directory):
+    # Writes the files archived, in nested directories: text, an empty file,
+    # and random bytes whose compressed size is larger than a coalesced range
+    # (their range overlaps the ones of their neighbours).
+    files = {
+        "readme.txt": b"Files archived by several writers.\n",
+        "empty.txt": b"",
+        "text/words.txt": get_text(0, 256 * 1024),
+        "text/nested/more.txt": get_text(1, 4096),
+        "binary/random.bin": os.urandom(9 * 1024 * 1024),
+        "binary/small.bin": os.urandom(1024),
+    }
+    for name, datas in files.items():
+        path = os.path.join(directory, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(datas)
+    return sorted(files)
+
+
+class Unseekable:
+    # File object without seek() nor tell(), so that zipfile streams the
+    # members and writes a data descriptor after each of them.
+    def __init__(self, f):
+        self.File = f
+
+    def write(self, datas):
+        return self.File.write(datas)
+
+    def flush(self):
+        self.File.flush()
+
+
+def write_zipfile(source, names, path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name in names:
+            z.write(os.path.join(source, *name.split("/")), name)
+
+
+def write_zipfile_streamed(source, names, path):
+    with open(path, "wb") as f:
+        with zipfile.ZipFile(Unseekable(f), "w", zipfile.ZIP_DEFLATED) as z:
+            for name in names:
+                with open(os.path.join(source, *name.split("/")), "rb") as src:
+                    with z.open(name, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+
+
+def write_info_zip(source, names, path):
+    subprocess.run(
+        ["zip", "-q", "-r", path, "."],
+        cwd=source,
+        check=True
+    )
+
+
+def write_info_zip_streamed(source, names, path):
+    with open(path, "wb") as f:
+        subprocess.run(
+            ["zip", "-q", "-r", "-", "."],
+            cwd=source,
+            stdout=f,
+            check=True
+        )
+
+
+def write_bsdtar(source, names, path):
+    subprocess.run(
+        ["bsdtar", "--format", "zip", "-cf", path, "."],
+        cwd=source,
+        check=True
+    )
+
+
+# Writers, and the command they need.
+WRITERS = {
+    "zipfile": (write_zipfile, None),
+    "zipfile streamed": (write_zipfile_streamed, None),
+    "Info-ZIP": (write_info_zip, "zip"),
+    "Info-ZIP streamed": (write_info_zip_streamed, "zip"),
+    "bsdtar": (write_bsdtar, "bsdtar"),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", action="store", default=8128, type=int,
+                        help="Port of the lab server")
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source")
+        names = build_tree(source)
+        archives = {}
+        for label, (write, command) in WRITERS.items():
+            if command is not None and shutil.which(command) is None:
+                print(f"[!] {label}: {command} not found, skipped.")
+                continue
+            filename = label.replace(" ", "_").replace("-", "_") + ".zip"
+            write(source, names, os.path.join(directory, filename))
+            archives[label] = filename
+
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "help", "server", "main.py"),
+                str(args.port), "--bind", "127.0.0.1"
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        failed = False
+        try:
+            wait_for_server(args.port)
+            for label, filename in archives.items():
+                for name, options in OPTIONS.items():
+                    # The files are written to the default output directory,
+                    # relative to the working directory.
+                    work = tempfile.mkdtemp(dir=directory)
+                    p = subprocess.run(
+                        [
+                            sys.executable, os.path.join(ROOT, "main.py"),
+                            f"http://127.0.0.1:{args.port}/{filename}",
+                            "--no-cache", "--no-block-cache", "--glob", "*"
+                        ] + options,
+                        cwd=work,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT
+                    )
+                    output = p.stdout.decode(errors="replace")
+                    if p.returncode != 0 or "[x]" in output:
+                        print(f"[x] {label}, {name}: main.py failed.")
+                        print(output)
+                        failed = True
+                    elif not compare_outputs(
+                        source,
+                        os.path.join(work, "outputs")
+                    ):
+                        print(f"[x] {label}, {name}: the files extracted " + \
+                              "differ from the ones archived.")
+                        failed = True
+                    else:
+                        print(f"[*] {label}, {name}: identical.")
+                    shutil.rmtree(work)
+        finally:
+            server.terminate()
+
+    if failed:
+        exit(-1)
+    print("[+] The files extracted are identical for every writer.")
@@ -0,0 +1,185 @@
+# Checks the support of ZIP64 end to end. A sparse archive like the one of
+# help/server/make_zip64.py (a stored member of zeros larger than 4 GiB,
+# members located after 4 GiB and more than 65535 entries) is served by the lab
+# server. The index built by the tool must hold the 64-bit sizes and offsets
+# read by Python's zipfile, and the files fetched by main.py must be identical
+# to the ones archived: the members around the large one, and the last bytes
+# of the large one (--read-range), or all of it with --full.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from suite import wait_for_server
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "help", "server"))
+
+from lib.bootstrap import bootstrap
+from lib.central_directory_index import CentralDirectoryParser
+from make_zip64 import Zip64Writer, get_zeros_crc32
+
+
+def build_archive(path, size, entries):
+    writer = Zip64Writer(path)
+    writer.add_file("before.txt", b"Before the sparse member.\n" * 100)
+    writer.add("zeros.bin", 0, get_zeros_crc32(size), size, size)
+    writer.add_file("after.txt", b"After the sparse member.\n" * 100)
+    for i in range(entries):
+        writer.add_file(f"entries/{i:06d}.txt", f"Entry {i}.\n".encode())
+    writer.close()
+
+
+def check_index(url, path):
+    # Returns the errors found comparing the index built from url with the
+    # central directory of path read by zipfile.
+    metadata = bootstrap(url, 65536)
+    central_directory_parser = CentralDirectoryParser()
+    for datas in metadata.iter_central_directory():
+        central_directory_parser.feed(datas)
+    index = central_directory_parser.Index
+
+    errors = []
+    with zipfile.ZipFile(path) as z:
+        infos = z.infolist()
+    if max(info.file_size for info in infos) < 0xffffffff or \
+        max(info.header_offset for info in infos) < 0xffffffff:
+        errors.append("no size or offset larger than 32 bits")
+    if len(index) != len(infos):
+        errors.append(f"{len(index)} entries instead of {len(infos)}")
+    for i, info in enumerate(infos[:len(index)]):
+        fields = (
+            (index.get_file_name(i), info.filename),
+            (index.UncompressedSizes[i], info.file_size),
+            (index.CompressedSizes[i], info.compress_size),
+            (index.LocalHeaderOffsets[i], info.header_offset),
+            (index.CRC32s[i], info.CRC),
+        )
+        if any(value != expected for value, expected in fields):
+            errors.append(f"entry {i} ({info.filename}) differs")
+            if len(errors) > 10:
+                break
+    return errors
+
+
+def fetch(url, directory, arguments):
+    # Runs main.py in directory and returns its output, or None if it failed.
+    p = subprocess.run(
+        [
+            sys.executable, os.path.join(ROOT, "main.py"), url,
+            "--no-cache", "--no-block-cache"
+        ] + arguments,
+        cwd=directory,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+    output = p.stdout.decode(errors="replace")
+    if p.returncode != 0 or "[x]" in output:
+        print(output)
+        return None
+    return output
+
+
+def is_zeros(path, size):
+    # Returns True if path holds size zeros.
+    if os.path.getsize(path) != size:
+        return False
+    with open(path, "rb") as f:
+        while True:
+            datas = f.read(16 * 1024 * 1024)
+            if not datas:
+                return True
+            if datas.count(0) != len(datas):
+                return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", action="store", default=4608 * 1024 * 1024,
+                        type=int, help="Size of the sparse member of zeros")
+    parser.add_argument("--entries", action="store", default=70000, type=int,
+                        help="Number of small members after the sparse one")
+    parser.add_argument("--full", action="store_true",
+                        help="Also download the whole sparse member")
+    parser.add_argument("--port", action="store", default=8129, type=int,
+                        help="Port of the lab server")
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "zip64.zip")
+        print(f"[*] Building a sparse ZIP64 archive ({args.size} bytes " + \
+              f"member, {args.entries + 3} entries).")
+        build_archive(path, args.size, args.entries)
+
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "help", "server", "main.py"),
+                str(args.port), "--bind", "127.0.0.1"
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        failed = False
+        try:
+            wait_for_server(args.port)
+            url = f"http://127.0.0.1:{args.port}/zip64.zip"
+
+            errors = check_index(url, path)
+            for error in errors:
+                print(f"[x] Index: {error}.")
+            failed = failed or bool(errors)
+            if not errors:
+                print("[*] Index: 64-bit sizes and offsets match zipfile.")
+
+            work = os.path.join(directory, "work")
+            os.makedirs(work)
+            output = os.path.join(work, "outputs")
+            last = f"entries/{args.entries - 1:06d}.txt"
+            names = ["before.txt", "after.txt", last]
+            if fetch(url, work, ["--members"] + names) is None:
+                print("[x] The members around the large one can't be fetched.")
+                failed = True
+            else:
+                differ = []
+                with zipfile.ZipFile(path) as z:
+                    for name in names:
+                        with open(os.path.join(output, name), "rb") as f:
+                            if f.read() != z.read(name):
+                                differ.append(name)
+                for name in differ:
+                    print(f"[x] {name} differs.")
+                failed = failed or bool(differ)
+                if not differ:
+                    print(f"[*] {', '.join(names)}: fetched.")
+
+            start = max(args.size - 1024 * 1024, 0)
+            end = args.size - 1
+            range_path = os.path.join(output, f"zeros.bin.{start}-{end}")
+            if fetch(
+                url,
+                work,
+                ["--members", "zeros.bin", "--read-range", f"{start}-{end}"]
+            ) is None or not is_zeros(range_path, end - start + 1):
+                print(f"[x] Bytes {start} to {end} of zeros.bin differ.")
+                failed = True
+            else:
+                print(f"[*] zeros.bin, bytes {start} to {end}: fetched.")
+
+            if args.full:
+                if fetch(url, work, ["--members", "zeros.bin"]) is None or \
+                    not is_zeros(os.path.join(output, "zeros.bin"), args.size):
+                    print("[x] zeros.bin differs.")
+                    failed = True
+                else:
+                    print("[*] zeros.bin: fetched.")
+        finally:
+            server.terminate()
+
+    if failed:
+        exit(-1)
+    print("[+] The ZIP64 archive is read and fetched correctly.")
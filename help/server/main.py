@@ -1,54 +1,184 @@
 # Based on @danvk work.
 #     - https://github.com/danvk/RangeHTTPServer
 import argparse
+import email.utils
 import http.server as SimpleHTTPServer
+import json
 import os
 import re
+import threading
+import time
+import uuid
 
-from http.server import SimpleHTTPRequestHandler
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 
-BYTE_RANGE_RE = re.compile(r"bytes=(\d+)-(\d+)?$")
+BYTE_RANGE_RE = re.compile(r"(\d+)?-(\d+)?$")
 
+# Maximum number of bytes sent by a single os.sendfile call when the
+# bandwidth is not limited.
+SENDFILE_CHUNK = 64 * 1024 * 1024
 
-def copy_byte_range(infile, outfile, start=None, stop=None, bufsize=16*1024):
+
+class Throttle:
+    # Caps the number of bytes per second written on one connection.
+    def __init__(self, bandwidth):
+        self.Bandwidth = bandwidth
+        self.Begin = time.monotonic()
+        self.Sent = 0
+
+    def get_chunk_size(self):
+        # Bytes written at once, about 50ms worth when the bandwidth is capped.
+        if not self.Bandwidth:
+            return SENDFILE_CHUNK
+        return max(1, self.Bandwidth // 20)
+
+    def wait(self, size):
+        self.Sent += size
+        if not self.Bandwidth:
+            return
+        delay = self.Sent / self.Bandwidth - (time.monotonic() - self.Begin)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def copy_byte_range(infile, outfile, start=None, stop=None, bufsize=16*1024,
+                    throttle=None):
     if start is not None: infile.seek(start)
     while 1:
-        to_read = min(bufsize, stop + 1 - infile.tell() if stop else bufsize)
+        to_read = min(bufsize, stop + 1 - infile.tell() if stop is not None
+                      else bufsize)
+        if to_read <= 0:
+            break
         buf = infile.read(to_read)
         if not buf:
             break
         outfile.write(buf)
+        if throttle is not None:
+            throttle.wait(len(buf))
+
+
+def send_byte_range(infile, outfile, connection, start, stop, throttle):
+    # Sends the bytes start to stop (inclusive) of infile on the socket
+    # connection with os.sendfile, so that they are never copied in user
+    # space. Falls back to copy_byte_range where it is not available.
+    if not hasattr(os, "sendfile"):
+        return copy_byte_range(infile, outfile, start, stop,
+                               bufsize=64*1024, throttle=throttle)
+    offset = start
+    while offset <= stop:
+        size = min(stop + 1 - offset, throttle.get_chunk_size())
+        sent = os.sendfile(connection.fileno(), infile.fileno(), offset, size)
+        if sent == 0:
+            break
+        offset += sent
+        throttle.wait(sent)
 
 
 def parse_byte_range(byte_range):
     if byte_range.strip() == "":
         return None, None
 
-    m = BYTE_RANGE_RE.match(byte_range)
+    m = BYTE_RANGE_RE.match(byte_range.strip())
     if not m:
         raise ValueError("Invalid byte range %s" % byte_range)
 
     first, last = [x and int(x) for x in m.groups()]
+    if first is None and last is None:
+        raise ValueError("Invalid byte range %s" % byte_range)
+    # Suffix range (bytes=-N), resolved once the file size is known.
+    if first is None:
+        return None, last
     if last and last < first:
         raise ValueError("Invalid byte range %s" % byte_range)
     return first, last
 
 
+def parse_byte_ranges(header):
+    # Parses "bytes=<range>[,<range>...]" into a list of (first, last).
+    if not header.startswith("bytes="):
+        raise ValueError("Invalid byte range %s" % header)
+    return [parse_byte_range(r) for r in header[len("bytes="):].split(",")]
+
+
+def resolve_byte_range(byte_range, file_len):
+    # Returns the (first, last) bytes of the file, or None if the range is not
+    # satisfiable.
+    first, last = byte_range
+    if first is None:
+        first, last = max(0, file_len - last), None
+    if first >= file_len:
+        return None
+    if last is None or last >= file_len:
+        last = file_len - 1
+    return first, last
+
+
+def get_etag(fs):
+    # Strong validator changing with the modification time and the size.
+    return '"%x-%x"' % (fs.st_mtime_ns, fs.st_size)
+
+
+def parse_http_date(value):
+    # Returns the timestamp of an HTTP date, or None if it is invalid.
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
 class RangeRequestHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1, so that the connections are kept alive between requests.
+    # Nagle's algorithm is disabled, otherwise the body sent with sendfile
+    # waits for the acknowledgement of the headers (delayed by the client).
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    # Set from the command line: latency added to every request (seconds),
+    # bandwidth of each connection (bytes per second, 0 for unlimited),
+    # support of multi-range requests and file where one JSON line is
+    # appended per request.
+    latency = 0
+    bandwidth = 0
+    multirange = True
+    stats = None
+    stats_lock = threading.Lock()
+
+    def is_not_modified(self, etag, mtime):
+        # Conditional GET: If-None-Match takes precedence over
+        # If-Modified-Since.
+        if "If-None-Match" in self.headers:
+            tags = [t.strip() for t in self.headers["If-None-Match"].split(",")]
+            return "*" in tags or etag in tags
+        if "If-Modified-Since" in self.headers:
+            since = parse_http_date(self.headers["If-Modified-Since"])
+            return since is not None and int(mtime) <= since
+        return False
+
+    def is_range_valid(self, etag, mtime):
+        # The Range header is ignored when If-Range does not match the
+        # current version of the file.
+        if "If-Range" not in self.headers:
+            return True
+        value = self.headers["If-Range"].strip()
+        if value.startswith('"') or value.startswith("W/"):
+            return value == etag
+        since = parse_http_date(value)
+        return since is not None and int(mtime) <= since
+
     def send_head(self):
-        if "Range" not in self.headers:
-            self.range = None
-            return SimpleHTTPRequestHandler.send_head(self)
-        try:
-            self.range = parse_byte_range(self.headers["Range"])
-        except ValueError as e:
-            self.send_error(400, "Invalid byte range")
-            return None
-        first, last = self.range
+        if self.latency:
+            time.sleep(self.latency)
+        self.throttle = Throttle(self.bandwidth)
+        self.range = None
+        self.parts = None
 
         path = self.translate_path(self.path)
-        f = None
+        if os.path.isdir(path) or path.endswith("/"):
+            # Redirection or directory listing.
+            return SimpleHTTPRequestHandler.send_head(self)
+
         ctype = self.guess_type(path)
         try:
             f = open(path, "rb")
@@ -56,41 +186,176 @@ class RangeRequestHandler(SimpleHTTPRequestHandler):
             self.send_error(404, "File not found")
             return None
 
-        fs = os.fstat(f.fileno())
-        file_len = fs[6]
-        if first >= file_len:
-            self.send_error(416, "Requested Range Not Satisfiable")
-            return None
+        try:
+            fs = os.fstat(f.fileno())
+            file_len = fs.st_size
+            etag = get_etag(fs)
+            last_modified = self.date_time_string(fs.st_mtime)
 
-        self.send_response(206)
-        self.send_header("Content-type", ctype)
+            if self.is_not_modified(etag, fs.st_mtime):
+                f.close()
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                return None
 
-        if last is None or last >= file_len:
-            last = file_len - 1
-        response_length = last - first + 1
+            ranges = None
+            if "Range" in self.headers and self.is_range_valid(
+                etag,
+                fs.st_mtime
+            ):
+                try:
+                    ranges = parse_byte_ranges(self.headers["Range"])
+                except ValueError as e:
+                    f.close()
+                    self.send_error(400, "Invalid byte range")
+                    return None
+                if len(ranges) > 1 and not self.multirange:
+                    f.close()
+                    self.send_error(400, "Multiple byte ranges not supported")
+                    return None
+                ranges = [
+                    resolved for resolved in (
+                        resolve_byte_range(r, file_len) for r in ranges
+                    ) if resolved is not None
+                ]
+                if not ranges:
+                    f.close()
+                    self.send_response(
+                        HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+                    )
+                    self.send_header("Content-Range", "bytes */%s" % file_len)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return None
 
-        self.send_header("Content-Range",
-                         "bytes %s-%s/%s" % (first, last, file_len))
-        self.send_header("Content-Length", str(response_length))
-        self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
-        self.end_headers()
-        return f
+            if ranges is None:
+                self.send_response(200)
+                self.send_header("Content-type", ctype)
+                if file_len:
+                    self.range = 0, file_len - 1
+                response_length = file_len
+            elif len(ranges) == 1:
+                self.send_response(206)
+                first, last = ranges[0]
+                self.range = first, last
+                self.send_header("Content-type", ctype)
+                self.send_header("Content-Range",
+                                 "bytes %s-%s/%s" % (first, last, file_len))
+                response_length = last - first + 1
+            else:
+                # multipart/byteranges: each part has its own Content-Range.
+                self.send_response(206)
+                boundary = uuid.uuid4().hex
+                self.parts = []
+                response_length = 0
+                for first, last in ranges:
+                    headers = ("--%s\r\nContent-Type: %s\r\n"
+                               "Content-Range: bytes %s-%s/%s\r\n\r\n" %
+                               (boundary, ctype, first, last, file_len)
+                               ).encode()
+                    self.parts.append((headers, first, last))
+                    response_length += len(headers) + last - first + 1 + 2
+                self.closing = ("--%s--\r\n" % boundary).encode()
+                response_length += len(self.closing)
+                self.send_header("Content-type",
+                                 "multipart/byteranges; boundary=%s" % boundary)
+            self.send_header("Content-Length", str(response_length))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
 
     def end_headers(self):
         self.send_header("Accept-Ranges", "bytes")
         return SimpleHTTPRequestHandler.end_headers(self)
 
+    def write(self, datas):
+        self.wfile.write(datas)
+        self.throttle.wait(len(datas))
+
     def copyfile(self, source, outputfile):
+        if self.parts is not None:
+            for headers, first, last in self.parts:
+                self.write(headers)
+                send_byte_range(source, outputfile, self.connection, first,
+                                last, self.throttle)
+                self.write(b"\r\n")
+            self.write(self.closing)
+            return
+
         if not self.range:
-            return SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
+            # Directory listing (or empty file).
+            return copy_byte_range(source, outputfile, throttle=self.throttle)
 
         start, stop = self.range
-        copy_byte_range(source, outputfile, start, stop)
+        send_byte_range(source, outputfile, self.connection, start, stop,
+                        self.throttle)
+
+    def send_response(self, code, message=None):
+        self.status = code
+        return SimpleHTTPRequestHandler.send_response(self, code, message)
+
+    def do_GET(self):
+        self.throttle = None
+        SimpleHTTPRequestHandler.do_GET(self)
+        self.write_stats()
+
+    def write_stats(self):
+        if self.stats is None:
+            return
+        line = json.dumps({
+            "time": time.time(),
+            "path": self.path,
+            "range": self.headers.get("Range"),
+            "status": getattr(self, "status", None),
+            "bytes": self.throttle.Sent if self.throttle else 0,
+        })
+        with self.stats_lock:
+            with open(self.stats, "a") as f:
+                f.write(line + "\n")
+
+class LabServer(ThreadingHTTPServer):
+    # Larger listen backlog than the default (5), whose overflow delays the
+    # connections opened at once by concurrent clients by a SYN retransmit.
+    request_queue_size = 128
+
 
 parser = argparse.ArgumentParser()
 parser.add_argument("port", action="store",
                     default=8000, type=int,
                     nargs="?", help="Specify alternate port [default: 8000]")
+parser.add_argument("--bind", action="store",
+                    default=None, type=str,
+                    help="Address to listen on [default: all interfaces]")
+parser.add_argument("--latency", action="store",
+                    default=0, type=float,
+                    help="Delay added to every request, in milliseconds")
+parser.add_argument("--bandwidth", action="store",
+                    default=0, type=int,
+                    help="Bytes per second sent on each connection " + \
+                         "[default: unlimited]")
+parser.add_argument("--no-multirange", action="store_true",
+                    help="Reject multi-range requests, like servers " + \
+                         "without multipart/byteranges support")
+parser.add_argument("--stats", action="store",
+                    default=None, type=str,
+                    help="File where one JSON line is appended per request")
 
 args = parser.parse_args()
-SimpleHTTPServer.test(HandlerClass=RangeRequestHandler, port=args.port)
+RangeRequestHandler.latency = args.latency / 1000
+RangeRequestHandler.bandwidth = args.bandwidth
+RangeRequestHandler.multirange = not args.no_multirange
+RangeRequestHandler.stats = args.stats
+# Each connection is handled by its own thread.
+SimpleHTTPServer.test(
+    HandlerClass=RangeRequestHandler,
+    ServerClass=LabServer,
+    protocol="HTTP/1.1",
+    port=args.port,
+    bind=args.bind
+)
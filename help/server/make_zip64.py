@@ -0,0 +1,126 @@
+# Generates a ZIP64 archive for the lab: a stored member of zeros larger than
+# 4 GiB, written as a hole so that the file is sparse, members located after
+# 4 GiB and more than 65535 entries. The archive can be served by main.py.
+import argparse
+import struct
+import time
+import zlib
+
+
+ZERO_CHUNK = bytes(16 * 1024 * 1024)
+
+
+def get_dos_datetime():
+    t = time.localtime()
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    dos_date = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    return dos_time, dos_date
+
+
+def get_zeros_crc32(size):
+    crc32 = 0
+    while size > 0:
+        crc32 = zlib.crc32(ZERO_CHUNK[:min(size, len(ZERO_CHUNK))], crc32)
+        size -= len(ZERO_CHUNK)
+    return crc32
+
+
+def get_zip64_extra_field(*values):
+    # ZIP64 extended information extra field holding values (8 bytes each).
+    if not values:
+        return b""
+    return struct.pack(f"<2H{len(values)}Q", 0x0001, 8 * len(values), *values)
+
+
+class Zip64Writer:
+    def __init__(self, path):
+        self.File = open(path, "wb")
+        self.Headers = []
+        self.DosTime, self.DosDate = get_dos_datetime()
+
+    def add(self, name, method, crc32, compressed_size, uncompressed_size,
+            datas=None):
+        # Writes the local file header of a member and its data (a hole if
+        # datas is None), and keeps its central directory file header.
+        name = name.encode()
+        offset = self.File.tell()
+        large = compressed_size >= 0xffffffff or uncompressed_size >= 0xffffffff
+        local_extra = get_zip64_extra_field(
+            uncompressed_size, compressed_size
+        ) if large else b""
+        self.File.write(struct.pack(
+            "<4s5H3I2H", b"\x50\x4b\x03\x04", 45 if large else 20, 0, method,
+            self.DosTime, self.DosDate, crc32,
+            0xffffffff if large else compressed_size,
+            0xffffffff if large else uncompressed_size,
+            len(name), len(local_extra)
+        ))
+        self.File.write(name + local_extra)
+        if datas is None:
+            self.File.seek(compressed_size, 1)
+        else:
+            self.File.write(datas)
+
+        values = []
+        fields = []
+        for value in (uncompressed_size, compressed_size, offset):
+            if value >= 0xffffffff:
+                values.append(value)
+                fields.append(0xffffffff)
+            else:
+                fields.append(value)
+        extra = get_zip64_extra_field(*values)
+        self.Headers.append(struct.pack(
+            "<4s6H3I5H2I", b"\x50\x4b\x01\x02", 0x032d, 45 if values else 20,
+            0, method, self.DosTime, self.DosDate, crc32, fields[1], fields[0],
+            len(name), len(extra), 0, 0, 0, 0o100644 << 16, fields[2]
+        ) + name + extra)
+
+    def add_file(self, name, datas):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        compressed = compressor.compress(datas) + compressor.flush()
+        self.add(name, 8, zlib.crc32(datas), len(compressed), len(datas),
+                 compressed)
+
+    def close(self):
+        # Writes the central directory, the ZIP64 end of central directory
+        # record and locator, and the end of central directory record.
+        cd_start = self.File.tell()
+        for header in self.Headers:
+            self.File.write(header)
+        cd_size = self.File.tell() - cd_start
+        record_start = self.File.tell()
+        entries = len(self.Headers)
+        self.File.write(struct.pack(
+            "<4sQ2H2I4Q", b"\x50\x4b\x06\x06", 44, 0x032d, 45, 0, 0,
+            entries, entries, cd_size, cd_start
+        ))
+        self.File.write(struct.pack(
+            "<4sIQI", b"\x50\x4b\x06\x07", 0, record_start, 1
+        ))
+        self.File.write(struct.pack(
+            "<4s4H2IH", b"\x50\x4b\x05\x06", 0, 0,
+            min(entries, 0xffff), min(entries, 0xffff),
+            min(cd_size, 0xffffffff), min(cd_start, 0xffffffff), 0
+        ))
+        self.File.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", action="store", type=str,
+                        help="Path of the archive to generate")
+    parser.add_argument("--size", action="store", default=4608 * 1024 * 1024,
+                        type=int, help="Size of the sparse member of zeros")
+    parser.add_argument("--entries", action="store", default=70000, type=int,
+                        help="Number of small members after the sparse one")
+
+    args = parser.parse_args()
+    writer = Zip64Writer(args.path)
+    writer.add_file("before.txt", b"Before the sparse member.\n" * 100)
+    writer.add("zeros.bin", 0, get_zeros_crc32(args.size), args.size,
+               args.size)
+    writer.add_file("after.txt", b"After the sparse member.\n" * 100)
+    for i in range(args.entries):
+        writer.add_file(f"entries/{i:06d}.txt", f"Entry {i}.\n".encode())
+    writer.close()
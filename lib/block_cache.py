@@ -0,0 +1,636 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from email.message import Message
+
+import lib.constants as LC
+
+from lib.bootstrap import CONTENT_RANGE_RE, get_validator
+
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def get_validator_from_if_range(value):
+    # Returns the validator ("<name>: <value>") sent in an If-Range header.
+    if value.startswith('"') or value.startswith("W/"):
+        return f"ETag: {value}"
+    return f"Last-Modified: {value}"
+
+
+class BlockRecord:
+    """
+    Blocks of one version of one ZIP (identified by its URL and validator)
+    stored in the cache. The blocks are written at their offset in a sparse
+    data file, <path>.blocks, so that only the cached blocks use disk space.
+    The list of the cached blocks is kept in <path>.json, saved when the
+    record is closed. A block is only marked as cached once it has been
+    entirely written.
+    """
+
+    def __init__(self, path, url, validator, zip_size, block_size, blocks=()):
+        self.Path = path
+        self.Url = url
+        self.Validator = validator
+        self.ZipSize = zip_size
+        self.BlockSize = block_size
+        self.Blocks = set(blocks)
+        self.Dirty = False
+        self.Descriptor = None
+        self.Lock = threading.Lock()
+
+    def get_descriptor(self):
+        with self.Lock:
+            if self.Descriptor is None:
+                self.Descriptor = os.open(
+                    self.Path + ".blocks",
+                    os.O_RDWR | os.O_CREAT,
+                    0o644
+                )
+            return self.Descriptor
+
+    def get_spans(self, start, end):
+        """
+        This function splits the bytes start to end (inclusive) into spans
+        (first block, last block, cached) of consecutive blocks which are all
+        cached or all missing.
+        """
+
+        spans = []
+        with self.Lock:
+            first = start // self.BlockSize
+            for block in range(first, end // self.BlockSize + 1):
+                cached = block in self.Blocks
+                if spans and spans[-1][2] == cached:
+                    spans[-1][1] = block
+                else:
+                    spans.append([block, block, cached])
+        return spans
+
+    def is_cached(self, start, end):
+        return all(cached for _, _, cached in self.get_spans(start, end))
+
+    def get_block_end(self, block):
+        # Returns the offset of the last byte of block.
+        return min((block + 1) * self.BlockSize, self.ZipSize) - 1
+
+    def read(self, start, end):
+        return os.pread(self.get_descriptor(), end - start + 1, start)
+
+    def write_block(self, block, datas):
+        os.pwrite(self.get_descriptor(), datas, block * self.BlockSize)
+        with self.Lock:
+            self.Blocks.add(block)
+            self.Dirty = True
+
+    def save(self):
+        # The blocks are saved as ranges of consecutive blocks.
+        ranges = []
+        with self.Lock:
+            for block in sorted(self.Blocks):
+                if ranges and ranges[-1][1] == block - 1:
+                    ranges[-1][1] = block
+                else:
+                    ranges.append([block, block])
+            self.Dirty = False
+        temporary_path = f"{self.Path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({
+                "url": self.Url,
+                "validator": self.Validator,
+                "zip_size": self.ZipSize,
+                "block_size": self.BlockSize,
+                "blocks": ranges,
+            }, f)
+        os.replace(temporary_path, self.Path + ".json")
+
+    def close(self):
+        if self.Dirty:
+            self.save()
+        with self.Lock:
+            if self.Descriptor is not None:
+                os.close(self.Descriptor)
+                self.Descriptor = None
+
+
+class BlockWriter:
+    """
+    Writes the bytes of a response starting at offset of the ZIP to record,
+    as they are received. Only the blocks entirely received are stored: the
+    bytes before the first block boundary are skipped.
+    """
+
+    def __init__(self, record, offset):
+        self.Record = record
+        self.Skip = -offset % record.BlockSize
+        # Offset of the first byte of Buffer, always a block boundary.
+        self.Offset = offset + self.Skip
+        self.Buffer = bytearray()
+
+    def write(self, datas):
+        if self.Skip:
+            skipped = min(self.Skip, len(datas))
+            datas = datas[skipped:]
+            self.Skip -= skipped
+        self.Buffer += datas
+        record = self.Record
+        while self.Offset < record.ZipSize:
+            block = self.Offset // record.BlockSize
+            length = record.get_block_end(block) + 1 - self.Offset
+            if len(self.Buffer) < length:
+                break
+            record.write_block(block, bytes(self.Buffer[:length]))
+            del self.Buffer[:length]
+            self.Offset += length
+
+
+class BlockCache:
+    """
+    On-disk cache of the bytes of the ZIPs, shared by the runs and by all the
+    range requests of the tool (see CachedSession). The ZIPs are cut into
+    fixed-size blocks aligned on multiples of block_size, stored by
+    BlockRecord under their URL and validator: when a ZIP changes, its new
+    version gets a new record and the blocks of the old one are removed, so
+    they are never served again. The least recently used versions are
+    evicted once the cache grows over max_size bytes (of disk space actually
+    used).
+    """
+
+    def __init__(
+        self,
+        directory=LC.BLOCK_CACHE_DIRECTORY,
+        max_size=LC.BLOCK_CACHE_SIZE,
+        block_size=LC.BLOCK_SIZE
+    ):
+        self.Directory = directory
+        self.MaxSize = max_size
+        self.BlockSize = block_size
+        # Records opened by this run, by (URL, validator), and the current
+        # version of each URL.
+        self.Records = {}
+        self.Current = {}
+        self.Lock = threading.Lock()
+
+        self.BlocksHit = 0
+        self.BlocksMissed = 0
+        self.BytesHit = 0
+        self.BytesFetched = 0
+
+    def get_prefix(self, url):
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def get_path(self, url, validator):
+        return os.path.join(
+            self.Directory,
+            self.get_prefix(url) + "-" + \
+                hashlib.sha256(validator.encode()).hexdigest()[:16]
+        )
+
+    def load(self, path):
+        # Returns the record saved at path, or None.
+        try:
+            with open(path + ".json") as f:
+                saved = json.load(f)
+            if saved["block_size"] != self.BlockSize:
+                return None
+            record = BlockRecord(
+                path,
+                saved["url"],
+                saved["validator"],
+                saved["zip_size"],
+                self.BlockSize,
+                (
+                    block
+                    for first, last in saved["blocks"]
+                    for block in range(first, last + 1)
+                )
+            )
+            # The modification time keeps track of the last use (LRU).
+            os.utime(path + ".json")
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return record
+
+    def find(self, url, validator):
+        """
+        This function returns the record of the version validator of url, or
+        None if none of its blocks is cached.
+        """
+
+        with self.Lock:
+            record = self.Records.get((url, validator))
+            if record is not None:
+                return record
+            record = self.load(self.get_path(url, validator))
+            if record is None or record.Url != url or \
+                record.Validator != validator:
+                return None
+            self.Records[url, validator] = record
+            self.Current.setdefault(url, record)
+            return record
+
+    def get(self, url, validator, zip_size):
+        """
+        This function returns the record of the version validator of url,
+        creating it if needed. The records of the other versions of url are
+        invalidated.
+        """
+
+        record = self.find(url, validator)
+        if record is not None and record.ZipSize != zip_size:
+            self.invalidate(url)
+            record = None
+        with self.Lock:
+            if record is None:
+                os.makedirs(self.Directory, exist_ok=True)
+                record = BlockRecord(
+                    self.get_path(url, validator),
+                    url,
+                    validator,
+                    zip_size,
+                    self.BlockSize
+                )
+                record.Dirty = True
+                self.Records[url, validator] = record
+            current = self.Current.get(url)
+            self.Current[url] = record
+        if current is not record:
+            self.invalidate(url, record)
+        return record
+
+    def get_current(self, url):
+        # Returns the record of the last version of url seen, or None.
+        with self.Lock:
+            if url in self.Current:
+                return self.Current[url]
+        prefix = self.get_prefix(url) + "-"
+        candidates = []
+        for path, _, last_use in self.get_entries():
+            if os.path.basename(path).startswith(prefix):
+                candidates.append((last_use, path))
+        for _, path in sorted(candidates, reverse=True):
+            record = self.load(path)
+            if record is not None and record.Url == url:
+                return self.find(url, record.Validator)
+        return None
+
+    def invalidate(self, url, keep=None):
+        # Removes the records of url, except keep.
+        with self.Lock:
+            for key, record in list(self.Records.items()):
+                if record.Url == url and record is not keep:
+                    record.Dirty = False
+                    record.close()
+                    del self.Records[key]
+            if self.Current.get(url) is not keep:
+                self.Current.pop(url, None)
+        prefix = self.get_prefix(url) + "-"
+        keep_path = keep.Path if keep is not None else None
+        for path, _, _ in self.get_entries():
+            if os.path.basename(path).startswith(prefix) and path != keep_path:
+                remove(path)
+
+    def count(self, blocks_hit, bytes_hit, blocks_missed, bytes_fetched):
+        with self.Lock:
+            self.BlocksHit += blocks_hit
+            self.BytesHit += bytes_hit
+            self.BlocksMissed += blocks_missed
+            self.BytesFetched += bytes_fetched
+
+    def get_hit_rate(self):
+        blocks = self.BlocksHit + self.BlocksMissed
+        return self.BlocksHit / blocks if blocks else 0
+
+    def get_entries(self):
+        """
+        This function returns (path, size, last use) for every record saved
+        in the cache, from the most to the least recently used. The size is
+        the disk space used by its blocks.
+        """
+
+        entries = []
+        if not os.path.isdir(self.Directory):
+            return entries
+        for name in os.listdir(self.Directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.Directory, name[:-len(".json")])
+            try:
+                last_use = os.stat(path + ".json").st_mtime
+                size = os.stat(path + ".blocks").st_blocks * 512
+            except OSError:
+                size = 0
+            entries.append((path, size, last_use))
+        entries.sort(key=lambda entry: entry[2], reverse=True)
+        return entries
+
+    def prune(self, max_size=None):
+        """
+        This function removes the least recently used records until the
+        cache uses at most max_size bytes (defaults to the cache budget).
+        Returns the number of records removed.
+        """
+
+        if max_size is None:
+            max_size = self.MaxSize
+        removed = 0
+        total = 0
+        for path, size, _ in self.get_entries():
+            total += size
+            if total > max_size:
+                remove(path)
+                removed += 1
+        return removed
+
+    def close(self):
+        # Saves the records opened by this run, then enforces the budget.
+        with self.Lock:
+            records = list(self.Records.values())
+            self.Records = {}
+            self.Current = {}
+        for record in records:
+            record.close()
+        self.prune()
+
+    def print_statistics(self):
+        blocks = self.BlocksHit + self.BlocksMissed
+        if not blocks:
+            return
+        print(f"[*] Block cache: {self.BlocksHit}/{blocks} block(s) hit " + \
+              f"({self.get_hit_rate() * 100:.1f}%), {self.BytesHit} " + \
+              f"byte(s) served from the cache, {self.BytesFetched} " + \
+              "byte(s) fetched."
+        )
+
+
+def remove(path):
+    for suffix in (".json", ".blocks"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+class StoringResponse:
+    """
+    Response of the underlying session whose bytes are written to the cache
+    (by writer) as they are read. The other attributes are the ones of the
+    response.
+    """
+
+    def __init__(self, response, writer):
+        self.Response = response
+        self.Writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.Response, name)
+
+    @property
+    def content(self):
+        return self.Response.content
+
+    def iter_content(self, chunk_size=LC.CHUNK_SIZE):
+        for datas in self.Response.iter_content(chunk_size):
+            self.Writer.write(datas)
+            yield datas
+
+    def close(self):
+        self.Response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class CachedResponse:
+    """
+    Response (206) to a request for the bytes start to end of record, built
+    from the cached blocks and, for the missing ones, from requests sent
+    while the body is read (the blocks received are stored as they are
+    received). Requests is the number of requests sent,
+    CachedBytes the number of bytes of the body served from the cache and
+    NetworkBytes the number of bytes received by the requests.
+    """
+
+    def __init__(self, session, record, start, end, request_headers,
+                 requests=0):
+        self.Session = session
+        self.Record = record
+        self.Start = start
+        self.End = end
+        self.RequestHeaders = request_headers
+        self.NewConnection = False
+        self.Requests = requests
+        self.CachedBytes = 0
+        self.NetworkBytes = 0
+        self.Content = None
+        self.Inner = None
+
+        self.status_code = 206
+        self.headers = Message()
+        self.headers["Content-Range"] = \
+            f"bytes {start}-{end}/{record.ZipSize}"
+        self.headers["Content-Length"] = str(end - start + 1)
+        name, value = record.Validator.split(": ", 1)
+        self.headers[name] = value
+
+    @property
+    def content(self):
+        if self.Content is None:
+            self.Content = b"".join(self.iter_content())
+        return self.Content
+
+    def fetch(self, start, end):
+        # Yields the bytes start to end of the ZIP, from the server.
+        record = self.Record
+        self.Requests += 1
+        self.Inner = self.Session.Session.get(
+            record.Url,
+            {
+                "Range": f"bytes={start}-{end}",
+                "If-Range": record.Validator.split(": ", 1)[1],
+            },
+            stream=True
+        )
+        with self.Inner as r:
+            self.NewConnection |= bool(getattr(r, "NewConnection", False))
+            if r.status_code == 200:
+                self.Session.Cache.invalidate(record.Url)
+                raise Exception(
+                    "[x] The ZIP changed since its index was built."
+                )
+            if r.status_code != 206:
+                raise Exception(
+                    f"[x] Unexpected HTTP status code: {r.status_code}."
+                )
+            writer = BlockWriter(record, start)
+            for datas in r.iter_content(LC.CHUNK_SIZE):
+                writer.write(datas)
+                yield datas
+        self.Inner = None
+
+    def iter_content(self, chunk_size=LC.CHUNK_SIZE):
+        record = self.Record
+        for first, last, cached in record.get_spans(self.Start, self.End):
+            # Bytes of the span requested, as offsets in the ZIP.
+            start = max(first * record.BlockSize, self.Start)
+            end = min(record.get_block_end(last), self.End)
+            if cached:
+                self.Session.Cache.count(
+                    last - first + 1,
+                    end - start + 1,
+                    0,
+                    0
+                )
+                for offset in range(start, end + 1, chunk_size):
+                    datas = record.read(
+                        offset,
+                        min(offset + chunk_size, end + 1) - 1
+                    )
+                    self.CachedBytes += len(datas)
+                    yield datas
+                continue
+            # The missing blocks are requested entirely, so that they can be
+            # stored, unless it more than doubles the bytes received (small
+            # members far apart): only the requested bytes are fetched then,
+            # and only the blocks they cover entirely are stored.
+            fetch_start = first * record.BlockSize
+            fetch_end = record.get_block_end(last)
+            if fetch_end - fetch_start + 1 > 2 * (end - start + 1):
+                fetch_start, fetch_end = start, end
+            # Offset of the next byte received.
+            offset = fetch_start
+            fetched = 0
+            try:
+                for datas in self.fetch(fetch_start, fetch_end):
+                    received = offset
+                    offset += len(datas)
+                    fetched += len(datas)
+                    self.NetworkBytes += len(datas)
+                    # Only the requested bytes are passed on.
+                    datas = datas[
+                        max(start - received, 0):max(end + 1 - received, 0)
+                    ]
+                    if datas:
+                        yield datas
+            finally:
+                self.Session.Cache.count(0, 0, last - first + 1, fetched)
+
+    def close(self):
+        if self.Inner is not None:
+            self.Inner.close()
+            self.Inner = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class CachedSession:
+    """
+    Session of the selected transport whose single range requests go
+    through cache:
+        - a request carrying If-Range (the validator of the ZIP the tool
+          works on) is split into cached and missing spans of blocks, and
+          only the missing ones are requested, aligned on the blocks when
+          it does not more than double their size;
+        - a suffix range (the first request of the bootstrap) of a ZIP whose
+          end is cached is sent as a conditional request, and served from
+          the cache if the server answers 304;
+        - the other 206 responses are stored as they are read, and make the
+          blocks of the other versions of the ZIP invalid if its validator
+          changed.
+    Multi-range requests, requests without a validator and ranges larger
+    than LC.BLOCK_CACHE_MAX_RANGE bytes bypass the cache.
+    """
+
+    def __init__(self, session, cache):
+        self.Session = session
+        self.Cache = cache
+
+    def get(self, url, headers=None, stream=False):
+        headers = dict(headers or {})
+        m = RANGE_RE.fullmatch(headers.get("Range", ""))
+        if m is None or "If-None-Match" in headers or \
+            "If-Modified-Since" in headers:
+            return self.Session.get(url, headers, stream)
+        first, last = m.groups()
+        if not first and last:
+            return self.get_suffix(url, headers, int(last), stream)
+        if first and last and "If-Range" in headers and \
+            int(last) - int(first) < LC.BLOCK_CACHE_MAX_RANGE:
+            record = self.Cache.find(
+                url,
+                get_validator_from_if_range(headers["If-Range"])
+            )
+            if record is not None and int(first) < record.ZipSize:
+                return CachedResponse(
+                    self,
+                    record,
+                    int(first),
+                    min(int(last), record.ZipSize - 1),
+                    headers
+                )
+        return self.store(url, self.Session.get(url, headers, stream), stream)
+
+    def get_suffix(self, url, headers, length, stream):
+        record = self.Cache.get_current(url)
+        if record is not None and record.ZipSize:
+            start = max(record.ZipSize - length, 0)
+            end = record.ZipSize - 1
+            if record.is_cached(start, end):
+                conditional = dict(headers)
+                name, value = record.Validator.split(": ", 1)
+                if name == "ETag":
+                    conditional["If-None-Match"] = value
+                else:
+                    conditional["If-Modified-Since"] = value
+                r = self.Session.get(url, conditional, stream)
+                if r.status_code == 304:
+                    r.close()
+                    response = CachedResponse(
+                        self,
+                        record,
+                        start,
+                        end,
+                        headers,
+                        requests=1
+                    )
+                    response.NewConnection = \
+                        bool(getattr(r, "NewConnection", False))
+                    return response
+                return self.store(url, r, stream)
+        return self.store(url, self.Session.get(url, headers, stream), stream)
+
+    def store(self, url, r, stream):
+        # Stores the bytes of the 206 response r while they are read.
+        if r.status_code != 206:
+            return r
+        validator = get_validator(r.headers)
+        m = CONTENT_RANGE_RE.match(r.headers.get("Content-Range", ""))
+        if not validator or m is None:
+            return r
+        start, end, zip_size = (int(group) for group in m.groups())
+        if end - start >= LC.BLOCK_CACHE_MAX_RANGE:
+            return r
+        record = self.Cache.get(url, validator, zip_size)
+        writer = BlockWriter(record, start)
+        self.Cache.count(
+            0,
+            0,
+            end // record.BlockSize - start // record.BlockSize + 1,
+            end - start + 1
+        )
+        if not stream:
+            writer.write(r.content)
+            return r
+        return StoringResponse(r, writer)
@@ -0,0 +1,311 @@
+import re
+import time
+
+import lib.constants as LC
+import lib.transport as transport
+
+from lib.end_of_central_directory_record import EndOfCentralDirectoryRecord
+from lib.tracer import TRACER
+from lib.zip64_end_of_central_directory_record import (
+    Zip64EndOfCentralDirectoryLocator,
+    Zip64EndOfCentralDirectoryRecord
+)
+
+
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class Bootstrap:
+    """
+    Result of the metadata fetch: the size of the ZIP, its end of central
+    directory record, the raw central directory and the number of HTTP round
+    trips needed to get them. When the central directory does not fit in the
+    first window, only its end (Tail) is known and the range of its beginning
+    (HeadRange) is downloaded when the central directory is read.
+    """
+
+    def __init__(
+        self,
+        url,
+        zip_size,
+        validator,
+        eocdr,
+        tail,
+        head_range,
+        round_trips
+    ):
+        self.Url = url
+        self.ZipSize = zip_size
+        self.Validator = validator
+        self.EndOfCentralDirectoryRecord = eocdr
+        self.Tail = tail
+        self.HeadRange = head_range
+        self.RoundTrips = round_trips
+        self.Datas = None
+
+    def iter_central_directory(self):
+        """
+        This function yields the central directory chunk by chunk, streaming
+        its beginning from the server if needed. Closing the generator early
+        stops the download.
+        """
+
+        if self.Datas is not None:
+            yield self.Datas
+            return
+
+        if self.HeadRange is not None:
+            start, end = self.HeadRange
+            headers = get_range_headers(f"{start}-{end}", self.Validator)
+            self.RoundTrips += 1
+            begin = time.perf_counter()
+            received = 0
+            with transport.get(
+                url=self.Url,
+                headers=headers,
+                stream=True
+            ) as r:
+                if r.status_code != 206:
+                    print(f"[x] Unexpected HTTP status code: {r.status_code}.")
+                    exit(-1)
+                try:
+                    for datas in r.iter_content(LC.CHUNK_SIZE):
+                        received += len(datas)
+                        yield datas
+                finally:
+                    # Also recorded when the download is stopped early.
+                    TRACER.count_request(
+                        r,
+                        begin,
+                        end - start + 1,
+                        received
+                    )
+        yield self.Tail
+
+    @property
+    def CentralDirectory(self):
+        # The whole central directory, downloaded the first time it is read.
+        if self.Datas is None:
+            self.Datas = b"".join(self.iter_central_directory())
+        return self.Datas
+
+
+def fetch_range(url, range_header, length):
+    """
+    This function downloads the range of the ZIP described by range_header
+    (length bytes) and returns the offset of the first byte received, the
+    total size of the ZIP (taken from Content-Range), its validator and the
+    bytes themselves.
+    """
+
+    headers = {
+        "Range": range_header
+    }
+    begin = time.perf_counter()
+    r = transport.get(url=url, headers=headers)
+    TRACER.count_request(r, begin, length, len(r.content))
+    return parse_range_response(r)
+
+
+def get_validator(headers):
+    """
+    This function returns the header identifying the current version of the
+    ZIP, as "<name>: <value>". ETag is preferred over Last-Modified. An empty
+    string is returned when the server sends none of them.
+    """
+
+    for name in ("ETag", "Last-Modified"):
+        if name in headers:
+            return f"{name}: {headers[name]}"
+    return ""
+
+
+def get_range_headers(ranges, validator):
+    """
+    This function returns the headers of a request for ranges ("<start>-<end>"
+    or several of them separated by commas) of the version of the ZIP
+    identified by validator. With If-Range, the server answers 200 with the
+    whole new version instead if the ZIP changed.
+    """
+
+    headers = {
+        "Range": f"bytes={ranges}"
+    }
+    if validator:
+        headers["If-Range"] = validator.split(": ", 1)[1]
+    return headers
+
+
+def parse_range_response(r):
+    datas = r.content
+    validator = get_validator(r.headers)
+    if r.status_code == 200:
+        # The server ignored the range and sent the whole ZIP.
+        return 0, len(datas), validator, datas
+    if r.status_code != 206:
+        print(f"[x] Unexpected HTTP status code: {r.status_code}.")
+        exit(-1)
+
+    content_range = r.headers.get("Content-Range", "")
+    m = CONTENT_RANGE_RE.match(content_range)
+    if not m:
+        print("[x] Can't find Content-Range HTTP header.")
+        exit(-1)
+    return int(m.group(1)), int(m.group(3)), validator, datas
+
+
+def revalidate(url, zip_size, validator):
+    """
+    This function checks with a conditional request for the last byte of the
+    ZIP that it did not change since validator was received. The ZIP is
+    considered unchanged if the server answers 304, or if it sends the same
+    size and validator.
+    """
+
+    headers = {
+        "Range": "bytes=-1"
+    }
+    if validator:
+        name, value = validator.split(": ", 1)
+        if name == "ETag":
+            headers["If-None-Match"] = value
+        else:
+            headers["If-Modified-Since"] = value
+    begin = time.perf_counter()
+    with transport.get(url=url, headers=headers, stream=True) as r:
+        TRACER.count_request(r, begin, 1, 0)
+        if r.status_code == 304:
+            return True
+        if r.status_code == 206:
+            m = CONTENT_RANGE_RE.match(r.headers.get("Content-Range", ""))
+            current_zip_size = int(m.group(3)) if m else -1
+        elif r.status_code == 200:
+            # The body (the whole ZIP) is never read.
+            current_zip_size = int(r.headers.get("Content-Length", -1))
+        else:
+            return False
+        current_validator = get_validator(r.headers)
+
+    return current_zip_size == zip_size and current_validator == validator
+
+
+def find_end_of_central_directory_record(datas):
+    """
+    This function looks for the end of central directory record in datas,
+    which must be the end of the ZIP. As the signature may also appear inside
+    the comment, we keep the last candidate whose comment ends exactly at the
+    end of the ZIP. Returns -1 if there is none.
+    """
+
+    signature = LC.END_OF_CENTRAL_DIRECTORY_SIGNATURE
+    index = datas.rfind(signature)
+    while index != -1:
+        if index + 22 <= len(datas):
+            comment_length = int.from_bytes(datas[index + 20:index + 22], "little")
+            if index + 22 + comment_length == len(datas):
+                return index
+        index = datas.rfind(signature, 0, index)
+    return -1
+
+
+def bootstrap(url, length=LC.BOOTSTRAP_RANGE):
+    """
+    This function retrieves the end of central directory record and the
+    central directory with as few requests as possible. A single suffix range
+    of length bytes is sent first. If the end of central directory record
+    does not fit in it (when the comment is long), it is fetched with one
+    follow-up request. If the central directory does not fit in it, the
+    missing bytes are fetched with one follow-up request, once the central
+    directory is read.
+    """
+
+    steps = iter_bootstrap(length)
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(fetch_range(url, *request))
+    except StopIteration as stop:
+        return Bootstrap(url, *stop.value)
+
+
+def iter_bootstrap(length=LC.BOOTSTRAP_RANGE):
+    """
+    This generator holds the logic of bootstrap() without sending any
+    request, so that it can be driven by the asyncio crawler as well. It
+    yields the ranges to download, as the value of a Range header and the
+    number of bytes requested, and must be sent the result of
+    parse_range_response() for each of them. It returns the size of the ZIP,
+    its validator, its end of central directory record, the end of the
+    central directory received, the range of its beginning (if it is
+    missing) and the number of round trips.
+    """
+
+    round_trips = 1
+    tail_start, zip_size, validator, datas = \
+        yield f"bytes=-{length}", length
+    if LC.DEBUG:
+        print(f"[*] Last {hex(len(datas))} bytes downloaded.")
+
+    index = find_end_of_central_directory_record(datas)
+    if index == -1 and tail_start > 0:
+        # The comment is longer than expected. The record and its comment are
+        # at most 22 + 0xffff bytes long.
+        length = min(zip_size, max(2 * length, 22 + 0xffff + length))
+        round_trips += 1
+        tail_start, _, _, datas = yield f"bytes=-{length}", length
+        index = find_end_of_central_directory_record(datas)
+    if index == -1:
+        print("[x] Can't find end of central directory signature.")
+        exit(-1)
+
+    if LC.DEBUG:
+        print("[*] End of central directory record found at " + \
+             f"offset: {hex(tail_start + index)}"
+        )
+    eocdr = EndOfCentralDirectoryRecord(datas, zip_size, index)
+
+    # In ZIP64 archives, the fields which don't fit in the end of central
+    # directory record are stored in a ZIP64 end of central directory record,
+    # pointed to by a locator right before the end of central directory
+    # record. Both are usually in the first window, otherwise the missing
+    # bytes are fetched with a follow-up request.
+    locator_start = index - Zip64EndOfCentralDirectoryLocator.Struct.size
+    signature = LC.ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE
+    if eocdr.needs_zip64() or (
+        locator_start >= 0 and
+        datas[locator_start:locator_start + 4] == signature
+    ):
+        if locator_start < 0 and tail_start > 0:
+            round_trips += 1
+            start = tail_start + locator_start
+            _, _, _, head = yield f"bytes={start}-{tail_start - 1}", \
+                tail_start - start
+            tail_start, datas = start, head + datas
+            index -= locator_start
+            locator_start = 0
+        locator = Zip64EndOfCentralDirectoryLocator(datas, locator_start)
+
+        record_start = \
+            locator.get_offset_of_zip64_end_of_central_directory_record() - \
+            tail_start
+        if record_start < 0 and tail_start > 0:
+            round_trips += 1
+            start = tail_start + record_start
+            _, _, _, head = yield f"bytes={start}-{tail_start - 1}", \
+                tail_start - start
+            tail_start, datas = start, head + datas
+            index -= record_start
+            record_start = 0
+        eocdr.Zip64 = Zip64EndOfCentralDirectoryRecord(datas, record_start)
+
+    # Thanks to the structure end of central directory record, we know where
+    # the central directory is located. If it starts before the bytes we
+    # already have, the missing part will be requested.
+    cd_start = eocdr.get_offset_of_start_of_central_directory()
+    cd_end = cd_start + eocdr.get_size_of_central_directory()
+    head_range = None
+    if cd_start < tail_start:
+        head_range = (cd_start, tail_start - 1)
+
+    tail = datas[max(cd_start - tail_start, 0):cd_end - tail_start]
+    return zip_size, validator, eocdr, tail, head_range, round_trips
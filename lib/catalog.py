@@ -0,0 +1,277 @@
+import os
+import sqlite3
+import time
+
+import lib.constants as LC
+
+from lib.central_directory_index import CentralDirectoryIndex
+from lib.index_cache import CachedIndex
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    zip_size INTEGER NOT NULL,
+    validator TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    archive_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    raw_name BLOB,
+    compressed_size INTEGER NOT NULL,
+    uncompressed_size INTEGER NOT NULL,
+    crc32 INTEGER NOT NULL,
+    method INTEGER NOT NULL,
+    flags INTEGER NOT NULL,
+    modified INTEGER NOT NULL,
+    local_header_offset INTEGER NOT NULL,
+    extra_field_length INTEGER NOT NULL,
+    PRIMARY KEY (archive_id, position)
+) WITHOUT ROWID;
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name);
+CREATE INDEX IF NOT EXISTS entries_crc32 ON entries (crc32);
+CREATE INDEX IF NOT EXISTS entries_size ON entries (uncompressed_size);
+"""
+
+
+class CatalogEntry:
+    # Entry of a ZIP matching a catalog query.
+    __slots__ = (
+        "Url",
+        "Name",
+        "CompressedSize",
+        "UncompressedSize",
+        "CRC32",
+        "Method",
+        "Modified",
+    )
+
+    def __init__(self, url, name, compressed_size, uncompressed_size, crc32,
+                 method, modified):
+        self.Url = url
+        self.Name = name
+        self.CompressedSize = compressed_size
+        self.UncompressedSize = uncompressed_size
+        self.CRC32 = crc32
+        self.Method = method
+        # MS-DOS date << 16 | MS-DOS time, like the bounds of Selection.
+        self.Modified = modified
+
+
+class Catalog:
+    """
+    SQLite database of the central directories of many ZIPs, to find which
+    ZIP holds a given file without sending any request. Each ZIP (its URL,
+    size and validator) is a row of archives, and each of its entries a row
+    of entries, with the fields of CentralDirectoryFileHeader needed to
+    download it. Names are stored decoded; the raw name is only kept when it
+    is not valid UTF-8.
+
+    The database is in WAL mode, and the entries of a ZIP are inserted with
+    a single executemany() in one transaction. The indexes on the name, the
+    CRC-32 and the uncompressed size are built by build_indexes() once the
+    ZIPs are loaded, which is much faster than maintaining them on every
+    insert of a first load.
+    """
+
+    def __init__(self, path=LC.CATALOG_PATH):
+        self.Path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The catalog is filled by the writer thread of the crawler, then
+        # used by the main thread: one thread at a time.
+        self.Connection = sqlite3.connect(path, check_same_thread=False)
+        self.Connection.execute("PRAGMA journal_mode=WAL")
+        self.Connection.execute("PRAGMA synchronous=NORMAL")
+        self.Connection.executescript(SCHEMA)
+
+    def close(self):
+        self.Connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def store(self, url, zip_size, validator, eocdr, index):
+        """
+        This function writes the index of url to the catalog, replacing the
+        one loaded before, if any. It can be used in place of
+        IndexCache.store (eocdr is not needed to download the entries).
+        """
+
+        names = bytes(index.Names)
+        offsets = index.NameOffsets
+
+        def rows(archive_id):
+            for i in range(len(index)):
+                raw_name = names[offsets[i]:offsets[i + 1]]
+                try:
+                    name = raw_name.decode()
+                    raw_name = None
+                except UnicodeDecodeError:
+                    name = raw_name.decode(errors="replace")
+                yield (
+                    archive_id,
+                    i,
+                    name,
+                    raw_name,
+                    index.CompressedSizes[i],
+                    index.UncompressedSizes[i],
+                    index.CRC32s[i],
+                    index.CompressionMethods[i],
+                    index.GeneralPurposeBitFlags[i],
+                    index.FileLastModificationDates[i] << 16 | \
+                        index.FileLastModificationTimes[i],
+                    index.LocalHeaderOffsets[i],
+                    index.ExtraFieldLengths[i],
+                )
+
+        with self.Connection:
+            self.remove(url)
+            archive_id = self.Connection.execute(
+                "INSERT INTO archives (url, zip_size, validator, entries, "
+                "indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (url, zip_size, validator, len(index), time.time())
+            ).lastrowid
+            self.Connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, "
+                "?)",
+                rows(archive_id)
+            )
+
+        if LC.DEBUG:
+            print(f"[*] Index of {len(index)} entries stored in {self.Path}.")
+
+    def remove(self, url):
+        row = self.Connection.execute(
+            "SELECT id FROM archives WHERE url = ?",
+            (url,)
+        ).fetchone()
+        if row is None:
+            return
+        self.Connection.execute(
+            "DELETE FROM entries WHERE archive_id = ?",
+            row
+        )
+        self.Connection.execute("DELETE FROM archives WHERE id = ?", row)
+
+    def build_indexes(self):
+        self.Connection.executescript(INDEXES)
+
+    def load(self, url):
+        """
+        This function returns the CachedIndex of url built from the catalog,
+        or None if url is not in the catalog.
+        """
+
+        archive = self.Connection.execute(
+            "SELECT id, zip_size, validator FROM archives WHERE url = ?",
+            (url,)
+        ).fetchone()
+        if archive is None:
+            return None
+        archive_id, zip_size, validator = archive
+
+        index = CentralDirectoryIndex()
+        for (
+            name, raw_name, compressed_size, uncompressed_size, crc32, method,
+            flags, modified, local_header_offset, extra_field_length
+        ) in self.Connection.execute(
+            "SELECT name, raw_name, compressed_size, uncompressed_size, "
+            "crc32, method, flags, modified, local_header_offset, "
+            "extra_field_length FROM entries WHERE archive_id = ? "
+            "ORDER BY position",
+            (archive_id,)
+        ):
+            # The central directory is not kept, the offsets of its records
+            # are unknown.
+            index.RecordOffsets.append(0)
+            index.LocalHeaderOffsets.append(local_header_offset)
+            index.CompressedSizes.append(compressed_size)
+            index.UncompressedSizes.append(uncompressed_size)
+            index.CRC32s.append(crc32)
+            index.CompressionMethods.append(method)
+            index.GeneralPurposeBitFlags.append(flags)
+            index.FileLastModificationTimes.append(modified & 0xffff)
+            index.FileLastModificationDates.append(modified >> 16)
+            index.ExtraFieldLengths.append(extra_field_length)
+            index.Names += raw_name if raw_name is not None else name.encode()
+            index.NameOffsets.append(len(index.Names))
+
+        if LC.DEBUG:
+            print(f"[*] Index of {len(index)} entries loaded from " + \
+                  f"{self.Path}."
+            )
+
+        return CachedIndex(url, zip_size, validator, None, index)
+
+    def find(
+        self,
+        name=None,
+        glob=None,
+        crc32=None,
+        min_size=None,
+        max_size=None,
+        url=None
+    ):
+        """
+        This function returns the CatalogEntry of every entry matching all
+        the criteria given: exact name, glob pattern on the name (GLOB of
+        SQLite, case-sensitive), CRC-32, bounds of the uncompressed size and
+        URL of the ZIP.
+        """
+
+        conditions = []
+        parameters = []
+        for condition, value in (
+            ("entries.name = ?", name),
+            ("entries.name GLOB ?", glob),
+            ("entries.crc32 = ?", crc32),
+            ("entries.uncompressed_size >= ?", min_size),
+            ("entries.uncompressed_size <= ?", max_size),
+            ("archives.url = ?", url),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        query = "SELECT archives.url, entries.name, " \
+                "entries.compressed_size, entries.uncompressed_size, " \
+                "entries.crc32, entries.method, entries.modified " \
+                "FROM entries JOIN archives ON archives.id = entries.archive_id"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY archives.url, entries.position"
+        return [
+            CatalogEntry(*row)
+            for row in self.Connection.execute(query, parameters)
+        ]
+
+    def inspect(self):
+        # Prints the ZIPs of the catalog.
+        archives = self.Connection.execute(
+            "SELECT url, zip_size, validator, entries, indexed_at "
+            "FROM archives ORDER BY url"
+        ).fetchall()
+        for url, zip_size, validator, entries, indexed_at in archives:
+            print(f"\t- {url}")
+            print(f"\t    - Entries: {entries}")
+            print(f"\t    - ZIP size: {hex(zip_size)} bytes")
+            print(f"\t    - Validator: {validator or 'none'}")
+            print("\t    - Indexed: " + \
+                  time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(indexed_at))
+            )
+        print(f"[*] {len(archives)} ZIP(s), " + \
+              f"{sum(archive[3] for archive in archives)} entries in " + \
+              f"{self.Path}."
+        )
@@ -9,100 +9,153 @@ class CentralDirectoryFileHeader:
         - https://en.wikipedia.org/wiki/ZIP_(file_format)#Central_directory_file_header
     """
 
+    __slots__ = (
+        "VersionMadeBy",
+        "VersionNeededToExtract",
+        "GeneralPurposeBitFlag",
+        "CompressionMethod",
+        "FileLastModificationTime",
+        "FileLastModificationDate",
+        "CRC32OfUncompressedData",
+        "CompressedSize",
+        "UncompressedSize",
+        "FileNameLength",
+        "ExtraFieldLength",
+        "FileCommentLength",
+        "DiskNumberWhereFileStarts",
+        "InternalFileAttributes",
+        "ExternalFileAttributes",
+        "RelativeOffsetOfLocalFileHeader",
+        "StructLength",
+        "_datas",
+        "_offset",
+    )
+
     # Offset 0, Bytes 4
     CentralDirectoryFileHeaderSignature = b"\x50\x4b\x01\x02"
 
-    # Header length
-    StructLength = 0
+    # Fixed part of the header, from offset 0 to offset 46.
+    Struct = struct.Struct("<4s6H3I5H2I")
 
-    def __init__(self, datas):
+    def __init__(self, datas, offset=0):
         """
-        This function parses the central directory file header and calculates
-        its total length.
+        This function parses the central directory file header located at
+        offset in datas and calculates its total length. The fixed part of the
+        header is decoded at once, the variable length fields (file name,
+        extra field and file comment) are only sliced when requested.
         """
 
         try:
-            if self.CentralDirectoryFileHeaderSignature != datas[0:4]:
+            if len(datas) - offset < self.Struct.size:
+                raise Exception(
+                    "[x] Truncated central directory file header."
+                )
+
+            (
+                Signature,
+                # Offset 4, Bytes 2
+                self.VersionMadeBy,
+                # Offset 6, Bytes 2
+                self.VersionNeededToExtract,
+                # Offset 8, Bytes 2
+                self.GeneralPurposeBitFlag,
+                # Offset 10, Bytes 2
+                self.CompressionMethod,
+                # Offset 12, Bytes 2
+                self.FileLastModificationTime,
+                # Offset 14, Bytes 2
+                self.FileLastModificationDate,
+                # Offset 16, Bytes 4
+                self.CRC32OfUncompressedData,
+                # Offset 20, Bytes 4 (0xffffffff for ZIP64)
+                self.CompressedSize,
+                # Offset 24, Bytes 4 (0xffffffff for ZIP64)
+                self.UncompressedSize,
+                # Offset 28, Bytes 2 (n)
+                self.FileNameLength,
+                # Offset 30, Bytes 2 (m)
+                self.ExtraFieldLength,
+                # Offset 32, Bytes 2 (k)
+                self.FileCommentLength,
+                # Offset 34, Bytes 2 (0xffff for ZIP64)
+                self.DiskNumberWhereFileStarts,
+                # Offset 36, Bytes 2
+                self.InternalFileAttributes,
+                # Offset 38, Bytes 4
+                self.ExternalFileAttributes,
+                # Offset 42, Bytes 4 (0xffffffff for ZIP64)
+                # This is the number of bytes between the start of the first
+                # disk on which the file occurs, and the start of the local
+                # file header. This allows software reading the central
+                # directory to locate the position of the file inside the ZIP
+                # file.
+                self.RelativeOffsetOfLocalFileHeader
+            ) = self.Struct.unpack_from(datas, offset)
+
+            if self.CentralDirectoryFileHeaderSignature != Signature:
                 raise Exception(
                     "[x] Bad signature for: Central directory " + \
                     "file header signature."
-                ) 
-
-            # Offset 4, Bytes 2
-            self.VersionMadeBy = datas[4:6]
-
-            # Offset 6, Bytes 2
-            self.VersionNeededToExtract = datas[6:8]
-
-            # Offset 8, Bytes 2
-            self.GeneralPurposeBitFlag = datas[8:10]
-
-            # Offset 10, Bytes 2
-            self.CompressionMethod = datas[10:12]
-
-            # Offset 12, Bytes 2
-            self.FileLastModificationTime = datas[12:14]
-
-            # Offset 14, Bytes 2
-            self.FileLastModificationDate = datas[14:16]
-
-            # Offset 16, Bytes 4
-            self.CRC32OfUncompressedData = datas[16:20]
-
-            # Offset 20, Bytes 4 (0xffffffff for ZIP64)
-            self.CompressedSize = datas[20:24]
-
-            # Offset 24, Bytes 4 (0xffffffff for ZIP64)
-            self.UncompressedSize = datas[24:28]
-
-            # Offset 28, Bytes 2 (n)
-            self.FileNameLength = datas[28:30]
-            n = struct.unpack("I", self.FileNameLength + b"\x00"*2)[0]
-
-            # Offset 30, Bytes 2 (m)
-            self.ExtraFieldLength = datas[30:32]
-            m = struct.unpack("I", self.ExtraFieldLength + b"\x00"*2)[0]
-
-            # Offset 32, Bytes 2 (k)
-            self.FileCommentLength = datas[32:34]
-            k = struct.unpack("I", self.FileCommentLength + b"\x00"*2)[0]
-
-            # Offset 34, Bytes 2 (0xffff for ZIP64)
-            self.DiskNumberWhereFileStarts = datas[34:36]
-
-            # Offset 36, Bytes 2
-            self.InternalFileAttributes = datas[36:38]
-
-            # Offset 38, Bytes 4
-            self.ExternalFileAttributes = datas[38:42]
-
-            # Offset 42, Bytes 4 (0xffffffff for ZIP64)
-            # This is the number of bytes between the start of the first disk on
-            # which the file occurs, and the start of the local file header.
-            # This allows software reading the central directory to locate the
-            # position of the file inside the ZIP file. 
-            self.RelativeOffsetOfLocalFileHeader = datas[42:46]
+                )
 
             # Offset 46, Bytes n
-            self.FileName = datas[46:46+n]
-
             # Offset 46+n, Bytes m
-            self.ExtraField = datas[46+n:46+n+m]
-
             # Offset 46+n+m, Bytes k
-            self.FileComment  = datas[46+n+m:46+n+m+k]
+            self.StructLength = 46 + \
+                self.FileNameLength + \
+                self.ExtraFieldLength + \
+                self.FileCommentLength
+
+            if len(datas) - offset < self.StructLength:
+                raise Exception(
+                    "[x] Truncated central directory file header."
+                )
+
+            # Offset 46+n, Bytes m (ZIP64 extended information extra field)
+            if 0xffffffff in (
+                self.CompressedSize,
+                self.UncompressedSize,
+                self.RelativeOffsetOfLocalFileHeader
+            ):
+                start = offset + 46 + self.FileNameLength
+                (
+                    self.UncompressedSize,
+                    self.CompressedSize,
+                    self.RelativeOffsetOfLocalFileHeader
+                ) = decode_zip64_extra_field(
+                    datas[start:start + self.ExtraFieldLength],
+                    self.UncompressedSize,
+                    self.CompressedSize,
+                    self.RelativeOffsetOfLocalFileHeader
+                )
 
         except Exception as error:
             print(error)
             exit(-1)
 
-        self.StructLength = 46 + n + m + k
+        self._datas = datas
+        self._offset = offset
 
         if LC.DEBUG:
             print("[*] Central directory file header of size " + \
                  f"{hex(self.StructLength)} parsed."
             )
 
+    @property
+    def FileName(self):
+        start = self._offset + 46
+        return bytes(self._datas[start:start + self.FileNameLength])
+
+    @property
+    def ExtraField(self):
+        start = self._offset + 46 + self.FileNameLength
+        return bytes(self._datas[start:start + self.ExtraFieldLength])
+
+    @property
+    def FileComment(self):
+        start = self._offset + 46 + self.FileNameLength + self.ExtraFieldLength
+        return bytes(self._datas[start:start + self.FileCommentLength])
+
     """
     Thoses functions displays the information contained in the header.
     It is based on the information referenced by the following URL:
@@ -120,51 +173,33 @@ class CentralDirectoryFileHeader:
         return CentralDirectoryFileHeaderSignature
 
     def get_version(self):
-        # Version.
-        VersionMadeBy = self.VersionMadeBy[::-1]
-        version = ""
-        try:
-            version = LC.VERSION_MADE_BY[int(VersionMadeBy[0])]
-        except Exception:
-            pass
+        # Version (upper byte first).
+        VersionMadeBy = struct.pack(">H", self.VersionMadeBy)
 
         if LC.DEBUG:
+            version = LC.VERSION_MADE_BY.get(self.VersionMadeBy >> 8, "")
+            lower = self.VersionMadeBy & 0xff
             print(f"\t- Version made by:\n\t    - {version} (upper byte)")
-            print("\t    - " + \
-                 f"{str(int(VersionMadeBy[1]))[0]}" + \
-                  "." + \
-                 f"{str(int(VersionMadeBy[1]))[1::]} " + \
-                  "(lower byte)"
-            )
+            print(f"\t    - {lower // 10}.{lower % 10} (lower byte)")
 
         return VersionMadeBy
 
     def get_version_needed(self):
-        # Version needed.
-        VersionNeededToExtract = self.VersionNeededToExtract[::-1]
+        # Version needed (upper byte first).
+        VersionNeededToExtract = struct.pack(">H", self.VersionNeededToExtract)
 
         if LC.DEBUG:
+            lower = self.VersionNeededToExtract & 0xff
             print("\t- Version needed to extract: " + \
                  f"{self.VersionNeededToExtract}"
             )
-            print("\t    - " + \
-                 f"{str(int(VersionNeededToExtract[1]))[0]}" + \
-                  "." + \
-                 f"{str(int(VersionNeededToExtract[1]))[1]}"
-            )
+            print(f"\t    - {lower // 10}.{lower % 10}")
 
         return VersionNeededToExtract
 
     def get_flags(self):
-        # Flags.
-        GeneralPurposeBitFlag = []
-        GeneralPurposeBitFlag.append(
-            "{0:08b}".format(self.GeneralPurposeBitFlag[::-1][0])
-        )
-        GeneralPurposeBitFlag.append(
-            "{0:08b}".format(self.GeneralPurposeBitFlag[::-1][1])
-        )
-        GeneralPurposeBitFlag = "".join(GeneralPurposeBitFlag)
+        # Flags (most significant bit first).
+        GeneralPurposeBitFlag = f"{self.GeneralPurposeBitFlag:016b}"
 
         if LC.DEBUG:
             print(f"\t- General purpose bit flag: {GeneralPurposeBitFlag}")
@@ -173,68 +208,41 @@ class CentralDirectoryFileHeader:
 
     def get_compression_method(self):
         # Compression method.
-        CompressionMethod = struct.unpack(
-            "I",
-            self.CompressionMethod + b"\x00"*2
-        )[0]
-        compression = ""
-        try:
-            compression = LC.COMPRESSION_METHOD[int(CompressionMethod)]
-        except Exception:
-            pass
+        CompressionMethod = self.CompressionMethod
 
         if LC.DEBUG:
+            compression = LC.COMPRESSION_METHOD.get(CompressionMethod, "")
             print(f"\t- Compression method: {compression}")
 
         return CompressionMethod
 
     def get_file_modification_time(self):
         # File modification time (stored in standard MS-DOS format).
-        FileLastModificationTime = []
-        FileLastModificationTime.append(
-            "{0:08b}".format(self.FileLastModificationTime[::-1][0])
-        )
-        FileLastModificationTime.append(
-            "{0:08b}".format(self.FileLastModificationTime[::-1][1])
-        )
-        FileLastModificationTime = "".join(FileLastModificationTime)
-
-        hour = int(FileLastModificationTime[0:5], 2)
-        minute = int(FileLastModificationTime[5:11], 2)
-        seconde = int(FileLastModificationTime[11::], 2)
-        time = f"{hour}:{minute}:{seconde}"
+        FileLastModificationTime = f"{self.FileLastModificationTime:016b}"
 
         if LC.DEBUG:
-            print(f"\t- File last modification time: {time}")
+            hour, minute, seconde = decode_dos_time(
+                self.FileLastModificationTime
+            )
+            print("\t- File last modification time: " + \
+                 f"{hour}:{minute}:{seconde}"
+            )
 
         return FileLastModificationTime
 
     def get_file_modification_date(self):
         # File modification date (stored in standard MS-DOS format).
-        FileLastModificationDate = []
-        FileLastModificationDate.append(
-            "{0:08b}".format(self.FileLastModificationDate[::-1][0])
-        )
-        FileLastModificationDate.append(
-            "{0:08b}".format(self.FileLastModificationDate[::-1][1])
-        )
-        FileLastModificationDate = "".join(FileLastModificationDate)
-
-        year = 2000 - 20 + int(FileLastModificationDate[0:7], 2)
-        month = int(FileLastModificationDate[7:11], 2)
-        day = int(FileLastModificationDate[11::], 2)
-        date = f"{day}/{month}/{year}"
+        FileLastModificationDate = f"{self.FileLastModificationDate:016b}"
 
         if LC.DEBUG:
-            print(f"\t- File last modification date: {date}")
+            year, month, day = decode_dos_date(self.FileLastModificationDate)
+            print(f"\t- File last modification date: {day}/{month}/{year}")
+
         return FileLastModificationDate
 
     def getcrc32_checksum(self):
         # Crc-32 checksum.
-        CRC32OfUncompressedData = struct.unpack(
-            "I",
-            self.CRC32OfUncompressedData
-        )[0]
+        CRC32OfUncompressedData = self.CRC32OfUncompressedData
 
         if LC.DEBUG:
             print("\t- CRC32 of uncompressed data: " + \
@@ -245,7 +253,7 @@ class CentralDirectoryFileHeader:
 
     def get_compressed_size(self, remote_call=0):
         # Compressed size.
-        CompressedSize = struct.unpack("I", self.CompressedSize)[0]
+        CompressedSize = self.CompressedSize
 
         if LC.DEBUG and not remote_call:
             print(f"\t- Compressed size: {hex(CompressedSize)} bytes")
@@ -254,7 +262,7 @@ class CentralDirectoryFileHeader:
 
     def get_uncompressed_size(self):
         # Uncompressed size.
-        UncompressedSize = struct.unpack("I", self.UncompressedSize)[0]
+        UncompressedSize = self.UncompressedSize
 
         if LC.DEBUG:
             print(f"\t- Uncompressed size: {hex(UncompressedSize)} bytes")
@@ -263,7 +271,7 @@ class CentralDirectoryFileHeader:
 
     def get_file_name_length(self, remote_call=0):
         # File name length.
-        FileNameLength = struct.unpack("I", self.FileNameLength + b"\x00"*2)[0]
+        FileNameLength = self.FileNameLength
 
         if LC.DEBUG and not remote_call:
             print(f"\t- File name length: {FileNameLength}")
@@ -272,10 +280,7 @@ class CentralDirectoryFileHeader:
 
     def get_extra_field_length(self, remote_call=0):
         # Extra field length.
-        ExtraFieldLength = struct.unpack(
-            "I",
-            self.ExtraFieldLength + b"\x00"*2
-        )[0]
+        ExtraFieldLength = self.ExtraFieldLength
 
         if LC.DEBUG and not remote_call:
             print(f"\t- Extra field length: {ExtraFieldLength}")
@@ -284,10 +289,7 @@ class CentralDirectoryFileHeader:
 
     def get_file_comment_length(self, remote_call=0):
         # File comment length.
-        FileCommentLength = struct.unpack(
-            "I",
-            self.FileCommentLength + b"\x00"*2
-        )[0]
+        FileCommentLength = self.FileCommentLength
 
         if LC.DEBUG and not remote_call:
             print(f"\t- File comment length: {FileCommentLength}")
@@ -296,10 +298,7 @@ class CentralDirectoryFileHeader:
 
     def get_disk_number_where_file_starts(self):
         # Disk # start.
-        DiskNumberWhereFileStarts = struct.unpack(
-            "I",
-            self.DiskNumberWhereFileStarts + b"\x00"*2
-        )[0]
+        DiskNumberWhereFileStarts = self.DiskNumberWhereFileStarts
 
         if LC.DEBUG:
             print("\t- Disk number where file starts: " + \
@@ -310,28 +309,29 @@ class CentralDirectoryFileHeader:
 
     def get_internal_file_attributes(self):
         # Internal attributes.
+        InternalFileAttributes = struct.pack("<H", self.InternalFileAttributes)
+
         if LC.DEBUG:
             print("\t- Internal file attributes: " + \
-                 f"{self.InternalFileAttributes}"
+                 f"{InternalFileAttributes}"
             )
 
-        return self.InternalFileAttributes
+        return InternalFileAttributes
 
     def get_external_file_attributes(self):
         # External attributes.
+        ExternalFileAttributes = struct.pack("<I", self.ExternalFileAttributes)
+
         if LC.DEBUG:
             print("\t- External file attributes: " + \
-                 f"{self.ExternalFileAttributes}"
+                 f"{ExternalFileAttributes}"
             )
 
-        return self.ExternalFileAttributes
+        return ExternalFileAttributes
 
     def get_relative_offset_of_local_file_header(self, remote_call=0):
         # Offset of local header.
-        RelativeOffsetOfLocalFileHeader = struct.unpack(
-            "I",
-            self.RelativeOffsetOfLocalFileHeader
-        )[0]
+        RelativeOffsetOfLocalFileHeader = self.RelativeOffsetOfLocalFileHeader
 
         if LC.DEBUG and not remote_call:
             print("\t- Relative offset of local file header: " + \
@@ -343,7 +343,7 @@ class CentralDirectoryFileHeader:
     def get_file_name(self, remote_call=0):
         # File name.
         FileName = self.FileName.decode()
- 
+
         if not remote_call:
             print(f"\t- File name: {FileName}")
 
@@ -351,10 +351,12 @@ class CentralDirectoryFileHeader:
 
     def get_extra_field(self):
         # Extra field.
+        ExtraField = self.ExtraField
+
         if LC.DEBUG:
-            print(f"\t- Extra field: {self.ExtraField}")
+            print(f"\t- Extra field: {ExtraField}")
 
-        return self.ExtraField
+        return ExtraField
 
     def get_file_comment(self):
         # File comment.
@@ -363,4 +365,50 @@ class CentralDirectoryFileHeader:
         if LC.DEBUG:
             print(f"\t- File comment: {FileComment}")
 
-        return FileComment
\ No newline at end of file
+        return FileComment
+
+
+def decode_dos_time(FileLastModificationTime):
+    # Bits 15-11: hour, bits 10-5: minute, bits 4-0: seconds / 2. The seconds
+    # are returned as stored, like the original tool did.
+    hour = FileLastModificationTime >> 11
+    minute = (FileLastModificationTime >> 5) & 0x3f
+    seconde = FileLastModificationTime & 0x1f
+    return hour, minute, seconde
+
+
+def decode_dos_date(FileLastModificationDate):
+    # Bits 15-9: year since 1980, bits 8-5: month, bits 4-0: day.
+    year = 1980 + (FileLastModificationDate >> 9)
+    month = (FileLastModificationDate >> 5) & 0x0f
+    day = FileLastModificationDate & 0x1f
+    return year, month, day
+
+
+def decode_zip64_extra_field(
+    ExtraField,
+    UncompressedSize,
+    CompressedSize,
+    RelativeOffsetOfLocalFileHeader
+):
+    """
+    This function returns the uncompressed size, the compressed size and the
+    relative offset of local file header of an entry, the ones set to
+    0xffffffff being replaced by their value in the ZIP64 extended information
+    extra field. This field only holds the replaced values, in this order.
+    """
+
+    values = [UncompressedSize, CompressedSize, RelativeOffsetOfLocalFileHeader]
+    position = 0
+    while position + 4 <= len(ExtraField):
+        header_id, size = struct.unpack_from("<2H", ExtraField, position)
+        position += 4
+        if header_id == LC.ZIP64_EXTRA_FIELD_ID:
+            end = min(position + size, len(ExtraField))
+            for j, value in enumerate(values):
+                if value == 0xffffffff and position + 8 <= end:
+                    values[j], = struct.unpack_from("<Q", ExtraField, position)
+                    position += 8
+            break
+        position += size
+    return tuple(values)
@@ -0,0 +1,304 @@
+import array
+import bisect
+
+import lib.constants as LC
+
+from lib.central_directory_file_header import (
+    CentralDirectoryFileHeader,
+    decode_zip64_extra_field
+)
+
+
+# Bit 3 of the general purpose bit flag: the CRC-32 and the sizes follow the
+# compressed data, in a data descriptor.
+FLAG_DATA_DESCRIPTOR = 0x8
+
+
+class CentralDirectoryIndex:
+    """
+    Columnar index of the central directory. Instead of keeping one Python
+    object per entry, each field of interest is stored in its own compact
+    array and all the file names share a single blob. Entry i is described by
+    the i-th element of every column.
+    """
+
+    # Columns holding one element per entry (plus one for NameOffsets), in the
+    # order they are serialized by lib/index_cache.py.
+    Columns = (
+        "RecordOffsets",
+        "LocalHeaderOffsets",
+        "CompressedSizes",
+        "UncompressedSizes",
+        "CRC32s",
+        "CompressionMethods",
+        "GeneralPurposeBitFlags",
+        "FileLastModificationTimes",
+        "FileLastModificationDates",
+        "ExtraFieldLengths",
+        "NameOffsets",
+    )
+
+    def __init__(self):
+        # Offset of each central directory file header in the parsed buffer.
+        self.RecordOffsets = array.array("Q")
+
+        # Relative offset of local file header.
+        self.LocalHeaderOffsets = array.array("Q")
+
+        self.CompressedSizes = array.array("Q")
+        self.UncompressedSizes = array.array("Q")
+        self.CRC32s = array.array("I")
+        self.CompressionMethods = array.array("H")
+        self.GeneralPurposeBitFlags = array.array("H")
+
+        # DOS time and date, as stored in the header.
+        self.FileLastModificationTimes = array.array("H")
+        self.FileLastModificationDates = array.array("H")
+
+        self.ExtraFieldLengths = array.array("H")
+
+        # Names of entry i are Names[NameOffsets[i]:NameOffsets[i + 1]].
+        self.NameOffsets = array.array("Q", [0])
+        self.Names = bytearray()
+
+        # Lookup structures, built the first time they are needed: raw name
+        # to entry, and raw names sorted with their entries.
+        self.NameTable = None
+        self.SortedNames = None
+        self.SortedEntries = None
+
+    def __len__(self):
+        return len(self.LocalHeaderOffsets)
+
+    def get_raw_file_name(self, i):
+        return bytes(self.Names[self.NameOffsets[i]:self.NameOffsets[i + 1]])
+
+    def get_file_name(self, i):
+        return self.get_raw_file_name(i).decode()
+
+    def get_file_name_length(self, i):
+        return self.NameOffsets[i + 1] - self.NameOffsets[i]
+
+    def get_member_range(self, i, local_extra_length=None, descriptor=True):
+        """
+        This function returns the range (start, end), both inclusive, of the
+        local file header of entry i, its compressed data and, if descriptor
+        is True, its data descriptor. The extra field of the local file header
+        may differ from the one of the central directory: local_extra_length is
+        used when it is known, otherwise it is estimated. The data descriptor
+        only exists if bit 3 of the general purpose bit flag is set, and its
+        sizes take 8 bytes each in ZIP64 entries. Its optional signature is
+        counted.
+        """
+
+        if local_extra_length is None:
+            local_extra_length = self.ExtraFieldLengths[i] + \
+                LC.LOCAL_EXTRA_FIELD_SLACK
+        descriptor_length = 0
+        if descriptor and \
+            self.GeneralPurposeBitFlags[i] & FLAG_DATA_DESCRIPTOR:
+            zip64 = self.CompressedSizes[i] >= 0xffffffff or \
+                self.UncompressedSizes[i] >= 0xffffffff
+            descriptor_length = 24 if zip64 else 16
+
+        start = self.LocalHeaderOffsets[i]
+        end = start + \
+            30 + \
+            self.get_file_name_length(i) + \
+            local_extra_length + \
+            self.CompressedSizes[i] + \
+            descriptor_length - 1
+        return start, end
+
+    def get_file_names(self):
+        # Returns the names of all the entries.
+        names = bytes(self.Names)
+        offsets = self.NameOffsets
+        return [
+            names[offsets[i]:offsets[i + 1]].decode()
+            for i in range(len(self))
+        ]
+
+    def find(self, filename):
+        # Returns the position of the entry named filename, or None.
+        if self.NameTable is None:
+            names = bytes(self.Names)
+            offsets = self.NameOffsets
+            self.NameTable = {}
+            # When a name appears several times, the first entry is kept.
+            for i in range(len(self) - 1, -1, -1):
+                self.NameTable[names[offsets[i]:offsets[i + 1]]] = i
+        return self.NameTable.get(filename.encode())
+
+    def find_prefix(self, prefix):
+        # Returns the positions of the entries whose name starts with prefix.
+        if self.SortedNames is None:
+            names = bytes(self.Names)
+            offsets = self.NameOffsets
+            entries = sorted(
+                range(len(self)),
+                key=lambda i: names[offsets[i]:offsets[i + 1]]
+            )
+            self.SortedNames = [
+                names[offsets[i]:offsets[i + 1]] for i in entries
+            ]
+            self.SortedEntries = entries
+        raw = prefix.encode()
+        first = bisect.bisect_left(self.SortedNames, raw)
+        last = first
+        while last < len(self.SortedNames) and \
+            self.SortedNames[last].startswith(raw):
+            last += 1
+        return self.SortedEntries[first:last]
+
+
+def parse_records(index, view, start=0, base=0, end=None):
+    """
+    This function appends to index the central directory file headers found
+    in view from offset start (and starting before offset end, if given),
+    base being the offset of view in the central directory. Each header is
+    decoded in place, so no part of the buffer is copied except the file
+    names. Returns the offset following the last complete header, and whether
+    the parsing stopped on something else than a central directory file
+    header (the end of the central directory).
+    """
+
+    size = len(view)
+    if end is None:
+        end = size
+    unpack_from = CentralDirectoryFileHeader.Struct.unpack_from
+    header_size = CentralDirectoryFileHeader.Struct.size
+    signature = LC.CENTRAL_DIRECTORY_FILE_HEADER_SIGNATURE
+
+    while start < end and start + header_size <= size:
+        (
+            Signature, _, _, GeneralPurposeBitFlag, CompressionMethod,
+            FileLastModificationTime, FileLastModificationDate,
+            CRC32OfUncompressedData, CompressedSize, UncompressedSize,
+            n, m, k, _, _, _, RelativeOffsetOfLocalFileHeader
+        ) = unpack_from(view, start)
+
+        if Signature != signature:
+            return start, True
+
+        if start + header_size + n + m + k > size:
+            return start, False
+
+        if CompressedSize == 0xffffffff or UncompressedSize == 0xffffffff or \
+            RelativeOffsetOfLocalFileHeader == 0xffffffff:
+            extra = start + header_size + n
+            (
+                UncompressedSize,
+                CompressedSize,
+                RelativeOffsetOfLocalFileHeader
+            ) = decode_zip64_extra_field(
+                view[extra:extra + m],
+                UncompressedSize,
+                CompressedSize,
+                RelativeOffsetOfLocalFileHeader
+            )
+
+        index.RecordOffsets.append(base + start)
+        index.LocalHeaderOffsets.append(RelativeOffsetOfLocalFileHeader)
+        index.CompressedSizes.append(CompressedSize)
+        index.UncompressedSizes.append(UncompressedSize)
+        index.CRC32s.append(CRC32OfUncompressedData)
+        index.CompressionMethods.append(CompressionMethod)
+        index.GeneralPurposeBitFlags.append(GeneralPurposeBitFlag)
+        index.FileLastModificationTimes.append(FileLastModificationTime)
+        index.FileLastModificationDates.append(FileLastModificationDate)
+        index.ExtraFieldLengths.append(m)
+        index.Names += view[start + header_size:start + header_size + n]
+        index.NameOffsets.append(len(index.Names))
+
+        start += header_size + n + m + k
+
+    return start, False
+
+
+def check_central_directory(index, offset, remaining, expected=None):
+    """
+    This function checks that the central directory was entirely parsed:
+    no header is left truncated (remaining is the number of bytes left after
+    the last complete header, at offset) and, if expected is given, the number
+    of headers identified is equal to the number of files expected.
+    """
+
+    try:
+        if remaining >= CentralDirectoryFileHeader.Struct.size:
+            raise Exception(
+                "[x] Truncated central directory file header at " + \
+               f"offset: {hex(offset)}."
+            )
+
+        if expected is not None and expected != len(index):
+            raise Exception(
+                "[x] Can't find all central directory file header."
+            )
+
+    except Exception as error:
+        print(error)
+        exit(-1)
+
+    if LC.DEBUG:
+        print(f"[*] Central directory of {len(index)} entries parsed.")
+
+
+def parse_central_directory(datas, expected=None):
+    """
+    This function walks the central directory once and builds its columnar
+    index.
+    """
+
+    index = CentralDirectoryIndex()
+    start, stopped = parse_records(index, memoryview(datas))
+    check_central_directory(
+        index,
+        start,
+        0 if stopped else len(datas) - start,
+        expected
+    )
+    return index
+
+
+class CentralDirectoryParser:
+    """
+    Incremental version of parse_central_directory(): the central directory
+    is fed chunk by chunk, as it is downloaded, and the entries are indexed as
+    soon as their header is complete. Only the bytes of the header split
+    across two chunks are buffered.
+    """
+
+    def __init__(self):
+        self.Index = CentralDirectoryIndex()
+        self.Buffer = bytearray()
+        # Offset of the buffer in the central directory.
+        self.Offset = 0
+        self.Stopped = False
+
+    def feed(self, datas):
+        # Returns the positions of the entries completed by datas.
+        first = len(self.Index)
+        if self.Stopped:
+            return range(first, first)
+        self.Buffer += datas
+        with memoryview(self.Buffer) as view:
+            start, self.Stopped = parse_records(
+                self.Index,
+                view,
+                0,
+                self.Offset
+            )
+        del self.Buffer[:start]
+        self.Offset += start
+        return range(first, len(self.Index))
+
+    def close(self, expected=None):
+        # Checks that the whole central directory was fed, returns its index.
+        check_central_directory(
+            self.Index,
+            self.Offset,
+            0 if self.Stopped else len(self.Buffer),
+            expected
+        )
+        return self.Index
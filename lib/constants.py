@@ -1,11 +1,128 @@
+import os
+
 # This variable is used to switch to debug mode and increase verbosity.
 DEBUG = 0
 
-JUNK_FILENAME = "last_bytes"
+# Number of bytes requested at the end of the file in the first request. They
+# usually contain the end of central directory record and, for most archives,
+# the whole central directory.
+BOOTSTRAP_RANGE = 64 * 1024
+
+# Location and maximum size (in bytes) of the central directory index cache.
+CACHE_DIRECTORY = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "reZFDownloader"
+)
+CACHE_SIZE = 256 * 1024 * 1024
+
+# Location and maximum size (in bytes of disk space) of the block cache, where
+# the bytes of the ZIPs received by the range requests are kept, in aligned
+# blocks of BLOCK_SIZE bytes. Ranges larger than BLOCK_CACHE_MAX_RANGE bytes
+# bypass it.
+BLOCK_CACHE_DIRECTORY = os.path.join(CACHE_DIRECTORY, "blocks")
+BLOCK_CACHE_SIZE = 1024 * 1024 * 1024
+BLOCK_SIZE = 16 * 1024
+BLOCK_CACHE_MAX_RANGE = 64 * 1024 * 1024
+
+# SQLite catalog of the central directories of many ZIPs (see lib/catalog.py).
+CATALOG_PATH = os.path.join(CACHE_DIRECTORY, "catalog.sqlite")
+
+# Location and maximum size (in bytes) of the seek indexes of the deflated
+# members read with random access (see lib/remote_member.py). A seek point is
+# recorded every SEEK_POINT_SPAN bytes of uncompressed data.
+SEEK_INDEX_DIRECTORY = os.path.join(CACHE_DIRECTORY, "seek")
+SEEK_INDEX_SIZE = 256 * 1024 * 1024
+SEEK_POINT_SPAN = 1024 * 1024
+
+# Members read with random access are downloaded in blocks of
+# MEMBER_BLOCK_SIZE bytes, the MEMBER_CACHED_BLOCKS most recently used ones
+# being kept in memory. The number of blocks requested at once doubles while
+# the reads are sequential, up to MEMBER_READ_AHEAD.
+MEMBER_BLOCK_SIZE = 64 * 1024
+MEMBER_CACHED_BLOCKS = 64
+MEMBER_READ_AHEAD = 32
+
+# Number of threads downloading members, and maximum number of requests in
+# flight to the same host.
+WORKERS = 16
+MAX_REQUESTS_PER_HOST = 8
+
+# Number of ZIPs indexed at the same time in batch mode, and seconds after
+# which a request of the crawler is abandoned.
+CRAWL_CONCURRENCY = 64
+CRAWL_TIMEOUT = 30
+
+OUTPUT_DIRECTORY = "outputs"
+
+# Size of the chunks read from the network and written to the disk.
+CHUNK_SIZE = 64 * 1024
+
+# Library sending the HTTP requests: "http.client" (standard library, fast to
+# import) or "requests" (imported only when selected). Redirections are
+# followed at most MAX_REDIRECTS times.
+TRANSPORT = "http.client"
+MAX_REDIRECTS = 10
+
+# Ranges of members separated by at most MAX_RANGE_GAP bytes are downloaded
+# with a single range, up to MAX_COALESCED_RANGE bytes.
+MAX_RANGE_GAP = 16 * 1024
+MAX_COALESCED_RANGE = 8 * 1024 * 1024
+
+# Members whose compressed size is larger than SEGMENTED_THRESHOLD bytes are
+# downloaded over several connections (at most MAX_SEGMENTS, INITIAL_SEGMENTS
+# at first). Each connection downloads segments of about SEGMENT_DURATION
+# seconds, between MIN_SEGMENT_SIZE and MAX_SEGMENT_SIZE bytes. A connection
+# is added as long as the throughput of each connection stays above
+# SEGMENT_SCALING times the best one.
+SEGMENTED_THRESHOLD = 64 * 1024 * 1024
+MAX_SEGMENTS = 8
+INITIAL_SEGMENTS = 2
+SEGMENT_DURATION = 2
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_SEGMENT_SIZE = 256 * 1024 * 1024
+SEGMENT_SCALING = 0.8
+
+# Members decompressed by several processes are sent to them through shared
+# memory, at most DECOMPRESSION_MEMORY bytes of compressed data at a time.
+# Members smaller than POOL_MIN_MEMBER_SIZE bytes (compressed), which take
+# less time to decompress than to hand over, and members larger than
+# POOL_MAX_MEMBER_SIZE bytes are always decompressed while they are received.
+DECOMPRESSION_MEMORY = 256 * 1024 * 1024
+POOL_MIN_MEMBER_SIZE = 32 * 1024
+POOL_MAX_MEMBER_SIZE = 64 * 1024 * 1024
+
+# A candidate central directory file header found while resynchronizing a
+# chunk of the central directory is accepted if the lengths of RESYNC_CHAIN
+# consecutive headers lead to a signature. Central directories larger than
+# PARALLEL_PARSE_THRESHOLD bytes are parsed by several processes when asked.
+RESYNC_CHAIN = 3
+PARALLEL_PARSE_THRESHOLD = 16 * 1024 * 1024
+
+# Size of the range probes sent while bisecting the central directory of a
+# ZIP sorted by name.
+LOOKUP_PROBE_SIZE = 4 * 1024
+
+# Bytes added to the length of the extra field of the central directory to
+# estimate the one of the local file header, often longer (Info-ZIP stores
+# more timestamps in it). When the estimate is too short, the missing bytes
+# are downloaded with a follow-up request.
+LOCAL_EXTRA_FIELD_SLACK = 8
+
+# Number of ranges sent in a single request (multipart/byteranges). 1 disables
+# multi-range requests. The local file headers, much smaller, are requested
+# HEADER_RANGES_PER_REQUEST at a time when the server supports it.
+RANGES_PER_REQUEST = 1
+HEADER_RANGES_PER_REQUEST = 32
+
+# Signatures of the structures parsed by the tool.
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"\x50\x4b\x05\x06"
+CENTRAL_DIRECTORY_FILE_HEADER_SIGNATURE = b"\x50\x4b\x01\x02"
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"\x50\x4b\x06\x06"
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE = b"\x50\x4b\x06\x07"
 
-# We assume that the end of central directory record is located
-# in the last 100 bytes of the file.
-END_OF_CENTRAL_DIRECTORY_RECORD_RANGE = 100
+# Header ID of the ZIP64 extended information extra field, holding the 64-bit
+# values of the fields set to 0xffffffff (or 0xffff) in the headers.
+ZIP64_EXTRA_FIELD_ID = 0x0001
 
 # This dictionary lists platforms by version number as referenced by the URL:
 #     - https://users.cs.jmu.edu/buchhofp/forensics/formats/pkzip.html
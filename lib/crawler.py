@@ -0,0 +1,398 @@
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+import ssl
+import time
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
+
+import lib.constants as LC
+
+from lib.bootstrap import iter_bootstrap, parse_range_response
+from lib.central_directory_index import CentralDirectoryParser
+from lib.transport import REDIRECT_CODES
+
+
+# Errors raised when a kept-alive connection was closed by the server while
+# it was idle. The request is then sent again on a new connection.
+STALE_CONNECTION_ERRORS = (
+    asyncio.IncompleteReadError,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class AsyncResponse:
+    """
+    Response to a GET request sent by an AsyncSession, whose body has been
+    entirely read. It has the attributes of the Response of lib/transport.py
+    used by parse_range_response().
+    """
+
+    __slots__ = (
+        "status_code",
+        "headers",
+        "content",
+        "RequestHeaders",
+        "NewConnection",
+    )
+
+    def __init__(self, status_code, headers, content, request_headers,
+                 new_connection):
+        self.status_code = status_code
+        # http.client.HTTPMessage, case-insensitive.
+        self.headers = headers
+        self.content = content
+        self.RequestHeaders = request_headers
+        self.NewConnection = new_connection
+
+
+async def read_chunked(reader):
+    # Reads a body sent with Transfer-Encoding: chunked.
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b";")[0], 16)
+        if size == 0:
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            return b"".join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+
+
+class AsyncSession:
+    """
+    Minimal HTTP/1.1 client running on an asyncio event loop. The connections
+    are kept alive and pooled by host, and at most max_requests_per_host
+    requests are in flight to the same host at any time, the others waiting
+    for a connection to be released. Redirections are followed.
+    """
+
+    def __init__(
+        self,
+        max_requests_per_host=LC.MAX_REQUESTS_PER_HOST,
+        timeout=LC.CRAWL_TIMEOUT
+    ):
+        self.MaxRequestsPerHost = max_requests_per_host
+        self.Timeout = timeout
+        # Idle connections (reader, writer) and semaphore of each host.
+        self.Pools = {}
+        self.Semaphores = {}
+        self.SSLContext = None
+
+        self.Requests = 0
+        self.Connections = 0
+        self.BytesReceived = 0
+
+    async def open(self, key):
+        scheme, netloc = key
+        parts = urllib.parse.urlsplit(f"{scheme}://{netloc}")
+        context = None
+        if scheme == "https":
+            if self.SSLContext is None:
+                self.SSLContext = ssl.create_default_context()
+            context = self.SSLContext
+        self.Connections += 1
+        return await asyncio.open_connection(
+            parts.hostname,
+            parts.port or (443 if scheme == "https" else 80),
+            ssl=context
+        )
+
+    async def exchange(self, reader, writer, netloc, target, headers):
+        # Sends the request and reads the whole response. Returns the
+        # response and whether the connection can be reused.
+        lines = [f"GET {target} HTTP/1.1", f"Host: {netloc}"] + [
+            f"{name}: {value}" for name, value in headers.items()
+        ]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        version, status = status_line.split(None, 2)[:2]
+        status = int(status)
+        raw_headers = b""
+        while True:
+            line = await reader.readline()
+            raw_headers += line
+            if line in (b"\r\n", b"\n", b""):
+                break
+        message = http.client.parse_headers(io.BytesIO(raw_headers))
+
+        reusable = version == b"HTTP/1.1" and \
+            message.get("Connection", "").lower() != "close"
+        if status in (204, 304) or status < 200:
+            content = b""
+        elif message.get("Transfer-Encoding", "").lower() == "chunked":
+            content = await read_chunked(reader)
+        elif message.get("Content-Length") is not None:
+            content = await reader.readexactly(int(message["Content-Length"]))
+        else:
+            content = await reader.read()
+            reusable = False
+        return status, message, content, reusable
+
+    async def send(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"[x] Unsupported URL scheme: {parts.scheme}.")
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        semaphore = self.Semaphores.setdefault(
+            key,
+            asyncio.Semaphore(self.MaxRequestsPerHost)
+        )
+        async with semaphore:
+            pool = self.Pools.setdefault(key, [])
+            while True:
+                new_connection = not pool
+                if new_connection:
+                    reader, writer = await asyncio.wait_for(
+                        self.open(key),
+                        self.Timeout
+                    )
+                else:
+                    reader, writer = pool.pop()
+                try:
+                    status, message, content, reusable = \
+                        await asyncio.wait_for(
+                            self.exchange(
+                                reader,
+                                writer,
+                                parts.netloc,
+                                target,
+                                headers
+                            ),
+                            self.Timeout
+                        )
+                except STALE_CONNECTION_ERRORS:
+                    writer.close()
+                    if new_connection:
+                        raise
+                    continue
+                except:
+                    writer.close()
+                    raise
+                break
+            self.Requests += 1
+            self.BytesReceived += len(content)
+            if reusable:
+                pool.append((reader, writer))
+            else:
+                writer.close()
+        return AsyncResponse(status, message, content, headers, new_connection)
+
+    async def get(self, url, headers=None):
+        headers = dict(headers or {})
+        for _ in range(LC.MAX_REDIRECTS + 1):
+            r = await self.send(url, headers)
+            location = r.headers.get("Location")
+            if r.status_code not in REDIRECT_CODES or location is None:
+                return r
+            url = urllib.parse.urljoin(url, location)
+        raise Exception(f"[x] More than {LC.MAX_REDIRECTS} redirections.")
+
+    def close(self):
+        for pool in self.Pools.values():
+            for _, writer in pool:
+                writer.close()
+        self.Pools = {}
+
+
+def call_quietly(function, *args):
+    """
+    This function calls function(*args). The parsers print their errors and
+    exit: the message is captured and raised as an exception instead, so
+    that one broken ZIP does not stop the crawl (nor mix with the index
+    written to the standard output).
+    """
+
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            return function(*args)
+    except SystemExit:
+        raise Exception(output.getvalue().strip() or "[x] Invalid ZIP.")
+
+
+async def index_archive(session, url, length=LC.BOOTSTRAP_RANGE):
+    """
+    This function indexes the central directory of the ZIP at url, sending
+    the same requests as bootstrap() (usually a single one). Returns its
+    size, its validator, its end of central directory record, its index and
+    the number of round trips.
+    """
+
+    steps = iter_bootstrap(length)
+    request = call_quietly(next, steps)
+    while True:
+        range_header, _ = request
+        r = await session.get(url, {"Range": range_header})
+        try:
+            request = call_quietly(
+                steps.send,
+                call_quietly(parse_range_response, r)
+            )
+        except StopIteration as stop:
+            zip_size, validator, eocdr, tail, head_range, round_trips = \
+                stop.value
+            break
+
+    parser = CentralDirectoryParser()
+    if head_range is not None:
+        start, end = head_range
+        round_trips += 1
+        r = await session.get(url, {"Range": f"bytes={start}-{end}"})
+        if r.status_code != 206:
+            raise Exception(
+                f"[x] Unexpected HTTP status code: {r.status_code}."
+            )
+        call_quietly(parser.feed, r.content)
+    call_quietly(parser.feed, tail)
+    index = call_quietly(
+        parser.close,
+        eocdr.get_total_number_of_central_directory_records(0)
+    )
+    return zip_size, validator, eocdr, index, round_trips
+
+
+def get_dos_datetime(d, t):
+    # Formats the DOS date d and time t as "YYYY-MM-DD HH:MM:SS".
+    return f"{(d >> 9) + 1980:04d}-{d >> 5 & 0xf:02d}-{d & 0x1f:02d} " + \
+           f"{t >> 11:02d}:{t >> 5 & 0x3f:02d}:{(t & 0x1f) * 2:02d}"
+
+
+class IndexSink:
+    """
+    Receives the indexes as soon as they are built, while the other ZIPs are
+    still being fetched. Each ZIP is written as one JSON line to output (its
+    size, validator and entries, or the error which occurred), and its index
+    is stored in index_cache and in catalog if they are given, so that its
+    members can then be downloaded without fetching the central directory
+    again. The crawl runs write() and error() in the single thread of
+    self.Writer, so that the disk writes and the SQLite transactions do not
+    stall the requests in flight on the event loop.
+    """
+
+    def __init__(self, output, index_cache=None, entries=True, catalog=None):
+        self.Output = output
+        self.IndexCache = index_cache
+        self.Catalog = catalog
+        # If False, only the number of entries is written.
+        self.Entries = entries
+        self.Indexed = 0
+        self.Failed = 0
+        self.EntryCount = 0
+        self.RoundTrips = 0
+        self.Writer = ThreadPoolExecutor(max_workers=1)
+
+    def write(self, url, zip_size, validator, eocdr, index, round_trips):
+        self.Indexed += 1
+        self.EntryCount += len(index)
+        self.RoundTrips += round_trips
+        record = {
+            "url": url,
+            "zip_size": zip_size,
+            "validator": validator,
+            "round_trips": round_trips,
+            "entries": len(index),
+        }
+        if self.Entries:
+            record["files"] = [
+                {
+                    "name": index.get_raw_file_name(i).decode(
+                        errors="replace"
+                    ),
+                    "compressed_size": index.CompressedSizes[i],
+                    "uncompressed_size": index.UncompressedSizes[i],
+                    "method": index.CompressionMethods[i],
+                    "crc32": index.CRC32s[i],
+                    "modified": get_dos_datetime(
+                        index.FileLastModificationDates[i],
+                        index.FileLastModificationTimes[i]
+                    ),
+                }
+                for i in range(len(index))
+            ]
+        self.Output.write(json.dumps(record) + "\n")
+        self.Output.flush()
+        if self.IndexCache is not None:
+            self.IndexCache.store(url, zip_size, validator, eocdr, index)
+        if self.Catalog is not None:
+            self.Catalog.store(url, zip_size, validator, eocdr, index)
+
+    def error(self, url, error):
+        self.Failed += 1
+        message = str(error) or type(error).__name__
+        self.Output.write(json.dumps({"url": url, "error": message}) + "\n")
+        self.Output.flush()
+
+    def close(self):
+        # Waits for the indexes still being written.
+        self.Writer.shutdown()
+
+
+async def crawl(
+    urls,
+    sink,
+    concurrency=LC.CRAWL_CONCURRENCY,
+    max_requests_per_host=LC.MAX_REQUESTS_PER_HOST,
+    length=LC.BOOTSTRAP_RANGE
+):
+    """
+    This function indexes the ZIPs of urls (an iterable, read as the crawl
+    goes) with concurrency tasks sharing one AsyncSession, and passes each
+    index to sink as soon as it is built. A ZIP which can't be indexed is
+    reported to sink without stopping the others.
+    """
+
+    session = AsyncSession(max_requests_per_host)
+    urls = iter(urls)
+    loop = asyncio.get_running_loop()
+
+    async def work():
+        # The tasks take the next URL from the shared iterator. A task waits
+        # for its index to be written before fetching the next ZIP, so that
+        # the indexes don't pile up in memory when the writer falls behind.
+        for url in urls:
+            try:
+                result = await index_archive(session, url, length)
+            except Exception as error:
+                if isinstance(error, asyncio.TimeoutError):
+                    error = Exception("[x] Timeout.")
+                await loop.run_in_executor(sink.Writer, sink.error, url, error)
+            else:
+                await loop.run_in_executor(
+                    sink.Writer,
+                    sink.write,
+                    url,
+                    *result
+                )
+
+    try:
+        await asyncio.gather(*(work() for _ in range(concurrency)))
+    finally:
+        session.close()
+    return session
+
+
+def run_crawl(
+    urls,
+    sink,
+    concurrency=LC.CRAWL_CONCURRENCY,
+    max_requests_per_host=LC.MAX_REQUESTS_PER_HOST,
+    length=LC.BOOTSTRAP_RANGE
+):
+    # Runs crawl() on a new event loop and returns its duration and session.
+    begin = time.perf_counter()
+    session = asyncio.run(
+        crawl(urls, sink, concurrency, max_requests_per_host, length)
+    )
+    return time.perf_counter() - begin, session
@@ -0,0 +1,152 @@
+import os
+import sys
+import threading
+import zlib
+
+import lib.constants as LC
+
+from lib.extractor import get_decompressor, iter_decompress, preallocate
+
+
+def decompress_member(name, size, method, crc32, uncompressed_size, path):
+    """
+    This function is run by the worker processes: it attaches the shared
+    memory holding the compressed data of a member (size bytes), decompresses
+    it to path and checks its size and CRC-32. Returns the number of bytes
+    written.
+    """
+
+    from multiprocessing import resource_tracker, shared_memory
+
+    # The segment belongs to the parent, which unlinks it. Attaching it
+    # registers it to the resource tracker, shared with the parent, which
+    # would then warn about a leak and unlink it a second time: the tracker
+    # is bypassed.
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+        # Only the POSIX segments are tracked, under the name given to
+        # shm_open(), which starts with a slash.
+        if os.name == "posix":
+            resource_tracker.unregister(f"/{shm.name}", "shared_memory")
+    checksum = 0
+    written = 0
+    try:
+        view = shm.buf[:size]
+        try:
+            decompressor = get_decompressor(method)
+            with open(path, "bw") as f:
+                preallocate(f, uncompressed_size)
+                for out in iter_decompress(decompressor, view):
+                    checksum = zlib.crc32(out, checksum)
+                    written += len(out)
+                    f.write(out)
+                if hasattr(decompressor, "unconsumed_tail"):
+                    out = decompressor.flush()
+                    checksum = zlib.crc32(out, checksum)
+                    written += len(out)
+                    f.write(out)
+            if written != uncompressed_size or checksum != crc32:
+                raise Exception(
+                    f"bad CRC-32 or size ({hex(checksum)}, {written} " + \
+                    f"bytes instead of {hex(crc32)}, {uncompressed_size} " + \
+                    "bytes)"
+                )
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            view.release()
+    finally:
+        shm.close()
+    return written
+
+
+class DecompressionPool:
+    """
+    Pool of processes decompressing the members while the download threads
+    keep receiving the next ones. The compressed data of a member is copied
+    to a shared memory segment as it is received (see MemberExtractor), and
+    only the name of the segment is sent to the worker, which checks the
+    CRC-32 of the member and writes it to its output file. At most
+    max_memory bytes of compressed data are waiting in shared memory: the
+    download threads wait for the workers beyond that.
+    """
+
+    def __init__(self, processes=None, max_memory=LC.DECOMPRESSION_MEMORY):
+        # Slow to import, so only imported when members are decompressed by
+        # several processes.
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+
+        self.SharedMemory = shared_memory.SharedMemory
+        self.Processes = processes or os.cpu_count() or 1
+        self.Executor = ProcessPoolExecutor(max_workers=self.Processes)
+        # The workers are started now, before the download threads, as they
+        # are forked.
+        for future in [
+            self.Executor.submit(int) for _ in range(self.Processes)
+        ]:
+            future.result()
+        self.MaxMemory = max_memory
+        self.Pending = 0
+        self.Condition = threading.Condition()
+        # (future, name, path) of each member submitted.
+        self.Submitted = []
+
+    def allocate(self, size):
+        """
+        This function returns a shared memory segment of size bytes, waiting
+        until the members already submitted free enough memory.
+        """
+
+        with self.Condition:
+            self.Condition.wait_for(
+                lambda: self.Pending == 0 or
+                    self.Pending + size <= self.MaxMemory
+            )
+            self.Pending += size
+        return self.SharedMemory(create=True, size=max(size, 1))
+
+    def release(self, shm, size):
+        shm.close()
+        shm.unlink()
+        with self.Condition:
+            self.Pending -= size
+            self.Condition.notify_all()
+
+    def submit(self, shm, size, method, crc32, uncompressed_size, path, name):
+        # Decompresses the member name held by shm to path in a worker.
+        future = self.Executor.submit(
+            decompress_member,
+            shm.name,
+            size,
+            method,
+            crc32,
+            uncompressed_size,
+            path
+        )
+        future.add_done_callback(lambda _: self.release(shm, size))
+        self.Submitted.append((future, name, path))
+
+    def wait(self):
+        """
+        This function waits for the members submitted and returns the paths
+        of the ones which failed, along with the errors.
+        """
+
+        failed = []
+        errors = []
+        for future, name, path in self.Submitted:
+            try:
+                future.result()
+            except Exception as error:
+                failed.append(path)
+                errors.append(Exception(f"[x] {name}: {error}."))
+        self.Submitted = []
+        return failed, errors
+
+    def close(self):
+        self.Executor.shutdown()
@@ -0,0 +1,511 @@
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import lib.constants as LC
+import lib.transport as transport
+
+from lib.bootstrap import get_range_headers, get_validator
+from lib.extractor import RangeDispatcher
+from lib.local_file_header import LocalFileHeader
+from lib.range_planner import get_over_fetch, plan_header_ranges, plan_ranges
+from lib.segmented_download import download_segmented
+from lib.tracer import TRACER
+from lib.utils import get_name_parts
+
+
+CONTENT_RANGE_RE = re.compile(rb"bytes (\d+)-(\d+)/(\d+|\*)", re.IGNORECASE)
+BOUNDARY_RE = re.compile(r"boundary=\"?([^\";]+)\"?")
+
+
+class Downloader:
+    """
+    Downloads ranges of a ZIP through a single session of the selected
+    transport, so that the TCP connections are kept alive and shared between
+    the threads. Unless another session is given, it is the default session,
+    whose connection opened by the bootstrap request is reused. The number of
+    requests in flight for a given host is capped by a semaphore.
+    """
+
+    def __init__(
+        self,
+        url,
+        workers=LC.WORKERS,
+        max_requests_per_host=LC.MAX_REQUESTS_PER_HOST,
+        zip_size=0,
+        validator="",
+        session=None
+    ):
+        self.Url = url
+        # Identify the version of the ZIP the ranges are downloaded from.
+        self.ZipSize = zip_size
+        self.Validator = validator
+        self.Workers = workers
+        self.Session = session or transport.get_default_session(
+            max(workers, max_requests_per_host)
+        )
+        self.HostSemaphore = threading.BoundedSemaphore(max_requests_per_host)
+
+        # Set to False as soon as the server answers a multi-range request
+        # with something else than multipart/byteranges.
+        self.MultipartSupported = True
+
+        # Paths of the members written as ZIP fragments, as they can't be
+        # decompressed by the tool.
+        self.Fragments = []
+
+        # DecompressionPool of download_members(), if the members are
+        # decompressed by several processes.
+        self.DecompressionPool = None
+
+        self.Requests = 0
+        self.RequestsLock = threading.Lock()
+
+    def count_request(self):
+        with self.RequestsLock:
+            self.Requests += 1
+
+    def stream_range(self, start, end, callback):
+        """
+        This function downloads the bytes start to end (inclusive) of the ZIP
+        and passes them to callback(offset, datas) chunk by chunk, as they are
+        received. Returns the number of bytes received.
+        """
+
+        headers = get_range_headers(f"{start}-{end}", self.Validator)
+        received = 0
+        with self.HostSemaphore:
+            self.count_request()
+            begin = time.perf_counter()
+            with self.Session.get(
+                url=self.Url,
+                headers=headers,
+                stream=True
+            ) as r:
+                if r.status_code not in (200, 206):
+                    raise Exception(
+                        f"[x] Unexpected HTTP status code: {r.status_code}."
+                    )
+                if r.status_code == 200 and self.Validator and \
+                    get_validator(r.headers) != self.Validator:
+                    raise Exception(
+                        "[x] The ZIP changed since its index was built."
+                    )
+                # If the server ignored the range, the whole ZIP is received
+                # and the bytes before start are skipped.
+                offset = start if r.status_code == 206 else 0
+                try:
+                    for datas in r.iter_content(LC.CHUNK_SIZE):
+                        received += len(datas)
+                        if offset + len(datas) > start:
+                            callback(offset, datas)
+                        offset += len(datas)
+                        if offset > end:
+                            break
+                finally:
+                    TRACER.count_request(r, begin, end - start + 1, received)
+        return received
+
+    def stream_ranges(self, ranges, callbacks):
+        """
+        This function downloads several ranges (start, end) of the ZIP with a
+        single multi-range request. The bytes are passed chunk by chunk to
+        the callback(offset, datas) of every range they overlap, as they are
+        received, each byte only once and in order even when the server
+        answers overlapping ranges with overlapping parts. Returns the number
+        of bytes received, or None if the server does not support multi-range
+        requests.
+        """
+
+        # The ranges are only served from the version of the ZIP the index
+        # was built from.
+        headers = get_range_headers(
+            ",".join(f"{start}-{end}" for start, end in ranges),
+            self.Validator
+        )
+
+        # Offset of the next byte expected by the callback of each range.
+        expected = [start for start, _ in ranges]
+
+        def dispatch(offset, datas):
+            end = offset + len(datas) - 1
+            for k, ((_, range_end), callback) in enumerate(
+                zip(ranges, callbacks)
+            ):
+                if offset <= expected[k] <= min(end, range_end):
+                    callback(
+                        expected[k],
+                        datas[expected[k] - offset:range_end - offset + 1]
+                    )
+                    expected[k] = min(end, range_end) + 1
+
+        received = 0
+        with self.HostSemaphore:
+            self.count_request()
+            begin = time.perf_counter()
+            with self.Session.get(
+                url=self.Url,
+                headers=headers,
+                stream=True
+            ) as r:
+                content_type = r.headers.get("Content-Type", "")
+                boundary = BOUNDARY_RE.search(content_type)
+                if r.status_code != 206 or \
+                    not content_type.startswith("multipart/byteranges") or \
+                    boundary is None:
+                    # The body is dropped without being read.
+                    self.MultipartSupported = False
+                    TRACER.count_request(r, begin, 0, 0)
+                    if LC.DEBUG:
+                        print("[*] Multi-range requests are not supported.")
+                    return None
+                parser = MultipartByterangesParser(
+                    boundary.group(1).encode(),
+                    dispatch
+                )
+                try:
+                    for datas in r.iter_content(LC.CHUNK_SIZE):
+                        received += len(datas)
+                        parser.feed(datas)
+                        if parser.Done:
+                            break
+                finally:
+                    TRACER.count_request(
+                        r,
+                        begin,
+                        sum(end - start + 1 for start, end in ranges),
+                        received
+                    )
+        return received
+
+    def download_ranges(self, planned, output_directory, index):
+        """
+        This function downloads the coalesced ranges planned and extracts
+        each of their members to output_directory while they are received.
+        Returns the paths written, the errors, the number of bytes received
+        and the latency in seconds.
+        """
+
+        begin = time.perf_counter()
+        dispatchers = [
+            RangeDispatcher(
+                coalesced,
+                index,
+                output_directory,
+                self.DecompressionPool
+            )
+            for coalesced in planned
+        ]
+        received = 0
+        errors = []
+        try:
+            multipart_received = None
+            if len(planned) > 1 and self.MultipartSupported:
+                multipart_received = self.stream_ranges(
+                    [(coalesced.Start, coalesced.End) for coalesced in planned],
+                    [dispatcher.feed for dispatcher in dispatchers]
+                )
+            if multipart_received is not None:
+                received += multipart_received
+            else:
+                for coalesced, dispatcher in zip(planned, dispatchers):
+                    received += self.stream_range(
+                        coalesced.Start,
+                        coalesced.End,
+                        dispatcher.feed
+                    )
+            # The members whose local file header has a longer extra field
+            # than expected are completed.
+            for dispatcher in dispatchers:
+                received += dispatcher.resume(self.stream_range)
+        except Exception as error:
+            if not str(error).startswith("[x]"):
+                error = Exception(f"[x] {error}")
+            errors.append(error)
+
+        paths = []
+        useful = 0
+        for dispatcher in dispatchers:
+            try:
+                paths += dispatcher.close()
+            except Exception as error:
+                if not str(error).startswith("[x]"):
+                    error = Exception(f"[x] {error}")
+                errors.append(error)
+            errors += dispatcher.Errors
+            useful += dispatcher.Useful
+            self.Fragments += dispatcher.Fragments
+        latency = time.perf_counter() - begin
+        return paths, errors, received, useful, latency
+
+    def resolve_extents(
+        self,
+        index,
+        members,
+        max_gap=LC.MAX_RANGE_GAP,
+        ranges_per_request=LC.HEADER_RANGES_PER_REQUEST
+    ):
+        """
+        This function downloads the fixed part of the local file header of
+        the entries members of index, to get the length of their extra field
+        and thus the exact extent of the members. The headers close to each
+        other are downloaded together, several ranges per request if the
+        server supports it, so it only costs one round trip per batch of
+        headers. Returns the lengths by entry.
+        """
+
+        planned = plan_header_ranges(index, members, max_gap)
+        buffers = [bytearray(len(coalesced)) for coalesced in planned]
+
+        def get_callback(coalesced, buffer):
+            def callback(offset, datas):
+                start = max(coalesced.Start, offset)
+                end = min(coalesced.End, offset + len(datas) - 1)
+                buffer[start - coalesced.Start:end - coalesced.Start + 1] = \
+                    datas[start - offset:end - offset + 1]
+            return callback
+
+        callbacks = [
+            get_callback(coalesced, buffer)
+            for coalesced, buffer in zip(planned, buffers)
+        ]
+        batches = [
+            range(i, min(i + ranges_per_request, len(planned)))
+            for i in range(0, len(planned), ranges_per_request)
+        ]
+
+        def download_batch(batch):
+            if len(batch) > 1 and self.MultipartSupported and \
+                self.stream_ranges(
+                    [(planned[i].Start, planned[i].End) for i in batch],
+                    [callbacks[i] for i in batch]
+                ) is not None:
+                return
+            for i in batch:
+                self.stream_range(
+                    planned[i].Start,
+                    planned[i].End,
+                    callbacks[i]
+                )
+
+        with ThreadPoolExecutor(max_workers=self.Workers) as executor:
+            for future in [
+                executor.submit(download_batch, batch) for batch in batches
+            ]:
+                future.result()
+
+        local_extra_lengths = {}
+        for coalesced, buffer in zip(planned, buffers):
+            for i, start, _ in coalesced.Members:
+                header = LocalFileHeader(buffer, start - coalesced.Start)
+                local_extra_lengths[i] = header.ExtraFieldLength
+
+        if LC.DEBUG:
+            print(f"[*] {len(local_extra_lengths)} local file header(s) " + \
+                  f"resolved with {len(planned)} range(s)."
+            )
+
+        return local_extra_lengths
+
+    def download_members(
+        self,
+        index,
+        members,
+        output_directory,
+        max_gap=LC.MAX_RANGE_GAP,
+        ranges_per_request=LC.RANGES_PER_REQUEST,
+        segmented_threshold=LC.SEGMENTED_THRESHOLD,
+        max_segments=LC.MAX_SEGMENTS,
+        resolve_extents=False,
+        decompress_processes=1
+    ):
+        """
+        This function downloads the entries members of index concurrently
+        through a pool of self.Workers threads. Nearby members are coalesced
+        into larger ranges, which are sent ranges_per_request at a time. Each
+        member is extracted while it is received, or by a pool of
+        decompress_processes processes if there are several. Members larger
+        than segmented_threshold bytes are then downloaded one at a time,
+        each over up to max_segments connections. If resolve_extents is True,
+        the local file headers are downloaded first, so that the ranges match
+        the members exactly. Returns the paths written.
+        """
+
+        # The entries whose name is empty once sanitized, such as the "./"
+        # entry written by bsdtar, have nothing to extract.
+        members = [
+            i for i in members if get_name_parts(index.get_file_name(i))
+        ]
+
+        local_extra_lengths = {}
+        if resolve_extents:
+            with TRACER.phase("resolve_extents"):
+                local_extra_lengths = self.resolve_extents(index, members)
+
+        large = [
+            i for i in members
+            if index.CompressedSizes[i] > segmented_threshold
+        ]
+        small = [
+            i for i in members
+            if index.CompressedSizes[i] <= segmented_threshold
+        ]
+
+        planned = plan_ranges(
+            index,
+            small,
+            max_gap,
+            local_extra_lengths=local_extra_lengths
+        )
+        over_fetch = get_over_fetch(planned)
+        batches = [
+            planned[i:i + ranges_per_request]
+            for i in range(0, len(planned), ranges_per_request)
+        ]
+
+        paths = []
+        latencies = []
+        received = 0
+        wasted = 0
+        begin = time.perf_counter()
+        # Requests sent for the coalesced ranges, compared with one request
+        # per member.
+        coalesced_requests = self.Requests
+        if decompress_processes > 1 and small:
+            from lib.decompression_pool import DecompressionPool
+
+            self.DecompressionPool = DecompressionPool(decompress_processes)
+        with ThreadPoolExecutor(max_workers=self.Workers) as executor:
+            futures = {
+                executor.submit(
+                    self.download_ranges,
+                    batch,
+                    output_directory,
+                    index
+                ): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch_paths, errors, size, useful, latency = future.result()
+                for error in errors:
+                    print(error)
+                paths += batch_paths
+                latencies += [latency] * len(batch_paths)
+                received += size
+                wasted += size - useful
+                if LC.DEBUG:
+                    for path in batch_paths:
+                        print(f"[*] {path}: {latency * 1000:.1f}ms.")
+        coalesced_requests = self.Requests - coalesced_requests
+        if self.DecompressionPool is not None:
+            # The members still being decompressed are waited for.
+            failed, errors = self.DecompressionPool.wait()
+            self.DecompressionPool.close()
+            self.DecompressionPool = None
+            for error in errors:
+                print(error)
+            failed = set(failed)
+            latencies = [
+                latency for path, latency in zip(paths, latencies)
+                if path not in failed
+            ]
+            paths = [path for path in paths if path not in failed]
+
+        for i in large:
+            member_begin = time.perf_counter()
+            try:
+                path, size = download_segmented(
+                    self,
+                    index,
+                    i,
+                    output_directory,
+                    max_segments,
+                    local_extra_lengths.get(i)
+                )
+            except Exception as error:
+                print(error)
+                continue
+            latency = time.perf_counter() - member_begin
+            paths.append(path)
+            latencies.append(latency)
+            received += size
+            if LC.DEBUG:
+                print(f"[*] {path}: {latency * 1000:.1f}ms.")
+        elapsed = time.perf_counter() - begin
+
+        print(f"[*] {len(paths)}/{len(members)} member(s), {received} " + \
+              f"bytes in {elapsed:.3f}s " + \
+              f"({received / max(elapsed, 1e-9) / 1024 / 1024:.2f} MiB/s, " + \
+              f"{len(paths) / max(elapsed, 1e-9):.1f} members/s)."
+        )
+        print(f"[*] {self.Requests} request(s) for {len(members)} " + \
+              f"member(s) ({len(small) - coalesced_requests} saved by " + \
+              "coalescing), " + \
+              f"{wasted} byte(s) wasted ({over_fetch} planned in gaps)."
+        )
+        if latencies:
+            latencies.sort()
+            print("[*] Latency per member: " + \
+                  f"min {latencies[0] * 1000:.1f}ms, " + \
+                  f"median {latencies[len(latencies) // 2] * 1000:.1f}ms, " + \
+                  f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms, " + \
+                  f"max {latencies[-1] * 1000:.1f}ms."
+            )
+        return paths
+
+
+class MultipartByterangesParser:
+    """
+    Incremental parser of a multipart/byteranges body. Each part is located
+    thanks to its Content-Range header, so the boundary appearing inside the
+    data is not an issue. The data of the parts is passed to
+    callback(offset, datas) as it is received, only the headers of the parts
+    are buffered.
+    """
+
+    def __init__(self, boundary, callback):
+        self.Delimiter = b"--" + boundary
+        self.Callback = callback
+        self.Buffer = b""
+        self.Offset = 0
+        self.Remaining = 0
+        self.Done = False
+
+    def feed(self, datas):
+        if self.Remaining:
+            datas = self.feed_part(datas)
+        self.Buffer += datas
+        while not self.Done and not self.Remaining:
+            position = self.Buffer.find(self.Delimiter)
+            if position == -1:
+                # Only the end of the buffer may be the start of a delimiter.
+                self.Buffer = self.Buffer[-len(self.Delimiter):]
+                return
+            position += len(self.Delimiter)
+            if len(self.Buffer) < position + 2:
+                return
+            if self.Buffer[position:position + 2] == b"--":
+                self.Done = True
+                return
+            headers_end = self.Buffer.find(b"\r\n\r\n", position)
+            if headers_end == -1:
+                return
+            m = CONTENT_RANGE_RE.search(self.Buffer, position, headers_end)
+            if m is None:
+                raise Exception("[x] Part without Content-Range in response.")
+            self.Offset = int(m.group(1))
+            self.Remaining = int(m.group(2)) - self.Offset + 1
+            datas = self.Buffer[headers_end + 4:]
+            self.Buffer = self.feed_part(datas)
+
+    def feed_part(self, datas):
+        # Passes the data of the current part to the callback, and returns the
+        # bytes following it.
+        part = datas[:self.Remaining]
+        if part:
+            self.Callback(self.Offset, part)
+        self.Offset += len(part)
+        self.Remaining -= len(part)
+        return datas[len(part):]
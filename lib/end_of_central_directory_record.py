@@ -9,63 +9,102 @@ class EndOfCentralDirectoryRecord:
         - https://en.wikipedia.org/wiki/ZIP_(file_format)#End_of_central_directory_record_(EOCD)
     """
 
+    __slots__ = (
+        "ZipSize",
+        "NumberOfThisDisk",
+        "DiskWhereCentralDirectoryStarts",
+        "NumberOfCentralDirectoryRecordsOnThisDisk",
+        "TotalNumberOfCentralDirectoryRecords",
+        "SizeOfCentralDirectory",
+        "OffsetOfStartOfCentralDirectory",
+        "CommentLength",
+        "StructLength",
+        "Zip64",
+        "_datas",
+        "_offset",
+    )
+
     # Offset 0, Bytes 4
     EndOfCentralDirectorySignature = b"\x50\x4b\x05\x06"
 
-    # Total header length
-    StructLength = 0
+    # Fixed part of the record, from offset 0 to offset 22.
+    Struct = struct.Struct("<4s4H2IH")
 
-    def __init__(self, datas, zip_size):
+    def __init__(self, datas, zip_size, offset=0):
         """
-        This function parses the end of central directory record and calculates
-        its total length.
+        This function parses the end of central directory record located at
+        offset in datas and calculates its total length.
         """
 
         self.ZipSize = zip_size
 
         try:
-            if self.EndOfCentralDirectorySignature != datas[0:4]:
+            if len(datas) - offset < self.Struct.size:
+                raise Exception(
+                    "[x] Truncated end of central directory record."
+                )
+
+            (
+                Signature,
+                # Offset 4, Bytes 2 (0xffff for ZIP64)
+                self.NumberOfThisDisk,
+                # Offset 6, Bytes 2 (0xffff for ZIP64)
+                self.DiskWhereCentralDirectoryStarts,
+                # Offset 8, Bytes 2 (0xffff for ZIP64)
+                self.NumberOfCentralDirectoryRecordsOnThisDisk,
+                # Offset 10, Bytes 2 (0xffff for ZIP64)
+                self.TotalNumberOfCentralDirectoryRecords,
+                # Offset 12, Bytes 4 (0xffffffff for ZIP64)
+                self.SizeOfCentralDirectory,
+                # Offset 16, Bytes 4 (relative to start of archive)
+                # (0xffffffff for ZIP64)
+                self.OffsetOfStartOfCentralDirectory,
+                # Offset 20, Bytes 2 (n)
+                self.CommentLength
+            ) = self.Struct.unpack_from(datas, offset)
+
+            if self.EndOfCentralDirectorySignature != Signature:
                 raise Exception(
                     "[x] Bad signature for: End of central directory signature."
-                ) 
-
-            # Offset 4, Bytes 2 (0xffff for ZIP64)
-            self.NumberOfThisDisk = datas[4:6]
-
-            # Offset 6, Bytes 2 (0xffff for ZIP64)
-            self.DiskWhereCentralDirectoryStarts = datas[6:8]
-
-            # Offset 8, Bytes 2 (0xffff for ZIP64)
-            self.NumberOfCentralDirectoryRecordsOnThisDisk = datas[8:10]
-
-            # Offset 10, Bytes 2 (0xffff for ZIP64)
-            self.TotalNumberOfCentralDirectoryRecords = datas[10:12]
-
-            # Offset 12, Bytes 4 (0xffffffff for ZIP64)
-            self.SizeOfCentralDirectory = datas[12:16]
-
-            # Offset 16, Bytes 4 (relative to start of archive) (0xffffffff for
-            # ZIP64)
-            self.OffsetOfStartOfCentralDirectory = datas[16:20]
-
-            # Offset 20, Bytes 2 (n)
-            self.CommentLength = datas[20:22]
-            n = struct.unpack("I", self.CommentLength + b"\x00"*2)[0]
-
-            # Offset 20, Bytes n
-            self.Comment = datas[22:22+n]
+                )
 
         except Exception as error:
             print(error)
             exit(-1)
 
-        self.StructLength = 22 + n
+        # Offset 22, Bytes n
+        self.StructLength = 22 + self.CommentLength
+
+        # ZIP64 end of central directory record, set by the caller when the
+        # archive has one: its fields replace the ones of this record.
+        self.Zip64 = None
+
+        self._datas = datas
+        self._offset = offset
 
         if LC.DEBUG:
             print("[*] End of central directory record of size " + \
                  f"{hex(self.StructLength)} parsed."
             )
 
+    @property
+    def Comment(self):
+        start = self._offset + 22
+        return bytes(self._datas[start:start + self.CommentLength])
+
+    def needs_zip64(self):
+        # Tells whether a field is too small and is stored in the ZIP64 end of
+        # central directory record instead.
+        return 0xffff in (
+            self.NumberOfThisDisk,
+            self.DiskWhereCentralDirectoryStarts,
+            self.NumberOfCentralDirectoryRecordsOnThisDisk,
+            self.TotalNumberOfCentralDirectoryRecords
+        ) or 0xffffffff in (
+            self.SizeOfCentralDirectory,
+            self.OffsetOfStartOfCentralDirectory
+        )
+
     """
     Thoses functions displays the information contained in the header.
     It is based on the information referenced by the following URL:
@@ -84,10 +123,9 @@ class EndOfCentralDirectoryRecord:
 
     def get_number_of_this_disk(self):
         # Disk Number.
-        NumberOfThisDisk = struct.unpack(
-            "I",
-            self.NumberOfThisDisk + b"\x00"*2
-        )[0]
+        NumberOfThisDisk = self.NumberOfThisDisk
+        if self.Zip64 is not None:
+            NumberOfThisDisk = self.Zip64.NumberOfThisDisk
 
         if LC.DEBUG:
             print(f"\t- Number of this disk: {NumberOfThisDisk}")
@@ -96,10 +134,9 @@ class EndOfCentralDirectoryRecord:
 
     def get_disk_where_central_directory_starts(self):
         # Disk # w/cd.
-        DiskWhereCentralDirectoryStarts = struct.unpack(
-            "I",
-            self.DiskWhereCentralDirectoryStarts + b"\x00"*2
-        )[0]
+        DiskWhereCentralDirectoryStarts = self.DiskWhereCentralDirectoryStarts
+        if self.Zip64 is not None:
+            DiskWhereCentralDirectoryStarts = self.Zip64.DiskWhereCentralDirectoryStarts
 
         if LC.DEBUG:
             print("\t- Disk where central directory starts: " + \
@@ -110,10 +147,9 @@ class EndOfCentralDirectoryRecord:
 
     def get_number_of_central_directory_records_on_this_disk(self):
         # Disk entries.
-        NumberOfCentralDirectoryRecordsOnThisDisk = struct.unpack(
-            "I",
-            self.NumberOfCentralDirectoryRecordsOnThisDisk + b"\x00"*2
-        )[0]
+        NumberOfCentralDirectoryRecordsOnThisDisk = self.NumberOfCentralDirectoryRecordsOnThisDisk
+        if self.Zip64 is not None:
+            NumberOfCentralDirectoryRecordsOnThisDisk = self.Zip64.NumberOfCentralDirectoryRecordsOnThisDisk
 
         if LC.DEBUG:
             print("\t- Number of central directory records on this disk: " + \
@@ -124,10 +160,9 @@ class EndOfCentralDirectoryRecord:
 
     def get_total_number_of_central_directory_records(self, remote_call=0):
         # Total entries.
-        TotalNumberOfCentralDirectoryRecords = struct.unpack(
-            "I",
-            self.TotalNumberOfCentralDirectoryRecords + b"\x00"*2
-        )[0]
+        TotalNumberOfCentralDirectoryRecords = self.TotalNumberOfCentralDirectoryRecords
+        if self.Zip64 is not None:
+            TotalNumberOfCentralDirectoryRecords = self.Zip64.TotalNumberOfCentralDirectoryRecords
 
         if LC.DEBUG and not remote_call:
             print("\t- Total number of central directory records: " + \
@@ -138,10 +173,9 @@ class EndOfCentralDirectoryRecord:
 
     def get_size_of_central_directory(self):
         # Central directory size.
-        SizeOfCentralDirectory = struct.unpack(
-            "I",
-            self.SizeOfCentralDirectory
-        )[0]
+        SizeOfCentralDirectory = self.SizeOfCentralDirectory
+        if self.Zip64 is not None:
+            SizeOfCentralDirectory = self.Zip64.SizeOfCentralDirectory
 
         if LC.DEBUG:
             print("\t- Size of central directory: " + \
@@ -152,10 +186,9 @@ class EndOfCentralDirectoryRecord:
 
     def get_offset_of_start_of_central_directory(self):
         # Offset of cd wrt to starting.
-        OffsetOfStartOfCentralDirectory = struct.unpack(
-            "I",
-            self.OffsetOfStartOfCentralDirectory
-        )[0]
+        OffsetOfStartOfCentralDirectory = self.OffsetOfStartOfCentralDirectory
+        if self.Zip64 is not None:
+            OffsetOfStartOfCentralDirectory = self.Zip64.OffsetOfStartOfCentralDirectory
 
         if LC.DEBUG:
             print("\t- Offset of start of central directory: " + \
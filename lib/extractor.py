@@ -0,0 +1,455 @@
+import bz2
+import lzma
+import os
+import struct
+import zlib
+
+import lib.constants as LC
+
+from lib.local_file_header import LocalFileHeader
+from lib.utils import get_output_path
+
+
+# Compression methods decompressed by the tool, see LC.COMPRESSION_METHOD.
+STORED = 0
+DEFLATED = 8
+BZIP2 = 12
+LZMA = 14
+
+# Bit 0 of the general purpose bit flag: the member is encrypted.
+FLAG_ENCRYPTED = 0x1
+
+
+class LZMADecompressor:
+    """
+    LZMA members start with a small header (version and properties of the
+    LZMA1 filter) followed by a raw LZMA1 stream. This class reads the header
+    then behaves like lzma.LZMADecompressor.
+    """
+
+    def __init__(self):
+        self.Header = b""
+        self.Decompressor = None
+
+    @property
+    def eof(self):
+        return self.Decompressor is not None and self.Decompressor.eof
+
+    @property
+    def needs_input(self):
+        return self.Decompressor is None or self.Decompressor.needs_input
+
+    def decompress(self, datas, max_length=-1):
+        if self.Decompressor is None:
+            self.Header += datas
+            if len(self.Header) < 4:
+                return b""
+            properties_length = struct.unpack_from("<H", self.Header, 2)[0]
+            if len(self.Header) < 4 + properties_length:
+                return b""
+            self.Decompressor = lzma.LZMADecompressor(
+                lzma.FORMAT_RAW,
+                filters=[
+                    get_lzma1_filter(self.Header[4:4 + properties_length])
+                ]
+            )
+            datas = self.Header[4 + properties_length:]
+            self.Header = None
+        return self.Decompressor.decompress(datas, max_length)
+
+
+def get_lzma1_filter(properties):
+    # Returns the LZMA1 filter described by the 5 bytes of properties: lc, lp
+    # and pb packed in the first one ((pb * 5 + lp) * 9 + lc), then the
+    # dictionary size (little-endian).
+    if len(properties) != 5 or properties[0] >= 9 * 5 * 5:
+        raise Exception("[x] Invalid LZMA properties.")
+    pb, remainder = divmod(properties[0], 9 * 5)
+    lp, lc = divmod(remainder, 9)
+    return {
+        "id": lzma.FILTER_LZMA1,
+        "lc": lc,
+        "lp": lp,
+        "pb": pb,
+        "dict_size": struct.unpack_from("<I", properties, 1)[0]
+    }
+
+
+# Incremental decompressors of the compression methods supported, None for
+# stored members. The members compressed with another method are written as
+# ZIP fragments (see is_fragment()).
+DECOMPRESSORS = {
+    STORED: lambda: None,
+    DEFLATED: lambda: zlib.decompressobj(-15),
+    BZIP2: bz2.BZ2Decompressor,
+    LZMA: LZMADecompressor,
+}
+
+
+def get_decompressor(method):
+    # Returns the incremental decompressor of method, None for stored members.
+    if method not in DECOMPRESSORS:
+        raise Exception(
+            "[x] Unsupported compression method: " + \
+            f"{LC.COMPRESSION_METHOD.get(method, method)}."
+        )
+    return DECOMPRESSORS[method]()
+
+
+def iter_decompress(decompressor, datas, chunk_size=LC.CHUNK_SIZE):
+    """
+    This function decompresses datas and yields the result in chunks of at
+    most chunk_size bytes, so that a highly compressed input never produces a
+    large output buffer.
+    """
+
+    if decompressor is None:
+        yield datas
+        return
+
+    if hasattr(decompressor, "unconsumed_tail"):
+        out = decompressor.decompress(datas, chunk_size)
+        yield out
+        while decompressor.unconsumed_tail:
+            out = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+            yield out
+        return
+
+    if decompressor.eof:
+        return
+    out = decompressor.decompress(datas, chunk_size)
+    yield out
+    while not decompressor.eof and not decompressor.needs_input:
+        out = decompressor.decompress(b"", chunk_size)
+        yield out
+
+
+def is_fragment(index, i):
+    # Tells whether entry i of index can't be decompressed by the tool
+    # (encrypted, unsupported compression method) and is written as a ZIP
+    # fragment, data descriptor included.
+    return bool(index.GeneralPurposeBitFlags[i] & FLAG_ENCRYPTED) or \
+        index.CompressionMethods[i] not in DECOMPRESSORS
+
+
+def preallocate(f, size):
+    # Reserves size bytes on the disk for the file f, when the platform allows
+    # it, so that it does not get fragmented while it is written.
+    if size == 0:
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        pass
+
+
+class MemberExtractor:
+    """
+    Receives the bytes of a member (local file header, compressed data and
+    data descriptor) as they are downloaded, decompresses them on the fly to
+    its output file and checks its CRC-32 once complete. Members that can't be
+    decompressed (encrypted, unsupported compression method) are written as a
+    ZIP fragment instead, to be recovered with 7z. If a DecompressionPool is
+    given, the compressed data of the members of a suitable size is copied to
+    shared memory instead, and decompressed by a worker once complete.
+    """
+
+    def __init__(self, index, i, output_directory, pool=None):
+        self.Name = index.get_file_name(i)
+        self.CompressionMethod = index.CompressionMethods[i]
+        self.CompressedSize = index.CompressedSizes[i]
+        self.UncompressedSize = index.UncompressedSizes[i]
+        self.CRC32 = index.CRC32s[i]
+        self.Flags = index.GeneralPurposeBitFlags[i]
+        self.OutputDirectory = output_directory
+
+        self.Raw = is_fragment(index, i)
+        self.Path = get_output_path(
+            output_directory,
+            self.Name,
+            ".zip" if self.Raw else ""
+        )
+
+        self.Header = bytearray()
+        self.HeaderLength = None
+        # Length of the local file header and the compressed data, known once
+        # the fixed part of the local file header is parsed.
+        self.Extent = None
+        self.Remaining = self.CompressedSize
+        self.Decompressor = None
+        self.Pool = pool
+        # Shared memory segment receiving the compressed data, when it is
+        # decompressed by the pool.
+        self.Shared = None
+        self.Output = None
+        self.Checksum = 0
+        self.Written = 0
+        self.Done = False
+        self.Failed = False
+
+    def feed(self, datas):
+        # Processes the next bytes of the member.
+        if self.Done:
+            return
+
+        if self.Raw:
+            if self.Output is None:
+                self.Output = open(self.Path, "bw")
+            self.Output.write(datas)
+            return
+
+        if self.HeaderLength is None:
+            self.Header += datas
+            if len(self.Header) < LocalFileHeader.Struct.size:
+                return
+            header = LocalFileHeader(self.Header)
+            self.Extent = header.StructLength + self.CompressedSize
+            self.HeaderLength = header.StructLength
+            if len(self.Header) < self.HeaderLength:
+                self.HeaderLength = None
+                return
+            datas = bytes(self.Header[self.HeaderLength:])
+            self.Header = None
+            self.open()
+
+        datas = datas[:self.Remaining]
+        if self.Shared is not None:
+            position = self.CompressedSize - self.Remaining
+            self.Shared.buf[position:position + len(datas)] = datas
+            self.Remaining -= len(datas)
+            if self.Remaining == 0:
+                self.submit()
+            return
+        self.Remaining -= len(datas)
+        for out in iter_decompress(self.Decompressor, datas):
+            self.write(out)
+        if self.Remaining == 0:
+            self.finish()
+
+    def get_missing(self, received):
+        # Returns the number of bytes still needed once the first received
+        # bytes of the member have been fed, which happens when its local file
+        # header has a longer extra field than the central directory one.
+        if self.Done or self.Failed or self.Extent is None:
+            return 0
+        return max(self.Extent - received, 0)
+
+    def open(self):
+        if self.Name.endswith("/"):
+            os.makedirs(self.Path, exist_ok=True)
+            self.Output = None
+        elif self.Pool is not None and self.CompressionMethod != STORED and \
+            LC.POOL_MIN_MEMBER_SIZE <= self.CompressedSize <= \
+                LC.POOL_MAX_MEMBER_SIZE:
+            self.Shared = self.Pool.allocate(self.CompressedSize)
+        else:
+            self.Output = open(self.Path, "bw")
+            preallocate(self.Output, self.UncompressedSize)
+        self.Decompressor = get_decompressor(self.CompressionMethod)
+
+    def write(self, datas):
+        if not datas:
+            return
+        self.Checksum = zlib.crc32(datas, self.Checksum)
+        self.Written += len(datas)
+        if self.Output is not None:
+            self.Output.write(datas)
+
+    def submit(self):
+        # The compressed data is complete: it is decompressed by the pool,
+        # which checks the CRC-32.
+        self.Pool.submit(
+            self.Shared,
+            self.CompressedSize,
+            self.CompressionMethod,
+            self.CRC32,
+            self.UncompressedSize,
+            self.Path,
+            self.Name
+        )
+        self.Shared = None
+        self.Done = True
+
+    def finish(self):
+        if hasattr(self.Decompressor, "unconsumed_tail"):
+            self.write(self.Decompressor.flush())
+        self.Done = True
+        if self.Output is not None:
+            self.Output.close()
+            self.Output = None
+
+        if self.Written != self.UncompressedSize or \
+            self.Checksum != self.CRC32:
+            self.Failed = True
+            self.remove()
+            raise Exception(
+                f"[x] {self.Name}: bad CRC-32 or size " + \
+                f"({hex(self.Checksum)}, {self.Written} bytes instead of " + \
+                f"{hex(self.CRC32)}, {self.UncompressedSize} bytes)."
+            )
+
+    def close(self):
+        """
+        This function is called once all the bytes of the member range have
+        been received. Returns the path written.
+        """
+
+        if self.Raw:
+            if self.Output is None:
+                self.Output = open(self.Path, "bw")
+            self.Output.close()
+            self.Output = None
+            self.Done = True
+        if not self.Done:
+            self.abort()
+            raise Exception(f"[x] {self.Name}: truncated member.")
+        return self.Path
+
+    def abort(self):
+        # Drops the member after an error.
+        self.Failed = True
+        self.Done = True
+        if self.Output is not None:
+            self.Output.close()
+            self.Output = None
+        if self.Shared is not None:
+            self.Pool.release(self.Shared, self.CompressedSize)
+            self.Shared = None
+        self.remove()
+
+    def remove(self):
+        if os.path.isfile(self.Path):
+            os.remove(self.Path)
+
+
+class RangeDispatcher:
+    """
+    Routes the bytes of a CoalescedRange, received in order, to the
+    MemberExtractor of each of its members.
+    """
+
+    def __init__(self, coalesced, index, output_directory, pool=None):
+        self.Members = sorted(coalesced.Members, key=lambda member: member[1])
+        self.Index = index
+        self.OutputDirectory = output_directory
+        self.Pool = pool
+        self.Next = 0
+        self.Active = []
+        # Members whose range ended before their data: (extractor, start, end)
+        # of the missing bytes, and offset of the member.
+        self.Continuations = []
+        self.Paths = []
+        self.Fragments = []
+        self.Errors = []
+        # Number of bytes of the members themselves, as opposed to gaps and
+        # overestimated extents.
+        self.Useful = 0
+
+    def start_members(self, end):
+        # Creates the extractors of the members starting before offset end.
+        while self.Next < len(self.Members) and \
+            self.Members[self.Next][1] <= end:
+            i, start, member_end = self.Members[self.Next]
+            self.Next += 1
+            try:
+                extractor = MemberExtractor(
+                    self.Index,
+                    i,
+                    self.OutputDirectory,
+                    self.Pool
+                )
+            except Exception as error:
+                self.Errors.append(Exception(
+                    f"[x] {self.Index.get_file_name(i)}: {error}."
+                ))
+                continue
+            self.Active.append((extractor, start, member_end))
+
+    def feed(self, offset, datas):
+        # Processes datas, the bytes of the ZIP starting at offset.
+        end = offset + len(datas) - 1
+        self.start_members(end)
+
+        active = []
+        for extractor, start, member_end in self.Active:
+            if extractor.Failed:
+                continue
+            if start <= end and member_end >= offset:
+                try:
+                    extractor.feed(
+                        datas[max(start - offset, 0):member_end - offset + 1]
+                    )
+                except Exception as error:
+                    if not str(error).startswith("[x]"):
+                        error = Exception(f"[x] {extractor.Name}: {error}.")
+                    self.Errors.append(error)
+                    extractor.abort()
+                    continue
+            if member_end > end:
+                active.append((extractor, start, member_end))
+            elif extractor.get_missing(member_end - start + 1):
+                self.Continuations.append((
+                    extractor,
+                    member_end + 1,
+                    start + extractor.Extent - 1,
+                    start
+                ))
+            else:
+                self.finish_member(extractor, start, member_end)
+        self.Active = active
+
+    def finish_member(self, extractor, start, end):
+        try:
+            self.Paths.append(extractor.close())
+            if extractor.Raw:
+                self.Fragments.append(extractor.Path)
+            self.Useful += extractor.Extent if extractor.Extent is not None \
+                else end - start + 1
+        except Exception as error:
+            self.Errors.append(error)
+
+    def resume(self, stream_range):
+        """
+        This function downloads the end of the members whose range ended too
+        early with stream_range(start, end, callback), and finishes them.
+        Returns the number of bytes received.
+        """
+
+        received = 0
+        for extractor, start, end, member_start in self.Continuations:
+            if LC.DEBUG:
+                print(f"[*] {extractor.Name}: {end - start + 1} missing " + \
+                      "byte(s) downloaded."
+                )
+
+            def feed(offset, datas):
+                extractor.feed(datas[max(start - offset, 0):end - offset + 1])
+
+            try:
+                received += stream_range(start, end, feed)
+            except Exception as error:
+                if not str(error).startswith("[x]"):
+                    error = Exception(f"[x] {extractor.Name}: {error}.")
+                self.Errors.append(error)
+                extractor.abort()
+                continue
+            self.finish_member(extractor, member_start, end)
+        self.Continuations = []
+        return received
+
+    def close(self):
+        """
+        This function is called once the whole range has been received (or
+        the transfer failed). The members not complete are reported as
+        truncated. Returns the paths written.
+        """
+
+        self.start_members(float("inf"))
+        for extractor, start, end in self.Active:
+            if not extractor.Failed:
+                self.finish_member(extractor, start, end)
+        for extractor, _, end, start in self.Continuations:
+            self.finish_member(extractor, start, end)
+        self.Active = []
+        self.Continuations = []
+        return self.Paths
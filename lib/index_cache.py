@@ -0,0 +1,246 @@
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+import lib.constants as LC
+
+from lib.central_directory_index import CentralDirectoryIndex
+from lib.end_of_central_directory_record import EndOfCentralDirectoryRecord
+from lib.zip64_end_of_central_directory_record import (
+    Zip64EndOfCentralDirectoryRecord
+)
+
+
+class CachedIndex:
+    """
+    Entry of the index cache: everything main() needs to go straight to the
+    member selection.
+    """
+
+    def __init__(self, url, zip_size, validator, eocdr, index):
+        self.Url = url
+        self.ZipSize = zip_size
+        self.Validator = validator
+        self.EndOfCentralDirectoryRecord = eocdr
+        self.Index = index
+
+
+class IndexCache:
+    """
+    On-disk cache of parsed central directories. Each ZIP gets its own file,
+    named after the hash of its URL, laid out as follows (little endian):
+        - header (HeaderStruct): magic, format version, lengths of the URL,
+          validator and end of central directory record, ZIP size, number of
+          entries and length of the name blob
+        - URL, validator and end of central directory record (followed by
+          the ZIP64 end of central directory record, if any)
+        - one section per column of CentralDirectoryIndex
+        - name blob
+    Every section starts on an 8-byte boundary, so that the columns can be
+    used straight from the memory-mapped file. The least recently used
+    entries are evicted once the cache grows over max_size bytes.
+    """
+
+    Magic = b"RZFI"
+    Version = 2
+    HeaderStruct = struct.Struct("<4s4HQQQ")
+
+    def __init__(self, directory=LC.CACHE_DIRECTORY, max_size=LC.CACHE_SIZE):
+        self.Directory = directory
+        self.MaxSize = max_size
+
+    def get_path(self, url):
+        return os.path.join(
+            self.Directory,
+            hashlib.sha256(url.encode()).hexdigest() + ".idx"
+        )
+
+    def load(self, url):
+        """
+        This function returns the CachedIndex of url, or None if it is not
+        cached (or if its file is unreadable).
+        """
+
+        path = self.get_path(url)
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            cached = self.decode(mm)
+        except (OSError, ValueError, struct.error):
+            return None
+        if cached is None or cached.Url != url:
+            return None
+
+        # The modification time keeps track of the last use (LRU).
+        os.utime(path)
+
+        if LC.DEBUG:
+            print(f"[*] Index of {len(cached.Index)} entries loaded from " + \
+                  f"{path}."
+            )
+
+        return cached
+
+    def decode(self, mm):
+        view = memoryview(mm)
+        (
+            magic, version, url_length, validator_length, eocdr_length,
+            zip_size, entries, names_length
+        ) = self.HeaderStruct.unpack_from(view, 0)
+        if magic != self.Magic or version != self.Version:
+            return None
+
+        start = self.HeaderStruct.size
+        url = bytes(view[start:start + url_length]).decode()
+        start += url_length
+        validator = bytes(view[start:start + validator_length]).decode()
+        start += validator_length
+        raw_eocdr = bytes(view[start:start + eocdr_length])
+        eocdr = EndOfCentralDirectoryRecord(raw_eocdr, zip_size)
+        if eocdr_length > eocdr.Struct.size:
+            eocdr.Zip64 = Zip64EndOfCentralDirectoryRecord(
+                raw_eocdr,
+                eocdr.Struct.size
+            )
+        start = align(start + eocdr_length)
+
+        index = CentralDirectoryIndex()
+        for column in index.Columns:
+            itemsize = getattr(index, column).itemsize
+            typecode = getattr(index, column).typecode
+            count = entries + 1 if column == "NameOffsets" else entries
+            end = start + count * itemsize
+            if end > len(view):
+                raise ValueError("Truncated index cache entry.")
+            setattr(index, column, view[start:end].cast(typecode))
+            start = align(end)
+        if start + names_length > len(view):
+            raise ValueError("Truncated index cache entry.")
+        index.Names = view[start:start + names_length]
+
+        return CachedIndex(url, zip_size, validator, eocdr, index)
+
+    def store(self, url, zip_size, validator, eocdr, index):
+        """
+        This function writes the index of url to the cache, then evicts the
+        least recently used entries if the cache is too large.
+        """
+
+        os.makedirs(self.Directory, exist_ok=True)
+        path = self.get_path(url)
+        raw_url = url.encode()
+        raw_validator = validator.encode()
+        raw_eocdr = eocdr.Struct.pack(
+            eocdr.EndOfCentralDirectorySignature,
+            eocdr.NumberOfThisDisk,
+            eocdr.DiskWhereCentralDirectoryStarts,
+            eocdr.NumberOfCentralDirectoryRecordsOnThisDisk,
+            eocdr.TotalNumberOfCentralDirectoryRecords,
+            eocdr.SizeOfCentralDirectory,
+            eocdr.OffsetOfStartOfCentralDirectory,
+            0
+        )
+        if eocdr.Zip64 is not None:
+            raw_eocdr += eocdr.Zip64.pack()
+
+        # The file is written next to its final location then renamed, so a
+        # concurrent run never reads a partially written entry.
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(self.HeaderStruct.pack(
+                self.Magic, self.Version, len(raw_url), len(raw_validator),
+                len(raw_eocdr), zip_size, len(index), len(index.Names)
+            ))
+            f.write(raw_url)
+            f.write(raw_validator)
+            f.write(raw_eocdr)
+            pad(f)
+            for column in index.Columns:
+                f.write(getattr(index, column))
+                pad(f)
+            f.write(index.Names)
+        os.replace(temporary_path, path)
+
+        if LC.DEBUG:
+            print(f"[*] Index of {len(index)} entries stored in {path}.")
+
+        self.prune()
+
+    def get_entries(self):
+        """
+        This function returns (path, size, last use) for every cached entry,
+        from the most to the least recently used.
+        """
+
+        entries = []
+        if not os.path.isdir(self.Directory):
+            return entries
+        for name in os.listdir(self.Directory):
+            if not name.endswith(".idx"):
+                continue
+            path = os.path.join(self.Directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        entries.sort(key=lambda entry: entry[2], reverse=True)
+        return entries
+
+    def prune(self, max_size=None):
+        """
+        This function removes the least recently used entries until the cache
+        uses at most max_size bytes (defaults to the cache budget). Returns
+        the number of entries removed.
+        """
+
+        if max_size is None:
+            max_size = self.MaxSize
+        removed = 0
+        total = 0
+        for path, size, _ in self.get_entries():
+            total += size
+            if total > max_size:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def inspect(self):
+        # Prints the content of the cache.
+        entries = self.get_entries()
+        total = 0
+        for path, size, last_use in entries:
+            total += size
+            try:
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                cached = self.decode(mm)
+            except (OSError, ValueError, struct.error):
+                cached = None
+            if cached is None:
+                print(f"\t- {path}: unreadable entry")
+                continue
+            print(f"\t- {cached.Url}")
+            print(f"\t    - Entries: {len(cached.Index)}")
+            print(f"\t    - ZIP size: {hex(cached.ZipSize)} bytes")
+            print(f"\t    - Validator: {cached.Validator or 'none'}")
+            print(f"\t    - Cache size: {size} bytes")
+            print("\t    - Last use: " + \
+                  time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_use))
+            )
+        print(f"[*] {len(entries)} cached index(es), {total} bytes " + \
+              f"(budget: {self.MaxSize} bytes)."
+        )
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def pad(f):
+    f.write(b"\x00" * (align(f.tell()) - f.tell()))
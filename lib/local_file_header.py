@@ -0,0 +1,116 @@
+import struct
+
+import lib.constants as LC
+
+
+class LocalFileHeader:
+    """
+    The contents of the sctrucure are described by the following URL:
+        - https://en.wikipedia.org/wiki/ZIP_(file_format)#Local_file_header
+    """
+
+    __slots__ = (
+        "VersionNeededToExtract",
+        "GeneralPurposeBitFlag",
+        "CompressionMethod",
+        "FileLastModificationTime",
+        "FileLastModificationDate",
+        "CRC32OfUncompressedData",
+        "CompressedSize",
+        "UncompressedSize",
+        "FileNameLength",
+        "ExtraFieldLength",
+        "StructLength",
+    )
+
+    # Offset 0, Bytes 4
+    LocalFileHeaderSignature = b"\x50\x4b\x03\x04"
+
+    # Fixed part of the header, from offset 0 to offset 30.
+    Struct = struct.Struct("<4s5H3I2H")
+
+    def __init__(self, datas, offset=0):
+        """
+        This function parses the local file header located at offset in datas
+        and calculates its total length. Contrary to the other structures, an
+        exception is raised if the header is invalid, as it is parsed while
+        other members are still being downloaded.
+        """
+
+        if len(datas) - offset < self.Struct.size:
+            raise Exception("[x] Truncated local file header.")
+
+        (
+            Signature,
+            # Offset 4, Bytes 2
+            self.VersionNeededToExtract,
+            # Offset 6, Bytes 2
+            self.GeneralPurposeBitFlag,
+            # Offset 8, Bytes 2
+            self.CompressionMethod,
+            # Offset 10, Bytes 2
+            self.FileLastModificationTime,
+            # Offset 12, Bytes 2
+            self.FileLastModificationDate,
+            # Offset 14, Bytes 4 (0 if a data descriptor follows the data)
+            self.CRC32OfUncompressedData,
+            # Offset 18, Bytes 4 (0 if a data descriptor follows the data)
+            self.CompressedSize,
+            # Offset 22, Bytes 4 (0 if a data descriptor follows the data)
+            self.UncompressedSize,
+            # Offset 26, Bytes 2 (n)
+            self.FileNameLength,
+            # Offset 28, Bytes 2 (m)
+            self.ExtraFieldLength
+        ) = self.Struct.unpack_from(datas, offset)
+
+        if self.LocalFileHeaderSignature != Signature:
+            raise Exception(
+                "[x] Bad signature for: Local file header signature."
+            )
+
+        # Offset 30, Bytes n
+        # Offset 30+n, Bytes m
+        self.StructLength = 30 + self.FileNameLength + self.ExtraFieldLength
+
+        if LC.DEBUG:
+            print("[*] Local file header of size " + \
+                 f"{hex(self.StructLength)} parsed."
+            )
+
+    def get_flags(self):
+        # Flags (most significant bit first).
+        GeneralPurposeBitFlag = f"{self.GeneralPurposeBitFlag:016b}"
+
+        if LC.DEBUG:
+            print(f"\t- General purpose bit flag: {GeneralPurposeBitFlag}")
+
+        return GeneralPurposeBitFlag
+
+    def get_compression_method(self):
+        # Compression method.
+        CompressionMethod = self.CompressionMethod
+
+        if LC.DEBUG:
+            compression = LC.COMPRESSION_METHOD.get(CompressionMethod, "")
+            print(f"\t- Compression method: {compression}")
+
+        return CompressionMethod
+
+    def get_file_name_length(self):
+        # File name length.
+        FileNameLength = self.FileNameLength
+
+        if LC.DEBUG:
+            print(f"\t- File name length: {FileNameLength}")
+
+        return FileNameLength
+
+    def get_extra_field_length(self):
+        # Extra field length.
+        ExtraFieldLength = self.ExtraFieldLength
+
+        if LC.DEBUG:
+            print(f"\t- Extra field length: {ExtraFieldLength}")
+
+        return ExtraFieldLength
@@ -0,0 +1,172 @@
+import array
+import os
+
+import lib.constants as LC
+
+from lib.central_directory_file_header import CentralDirectoryFileHeader
+from lib.central_directory_index import (
+    CentralDirectoryIndex,
+    check_central_directory,
+    parse_records
+)
+
+
+def is_record_start(view, position, chain=LC.RESYNC_CHAIN, truncated=False):
+    """
+    This function tells whether a central directory file header starts at
+    position: a signature must be found there, and the lengths declared by
+    this header (and the chain - 1 following ones) must lead exactly to
+    another signature or to the end of the central directory. If truncated is
+    True, view is only a window of the central directory and the headers
+    following the first one may run past its end.
+    """
+
+    size = len(view)
+    unpack_from = CentralDirectoryFileHeader.Struct.unpack_from
+    header_size = CentralDirectoryFileHeader.Struct.size
+    signature = LC.CENTRAL_DIRECTORY_FILE_HEADER_SIGNATURE
+
+    for link in range(chain):
+        if position == size:
+            return True
+        if position + header_size > size:
+            return truncated and link > 0
+        fields = unpack_from(view, position)
+        if fields[0] != signature:
+            return False
+        position += header_size + fields[10] + fields[11] + fields[12]
+    return position <= size or truncated
+
+
+def parse_chunk(name, size, start, end):
+    """
+    This function is run by the worker processes: it attaches the shared
+    memory holding the central directory, resynchronizes on the first header
+    of its chunk (start to end) and parses the headers starting in it.
+    Returns the offset of the first header, the offset following the last
+    one, whether the end of the central directory was found, and the columns
+    parsed.
+    """
+
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        view = shm.buf[:size]
+        first = start if start == 0 else find_record_start(view, start, end)
+        index = CentralDirectoryIndex()
+        last, stopped = parse_records(index, view, first, 0, end)
+        view.release()
+    finally:
+        shm.close()
+
+    columns = {column: getattr(index, column).tobytes() for column in index.Columns}
+    return first, last, stopped, columns, bytes(index.Names)
+
+
+def find_record_start(view, start, end, truncated=False):
+    """
+    This function resynchronizes on the first central directory file header
+    starting between start and end, as the bytes of a file name or of an
+    extra field may look like a signature. Returns end if there is none.
+    """
+
+    signature = LC.CENTRAL_DIRECTORY_FILE_HEADER_SIGNATURE
+    window = bytes(view[start:min(end + 3, len(view))])
+    position = window.find(signature)
+    while position != -1 and start + position < end:
+        if is_record_start(view, start + position, truncated=truncated):
+            return start + position
+        position = window.find(signature, position + 1)
+    return end
+
+
+def append_chunk(index, columns, names):
+    # Appends the columns parsed by a worker to index.
+    base = len(index.Names)
+    for column in index.Columns:
+        if column == "NameOffsets":
+            continue
+        getattr(index, column).frombytes(columns[column])
+    name_offsets = array.array("Q")
+    name_offsets.frombytes(columns["NameOffsets"])
+    index.NameOffsets.extend(offset + base for offset in name_offsets[1:])
+    index.Names += names
+
+
+def parse_central_directory_parallel(datas, expected=None, processes=None):
+    """
+    This function builds the same index as parse_central_directory(), but
+    the central directory is split into chunks parsed by a pool of processes,
+    which read it from shared memory. The chunks are stitched back in order:
+    if a worker resynchronized on a header which doesn't follow exactly the
+    last header of the previous chunk, the gap is parsed again sequentially.
+    """
+
+    # Slow to import, so only imported when a central directory is large
+    # enough to be parsed by several processes.
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    size = len(datas)
+    chunk_size = max(
+        -(-size // processes),
+        CentralDirectoryFileHeader.Struct.size
+    )
+    bounds = [
+        (start, min(start + chunk_size, size))
+        for start in range(0, size, chunk_size)
+    ]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        shm.buf[:size] = datas
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(parse_chunk, shm.name, size, start, end)
+                for start, end in bounds
+            ]
+            results = [future.result() for future in futures]
+
+        index = CentralDirectoryIndex()
+        view = shm.buf[:size]
+        position = 0
+        stopped = False
+        for (start, end), (first, last, chunk_stopped, columns, names) in \
+            zip(bounds, results):
+            if stopped:
+                break
+            if first != position:
+                # The previous chunk ended elsewhere than where this one
+                # resynchronized: this chunk is parsed again from the right
+                # offset.
+                if LC.DEBUG:
+                    print(f"[*] Chunk at {hex(start)} parsed again from " + \
+                          f"{hex(position)}."
+                    )
+                position, stopped = parse_records(
+                    index,
+                    view,
+                    position,
+                    0,
+                    max(end, position + 1)
+                )
+                continue
+            append_chunk(index, columns, names)
+            position, stopped = last, chunk_stopped
+        view.release()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # The RecordOffsets of the workers are already relative to the start of
+    # the central directory.
+    check_central_directory(
+        index,
+        position,
+        0 if stopped else size - position,
+        expected
+    )
+    return index
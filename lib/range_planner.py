@@ -0,0 +1,113 @@
+import lib.constants as LC
+
+from lib.extractor import is_fragment
+from lib.local_file_header import LocalFileHeader
+
+
+class CoalescedRange:
+    """
+    Range (Start to End, both inclusive) of the ZIP covering the ranges of
+    several members. Members lists (entry, start, end) for each of them.
+    """
+
+    def __init__(self, start, end):
+        self.Start = start
+        self.End = end
+        self.Members = []
+
+    def __len__(self):
+        return self.End - self.Start + 1
+
+
+def coalesce_ranges(ranges, max_gap, max_size):
+    """
+    This function merges the ranges (start, end, entry), sorted by start,
+    separated by less than max_gap bytes, as long as the merged range stays
+    under max_size bytes. Overlapping ranges are always merged, whatever the
+    size, so that the ranges returned are disjoint. A range larger than
+    max_size is never split. Returns the list of CoalescedRange.
+    """
+
+    planned = []
+    for start, end, i in ranges:
+        current = planned[-1] if planned else None
+        if current is not None and (
+            start <= current.End or
+            start - current.End - 1 <= max_gap and
+            end - current.Start + 1 <= max_size
+        ):
+            current.End = max(current.End, end)
+        else:
+            current = CoalescedRange(start, end)
+            planned.append(current)
+        current.Members.append((i, start, end))
+    return planned
+
+
+def plan_ranges(
+    index,
+    members,
+    max_gap=LC.MAX_RANGE_GAP,
+    max_size=LC.MAX_COALESCED_RANGE,
+    local_extra_lengths=None
+):
+    """
+    This function sorts the entries members of index by offset of their local
+    file header and coalesces their ranges. The lengths of the extra fields of
+    the local file headers resolved beforehand (local_extra_lengths, by
+    entry) give the exact extent of the members. The data descriptors are
+    only downloaded for the members written as ZIP fragments. Returns the
+    list of CoalescedRange.
+    """
+
+    if local_extra_lengths is None:
+        local_extra_lengths = {}
+    ranges = sorted(
+        index.get_member_range(
+            i,
+            local_extra_lengths.get(i),
+            is_fragment(index, i)
+        ) + (i,)
+        for i in members
+    )
+    planned = coalesce_ranges(ranges, max_gap, max_size)
+
+    if LC.DEBUG:
+        print(f"[*] {len(ranges)} member range(s) coalesced into " + \
+              f"{len(planned)} range(s)."
+        )
+
+    return planned
+
+
+def plan_header_ranges(index, members, max_gap=LC.MAX_RANGE_GAP):
+    """
+    This function coalesces the ranges of the fixed part of the local file
+    header of the entries members of index, which gives the length of their
+    extra field. Returns the list of CoalescedRange.
+    """
+
+    size = LocalFileHeader.Struct.size
+    ranges = sorted(
+        (index.LocalHeaderOffsets[i], index.LocalHeaderOffsets[i] + size - 1, i)
+        for i in members
+    )
+    return coalesce_ranges(ranges, max_gap, LC.MAX_COALESCED_RANGE)
+
+
+def get_over_fetch(planned):
+    """
+    This function returns the number of bytes downloaded in addition to the
+    members themselves (the gaps merged into the ranges).
+    """
+
+    over_fetch = 0
+    for coalesced in planned:
+        covered = 0
+        end = coalesced.Start - 1
+        for _, start, member_end in sorted(coalesced.Members, key=lambda m: m[1]):
+            if member_end > end:
+                covered += member_end - max(start, end + 1) + 1
+                end = member_end
+        over_fetch += len(coalesced) - covered
+    return over_fetch
@@ -0,0 +1,167 @@
+import time
+
+import lib.constants as LC
+import lib.transport as transport
+
+from lib.bootstrap import get_range_headers
+from lib.central_directory_index import CentralDirectoryIndex, parse_records
+from lib.parallel_parser import find_record_start
+from lib.tracer import TRACER
+
+
+class RemoteLookup:
+    """
+    Looks up members of a ZIP whose central directory is sorted by name
+    without downloading the whole central directory: it is bisected with
+    small range probes, each one resynchronizing on the next central
+    directory file header. One member is found in about log2(n) requests.
+    The bytes of the central directory already downloaded by the bootstrap
+    (known, starting at offset known_start in the ZIP) are used as a free
+    first probe. Sorted is set to False as soon as two names are found out of
+    order, in which case the lookup gives up.
+    """
+
+    def __init__(
+        self,
+        url,
+        eocdr,
+        known_start,
+        known,
+        probe_size=LC.LOOKUP_PROBE_SIZE,
+        validator=""
+    ):
+        self.Url = url
+        self.Validator = validator
+        self.Session = transport
+        # Range of the central directory in the ZIP, end excluded.
+        self.Start = eocdr.get_offset_of_start_of_central_directory()
+        self.End = self.Start + eocdr.get_size_of_central_directory()
+        self.KnownStart = max(known_start, self.Start)
+        self.Known = known
+        self.ProbeSize = probe_size
+        self.RoundTrips = 0
+        self.Sorted = True
+
+    def fetch(self, start, end):
+        # Returns the bytes of the ZIP from start to end (excluded).
+        if start >= self.KnownStart:
+            return self.Known[start - self.KnownStart:end - self.KnownStart]
+
+        headers = get_range_headers(f"{start}-{end - 1}", self.Validator)
+        self.RoundTrips += 1
+        begin = time.perf_counter()
+        r = self.Session.get(url=self.Url, headers=headers)
+        TRACER.count_request(r, begin, end - start, len(r.content))
+        if r.status_code != 206:
+            print(f"[x] Unexpected HTTP status code: {r.status_code}.")
+            exit(-1)
+        return r.content
+
+    def probe(self, position, limit):
+        """
+        This function indexes the complete headers found from the first
+        header starting between position and limit (excluded), up to limit.
+        The window is enlarged until a header fits in it. Returns the offset
+        of the first header, the index of the headers and the offset following
+        the last one, or None if no header starts between position and limit.
+        """
+
+        size = self.ProbeSize
+        while True:
+            end = min(position + size, self.End)
+            view = memoryview(self.fetch(position, end))
+            bound = min(end, limit) - position
+            first = find_record_start(view, 0, bound, end < self.End)
+            if first != bound:
+                index = CentralDirectoryIndex()
+                last, _ = parse_records(
+                    index,
+                    view,
+                    first,
+                    position - self.Start,
+                    limit - position
+                )
+                if len(index):
+                    return position + first, index, position + last
+            elif end >= limit:
+                return None
+            if end == self.End:
+                return None
+            size *= 2
+
+    def check_order(self, names, low, high):
+        # Checks that names are sorted and between low and high (if known).
+        bounded = ([low] if low is not None else []) + names + \
+            ([high] if high is not None else [])
+        if any(a > b for a, b in zip(bounded, bounded[1:])):
+            self.Sorted = False
+        return self.Sorted
+
+    def lookup(self, name):
+        """
+        This function returns the entry named name (raw bytes), as an index of
+        the headers around it and its position in this index, or None if it
+        does not exist or if the central directory turns out not to be sorted.
+        The headers before low all have a smaller name, those from high a
+        larger one, and no header starts between limit and high.
+        """
+
+        low, high, limit = self.Start, self.End, self.End
+        low_name = high_name = None
+        position = self.KnownStart if self.KnownStart < self.End else None
+        while low < high:
+            if position is None and limit - low <= self.ProbeSize:
+                # The remaining headers are indexed with a single request.
+                index = CentralDirectoryIndex()
+                parse_records(
+                    index,
+                    memoryview(self.fetch(low, high)),
+                    0,
+                    low - self.Start
+                )
+                window = (low, index, high)
+            else:
+                if position is None:
+                    position = low + (limit - low) // 2
+                window = self.probe(position, limit)
+                if window is None:
+                    limit = position
+                    position = None
+                    continue
+            position = None
+
+            first, index, last = window
+            names = [index.get_raw_file_name(i) for i in range(len(index))]
+            if not names or not self.check_order(names, low_name, high_name):
+                return None
+            if name < names[0]:
+                high = limit = first
+                high_name = names[0]
+            elif name > names[-1]:
+                low = last
+                limit = max(limit, low)
+                low_name = names[-1]
+            else:
+                if name in names:
+                    return index, names.index(name)
+                return None
+        return None
+
+    def lookup_all(self, names):
+        """
+        This function looks up each raw name of names and returns an index of
+        the entries found, or None if one of them can't be found this way.
+        """
+
+        result = CentralDirectoryIndex()
+        for name in sorted(names):
+            found = self.lookup(name)
+            if found is None:
+                return None
+            index, i = found
+            for column in index.Columns:
+                if column != "NameOffsets":
+                    getattr(result, column).append(getattr(index, column)[i])
+            result.Names += index.get_raw_file_name(i)
+            result.NameOffsets.append(len(result.Names))
+        return result
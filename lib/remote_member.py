@@ -0,0 +1,715 @@
+import bisect
+import hashlib
+import io
+import os
+import struct
+import time
+import zlib
+
+from collections import OrderedDict
+
+import lib.constants as LC
+
+from lib.extractor import (
+    DEFLATED, FLAG_ENCRYPTED, STORED, get_decompressor, iter_decompress
+)
+from lib.local_file_header import LocalFileHeader
+from lib.utils import get_output_path
+
+
+# Size of the history needed to decompress a deflate block (32 KiB).
+WINDOW_SIZE = 32 * 1024
+
+# Number of compressed bytes fed at once to the zlib decompressor of a block.
+INFLATE_CHUNK_SIZE = 4 * 1024
+
+
+class RangeReader:
+    """
+    Reads the bytes start to end (inclusive) of a ZIP through a Downloader, in
+    blocks of block_size bytes of which the cached_blocks most recently used
+    are kept (LRU). A missing block is requested along with the next ones
+    when the reads are sequential: the number of blocks requested at once
+    doubles on every sequential miss, up to read_ahead, and falls back to 1
+    on a random access.
+    """
+
+    def __init__(
+        self,
+        downloader,
+        start,
+        end,
+        block_size=LC.MEMBER_BLOCK_SIZE,
+        cached_blocks=LC.MEMBER_CACHED_BLOCKS,
+        read_ahead=LC.MEMBER_READ_AHEAD
+    ):
+        self.Downloader = downloader
+        self.Start = start
+        self.End = end
+        self.BlockSize = block_size
+        self.CachedBlocks = cached_blocks
+        self.MaxReadAhead = read_ahead
+        self.ReadAhead = 1
+        # Block following the last one requested.
+        self.NextBlock = None
+        self.Blocks = OrderedDict()
+
+        self.Requests = 0
+        self.Received = 0
+
+    def get_block(self, n, needed=1):
+        # Returns block n, requesting it along with the needed - 1 next ones
+        # (and the read-ahead) if it isn't cached.
+        block = self.Blocks.get(n)
+        if block is not None:
+            self.Blocks.move_to_end(n)
+            return block
+
+        if n == self.NextBlock:
+            self.ReadAhead = min(self.ReadAhead * 2, self.MaxReadAhead)
+        else:
+            self.ReadAhead = 1
+        wanted = min(max(needed, self.ReadAhead), self.CachedBlocks)
+        count = 1
+        while count < wanted and n + count not in self.Blocks:
+            count += 1
+        start = self.Start + n * self.BlockSize
+        end = min(start + count * self.BlockSize - 1, self.End)
+        if end < start:
+            return b""
+        buffer = bytearray(end - start + 1)
+
+        def write(offset, datas):
+            datas = datas[max(start - offset, 0):end - offset + 1]
+            position = max(offset, start) - start
+            buffer[position:position + len(datas)] = datas
+
+        self.Received += self.Downloader.stream_range(start, end, write)
+        self.Requests += 1
+        self.NextBlock = n + count
+
+        for i in range(count):
+            self.Blocks[n + i] = bytes(
+                buffer[i * self.BlockSize:(i + 1) * self.BlockSize]
+            )
+            self.Blocks.move_to_end(n + i)
+        while len(self.Blocks) > self.CachedBlocks:
+            self.Blocks.popitem(last=False)
+        return self.Blocks[n]
+
+    def read(self, offset, length):
+        # Returns length bytes from offset (relative to self.Start), fewer
+        # past self.End.
+        chunks = []
+        while length > 0:
+            n, position = divmod(offset, self.BlockSize)
+            block = self.get_block(
+                n,
+                (offset + length - 1) // self.BlockSize - n + 1
+            )
+            chunk = block[position:position + length]
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+            length -= len(chunk)
+        return b"".join(chunks)
+
+
+class BlockInflater:
+    """
+    Decompresses a raw deflate stream one block at a time, from the start of
+    any block given its offset in bits and the 32 KiB of data decompressed
+    before it (the window), like zran.c of the zlib examples. zlib can
+    neither start at a bit offset nor stop at the end of a block, so:
+        - the compressed data is shifted so that the block starts on a byte
+          boundary, and its BFINAL bit is set so that zlib stops at its end.
+          unused_data then tells the byte where the block ends, or the next
+          one (zlib may have loaded it);
+        - the bit where the block ends is found by flipping the bits after a
+          candidate end in these two bytes: zlib decodes the same block only
+          if it didn't need them. The last chunks are decoded again from a
+          copy() of the decompressor, so it only costs a few KiB;
+        - stored blocks are copied without zlib, as their data is aligned on
+          the bytes of the unshifted stream.
+    read(offset, length) returns the compressed bytes of the stream.
+    """
+
+    def __init__(self, read, bit=0, window=b""):
+        self.Read = read
+        self.Bit = bit
+        self.Window = window
+        # True once the final block of the stream has been decompressed.
+        self.Last = False
+
+    def iter_shifted(self):
+        # Yields the compressed data from self.Bit on, shifted to start on a
+        # byte boundary.
+        position, shift = divmod(self.Bit, 8)
+        while True:
+            datas = self.Read(position, INFLATE_CHUNK_SIZE + 1)
+            if not datas:
+                return
+            shifted = (int.from_bytes(datas, "little") >> shift).to_bytes(
+                len(datas),
+                "little"
+            )
+            if len(datas) > INFLATE_CHUNK_SIZE:
+                shifted = shifted[:INFLATE_CHUNK_SIZE]
+            yield shifted
+            position += INFLATE_CHUNK_SIZE
+
+    def next_block(self):
+        """
+        This function decompresses the block starting at self.Bit and returns
+        its data. self.Bit then points to the next block.
+        """
+
+        header = self.Read(self.Bit // 8, 2)
+        if not header:
+            raise Exception("[x] Truncated deflate stream.")
+        header = int.from_bytes(header, "little") >> (self.Bit % 8)
+        if header & 0b110 == 0:
+            out = self.copy_stored_block()
+        else:
+            out = self.inflate_block()
+        self.Last = bool(header & 1)
+        self.Window = (self.Window + out)[-WINDOW_SIZE:]
+        return out
+
+    def copy_stored_block(self):
+        # The length and its complement follow the 3 bits of the header, on
+        # the next byte boundary.
+        position = (self.Bit + 3 + 7) // 8
+        lengths = self.Read(position, 4)
+        if len(lengths) < 4:
+            raise Exception("[x] Truncated deflate stream.")
+        length, complement = struct.unpack("<HH", lengths)
+        if length != complement ^ 0xffff:
+            raise Exception("[x] Invalid stored block lengths.")
+        out = self.Read(position + 4, length)
+        if len(out) < length:
+            raise Exception("[x] Truncated deflate stream.")
+        self.Bit = (position + 4 + length) * 8
+        return out
+
+    def inflate_block(self):
+        decompressor = zlib.decompressobj(-15, zdict=self.Window) \
+            if self.Window else zlib.decompressobj(-15)
+        outs = []
+        consumed = 0
+        # (decompressor before the chunk, chunk, output) of the last chunk
+        # fed before the one where the block ends.
+        previous = (decompressor.copy(), b"", b"")
+        for chunk in self.iter_shifted():
+            if consumed == 0:
+                chunk = bytes([chunk[0] | 1]) + chunk[1:]
+            before = decompressor.copy()
+            out = decompressor.decompress(chunk)
+            outs.append(out)
+            if decompressor.eof:
+                used = len(chunk) - len(decompressor.unused_data)
+                break
+            consumed += len(chunk)
+            previous = (before, chunk, out)
+        else:
+            raise Exception("[x] Truncated deflate stream.")
+
+        # The end of the block is in the last two bytes consumed, which are
+        # taken from the previous chunk if needed.
+        if used >= 2:
+            previous = (before, b"", b"")
+        before, previous_chunk, previous_out = previous
+        tail = previous_chunk + chunk[:used]
+        expected = previous_out + out
+        length = len(tail) * 8
+
+        def is_unneeded(end):
+            # Tells whether the bits of tail from end on are not needed to
+            # decompress the block.
+            if end >= length:
+                return True
+            flipped = bytearray(tail)
+            for bit in range(end, length):
+                flipped[bit // 8] ^= 1 << (bit % 8)
+            decompressor = before.copy()
+            try:
+                out = decompressor.decompress(bytes(flipped))
+            except zlib.error:
+                return False
+            return decompressor.eof and not decompressor.unused_data and \
+                out == expected
+
+        low = max(length - 16, 0) + 1
+        high = length
+        while low < high:
+            middle = (low + high) // 2
+            if is_unneeded(middle):
+                high = middle
+            else:
+                low = middle + 1
+        self.Bit += (consumed - len(previous_chunk)) * 8 + low
+        return b"".join(outs)
+
+
+class StreamInflater:
+    """
+    Same interface as BlockInflater for the members compressed with another
+    method than deflate (bzip2, LZMA), which are decompressed from their
+    start, a chunk at a time.
+    """
+
+    def __init__(self, read, method, size):
+        self.Read = read
+        self.Decompressor = get_decompressor(method)
+        self.Offset = 0
+        self.Size = size
+        self.Last = False
+
+    def next_block(self):
+        datas = self.Read(self.Offset, LC.CHUNK_SIZE)
+        if not datas:
+            raise Exception("[x] Truncated compressed data.")
+        self.Offset += len(datas)
+        out = b"".join(iter_decompress(self.Decompressor, datas))
+        self.Last = self.Offset >= self.Size or \
+            getattr(self.Decompressor, "eof", False)
+        return out
+
+
+class SeekPoint:
+    __slots__ = ("Bit", "Position", "Window")
+
+    def __init__(self, bit, position, window):
+        # Offset of a deflate block in the compressed data, in bits.
+        self.Bit = bit
+        # Offset of its first byte in the uncompressed data.
+        self.Position = position
+        self.Window = window
+
+
+class SeekIndex:
+    """
+    Seek points of a deflated member, from which BlockInflater can resume
+    its decompression. Each member gets its own file, named after the hash of
+    the URL of the ZIP and of the offset of its local file header, laid out
+    as follows (little endian):
+        - header (HeaderStruct): magic, format version, lengths of the URL
+          and validator, CRC-32, compressed and uncompressed sizes of the
+          member, and number of seek points
+        - URL and validator
+        - for each seek point: PointStruct (offset in bits, position,
+          length of the window once compressed) and window compressed with
+          zlib
+    The file is ignored if the ZIP changed or the member differs. The least
+    recently used files are removed once the directory grows over max_size
+    bytes.
+    """
+
+    Magic = b"RZFS"
+    Version = 1
+    HeaderStruct = struct.Struct("<4s3HIQQI")
+    PointStruct = struct.Struct("<QQI")
+
+    def __init__(
+        self,
+        url,
+        validator,
+        local_header_offset,
+        crc32,
+        compressed_size,
+        uncompressed_size,
+        directory=LC.SEEK_INDEX_DIRECTORY,
+        max_size=LC.SEEK_INDEX_SIZE
+    ):
+        self.Url = url
+        self.Validator = validator
+        self.CRC32 = crc32
+        self.CompressedSize = compressed_size
+        self.UncompressedSize = uncompressed_size
+        self.Directory = directory
+        self.MaxSize = max_size
+        self.Path = None
+        if directory is not None:
+            self.Path = os.path.join(
+                directory,
+                hashlib.sha256(
+                    f"{url}\n{local_header_offset}".encode()
+                ).hexdigest() + ".seek"
+            )
+        # The start of the member is always a seek point.
+        self.Points = [SeekPoint(0, 0, b"")]
+        self.Positions = [0]
+        # Seek points not stored yet.
+        self.Added = 0
+
+    def add(self, bit, position, window):
+        self.Points.append(SeekPoint(bit, position, window))
+        self.Positions.append(position)
+        self.Added += 1
+
+    def find(self, position):
+        # Returns the last seek point at or before position.
+        return self.Points[bisect.bisect_right(self.Positions, position) - 1]
+
+    def load(self):
+        """
+        This function reads the seek points stored for the member, if any.
+        Returns the number of seek points loaded.
+        """
+
+        if self.Path is None:
+            return 0
+        try:
+            with open(self.Path, "rb") as f:
+                datas = f.read()
+            (
+                magic, version, url_length, validator_length, crc32,
+                compressed_size, uncompressed_size, count
+            ) = self.HeaderStruct.unpack_from(datas, 0)
+            start = self.HeaderStruct.size
+            url = datas[start:start + url_length].decode()
+            start += url_length
+            validator = datas[start:start + validator_length].decode()
+            start += validator_length
+            if (
+                magic, version, url, validator, crc32, compressed_size,
+                uncompressed_size
+            ) != (
+                self.Magic, self.Version, self.Url, self.Validator,
+                self.CRC32, self.CompressedSize, self.UncompressedSize
+            ):
+                return 0
+            points = []
+            for _ in range(count):
+                bit, position, window_length = \
+                    self.PointStruct.unpack_from(datas, start)
+                start += self.PointStruct.size
+                window = zlib.decompress(datas[start:start + window_length])
+                start += window_length
+                points.append(SeekPoint(bit, position, window))
+        except (OSError, ValueError, struct.error, zlib.error):
+            return 0
+
+        self.Points = [self.Points[0]] + points
+        self.Positions = [point.Position for point in self.Points]
+        self.Added = 0
+        # The modification time keeps track of the last use (LRU).
+        os.utime(self.Path)
+
+        if LC.DEBUG:
+            print(f"[*] {count} seek point(s) loaded from {self.Path}.")
+
+        return count
+
+    def store(self):
+        """
+        This function writes the seek points of the member, if some were
+        added, then removes the least recently used files if the directory
+        is too large.
+        """
+
+        if self.Path is None or not self.Added:
+            return
+        os.makedirs(self.Directory, exist_ok=True)
+        raw_url = self.Url.encode()
+        raw_validator = self.Validator.encode()
+        temporary_path = f"{self.Path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(self.HeaderStruct.pack(
+                self.Magic, self.Version, len(raw_url), len(raw_validator),
+                self.CRC32, self.CompressedSize, self.UncompressedSize,
+                len(self.Points) - 1
+            ))
+            f.write(raw_url)
+            f.write(raw_validator)
+            for point in self.Points[1:]:
+                window = zlib.compress(point.Window)
+                f.write(self.PointStruct.pack(
+                    point.Bit,
+                    point.Position,
+                    len(window)
+                ))
+                f.write(window)
+        os.replace(temporary_path, self.Path)
+        self.Added = 0
+
+        if LC.DEBUG:
+            print(f"[*] {len(self.Points) - 1} seek point(s) stored in " + \
+                  f"{self.Path}."
+            )
+
+        self.prune()
+
+    def prune(self):
+        # Removes the least recently used files over the budget.
+        entries = []
+        for name in os.listdir(self.Directory):
+            if not name.endswith(".seek"):
+                continue
+            path = os.path.join(self.Directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort(reverse=True)
+        total = 0
+        for _, size, path in entries:
+            total += size
+            if total > self.MaxSize:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class RemoteZipMember(io.RawIOBase):
+    """
+    Read-only file object over entry i of a ZIP, whose bytes are downloaded
+    as they are read (through a RangeReader), so that a few MiB can be read
+    from the middle of a huge member. The reads of a stored member are
+    turned into range requests. A deflated member is decompressed from the
+    last seek point before the position read: seek points are recorded every
+    span bytes of uncompressed data as the member is decompressed, and kept
+    in its SeekIndex (in seek_index_directory, unless it is None) for the
+    next runs. Members compressed with another method are decompressed from
+    their start again when a read goes backward.
+    """
+
+    def __init__(
+        self,
+        downloader,
+        index,
+        i,
+        seek_index_directory=LC.SEEK_INDEX_DIRECTORY,
+        span=LC.SEEK_POINT_SPAN
+    ):
+        super().__init__()
+        self.name = index.get_file_name(i)
+        self.CompressionMethod = index.CompressionMethods[i]
+        self.CompressedSize = index.CompressedSizes[i]
+        self.UncompressedSize = index.UncompressedSizes[i]
+        self.CRC32 = index.CRC32s[i]
+        if index.GeneralPurposeBitFlags[i] & FLAG_ENCRYPTED:
+            raise Exception(f"[x] {self.name}: encrypted member.")
+        # Raises for the unsupported compression methods.
+        get_decompressor(self.CompressionMethod)
+
+        # The range of the member includes the longest local file header
+        # expected.
+        self.Reader = RangeReader(
+            downloader,
+            *index.get_member_range(i, descriptor=False)
+        )
+        # Offset of the compressed data from the local file header, known
+        # once the header has been read.
+        self.DataOffset = None
+        self.Span = span
+        self.SeekIndex = None
+        if self.CompressionMethod == DEFLATED:
+            self.SeekIndex = SeekIndex(
+                downloader.Url,
+                downloader.Validator,
+                index.LocalHeaderOffsets[i],
+                self.CRC32,
+                self.CompressedSize,
+                self.UncompressedSize,
+                seek_index_directory
+            )
+            self.SeekIndex.load()
+
+        self.Position = 0
+        self.Inflater = None
+        # Uncompressed data of the block decompressed last, and its position.
+        self.Buffer = b""
+        self.BufferStart = 0
+        # CRC-32 of the data decompressed, when it started from the
+        # beginning of the member.
+        self.Checksum = None
+        # Uncompressed bytes decompressed to serve the reads.
+        self.Decompressed = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.Position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.Position + offset
+        elif whence == io.SEEK_END:
+            position = self.UncompressedSize + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}.")
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}.")
+        self.Position = position
+        return position
+
+    def read_compressed(self, offset, length):
+        # Returns length bytes of the compressed data from offset on.
+        if self.DataOffset is None:
+            datas = self.Reader.read(0, LocalFileHeader.Struct.size)
+            self.DataOffset = LocalFileHeader(datas).StructLength
+        length = min(length, self.CompressedSize - offset)
+        if length <= 0:
+            return b""
+        return self.Reader.read(self.DataOffset + offset, length)
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        # The buffer is filled unless the end of the member is reached, like
+        # the reads of ZipExtFile.
+        length = min(len(buffer), self.UncompressedSize - self.Position)
+        read = 0
+        while read < length:
+            if self.CompressionMethod == STORED:
+                datas = self.read_compressed(self.Position, length - read)
+            else:
+                datas = self.read_uncompressed(length - read)
+            if not datas:
+                raise Exception(f"[x] {self.name}: truncated member.")
+            buffer[read:read + len(datas)] = datas
+            read += len(datas)
+            self.Position += len(datas)
+        return read
+
+    def restart(self):
+        # Restarts the decompression from the last seek point before the
+        # position read.
+        if self.SeekIndex is not None:
+            point = self.SeekIndex.find(self.Position)
+            self.Inflater = BlockInflater(
+                self.read_compressed,
+                point.Bit,
+                point.Window
+            )
+            self.BufferStart = point.Position
+        else:
+            self.Inflater = StreamInflater(
+                self.read_compressed,
+                self.CompressionMethod,
+                self.CompressedSize
+            )
+            self.BufferStart = 0
+        self.Buffer = b""
+        self.Checksum = 0 if self.BufferStart == 0 else None
+
+        if LC.DEBUG:
+            print(f"[*] {self.name}: decompressing from position " + \
+                  f"{self.BufferStart}.")
+
+    def read_uncompressed(self, length):
+        buffer_end = self.BufferStart + len(self.Buffer)
+        if self.Inflater is None or self.Position < self.BufferStart or (
+            self.SeekIndex is not None and
+            self.SeekIndex.find(self.Position).Position > buffer_end
+        ):
+            self.restart()
+
+        while self.Position >= self.BufferStart + len(self.Buffer):
+            if self.Inflater.Last:
+                raise Exception(f"[x] {self.name}: truncated member.")
+            self.BufferStart += len(self.Buffer)
+            self.Buffer = self.Inflater.next_block()
+            self.Decompressed += len(self.Buffer)
+            buffer_end = self.BufferStart + len(self.Buffer)
+            if self.Checksum is not None:
+                self.Checksum = zlib.crc32(self.Buffer, self.Checksum)
+            if self.Inflater.Last:
+                self.check(buffer_end)
+            elif self.SeekIndex is not None and buffer_end >= \
+                self.SeekIndex.Positions[-1] + self.Span:
+                self.SeekIndex.add(
+                    self.Inflater.Bit,
+                    buffer_end,
+                    self.Inflater.Window
+                )
+
+        start = self.Position - self.BufferStart
+        return self.Buffer[start:start + length]
+
+    def check(self, size):
+        # Checks the size of the member and, if it was decompressed from its
+        # start, its CRC-32, once its end is reached.
+        if size != self.UncompressedSize or (
+            self.Checksum is not None and self.Checksum != self.CRC32
+        ):
+            raise Exception(
+                f"[x] {self.name}: bad CRC-32 or size " + \
+                f"({hex(self.Checksum or 0)}, {size} bytes instead of " + \
+                f"{hex(self.CRC32)}, {self.UncompressedSize} bytes)."
+            )
+
+    def close(self):
+        if not self.closed and self.SeekIndex is not None:
+            self.SeekIndex.store()
+        super().close()
+
+
+def extract_member_range(
+    downloader,
+    index,
+    i,
+    start,
+    end,
+    output_directory,
+    seek_index_directory=LC.SEEK_INDEX_DIRECTORY
+):
+    """
+    This function writes the bytes start to end (inclusive) of the
+    uncompressed data of entry i of index to the output directory, read
+    through a RemoteZipMember. Returns the path written.
+    """
+
+    if start >= index.UncompressedSizes[i]:
+        raise Exception(
+            f"[x] {index.get_file_name(i)}: position {start} is past the " + \
+            f"end ({index.UncompressedSizes[i]} bytes)."
+        )
+
+    begin = time.perf_counter()
+    with RemoteZipMember(
+        downloader,
+        index,
+        i,
+        seek_index_directory
+    ) as member:
+        points = len(member.SeekIndex.Points) if member.SeekIndex else 0
+        path = get_output_path(
+            output_directory,
+            member.name,
+            f".{start}-{end}"
+        )
+        member.seek(start)
+        remaining = end - start + 1
+        written = 0
+        with open(path, "wb") as f:
+            while remaining > 0:
+                datas = member.read(
+                    min(remaining, LC.MEMBER_BLOCK_SIZE * LC.MEMBER_READ_AHEAD)
+                )
+                if not datas:
+                    break
+                f.write(datas)
+                written += len(datas)
+                remaining -= len(datas)
+
+    print(f"[*] {member.name}: {written} bytes from position {start} " + \
+          f"written to {path} in {time.perf_counter() - begin:.3f}s " + \
+          f"({member.Reader.Requests} request(s), " + \
+          f"{member.Reader.Received} bytes received, " + \
+          f"{member.Decompressed} bytes decompressed)."
+    )
+    if member.SeekIndex is not None:
+        print(f"[*] {member.name}: {points - 1} seek point(s) loaded, " + \
+              f"{len(member.SeekIndex.Points) - points} added.")
+    return path
@@ -0,0 +1,364 @@
+import json
+import math
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import lib.constants as LC
+
+from lib.extractor import MemberExtractor, preallocate
+
+
+class DownloadJournal:
+    """
+    Crash-safe record of the segments of a part file already downloaded. The
+    first line identifies the download (URL, size and validator of the ZIP,
+    offset of the local file header, CRC-32 and compressed size of the
+    member), each following line is a "<start> <end>" range
+    (absolute offsets in the ZIP, both inclusive) whose bytes have been
+    written and synced to the part file before the line was appended. A torn
+    last line, left by a crash, is ignored.
+    """
+
+    Magic = "reZFDownloader journal 1"
+
+    def __init__(
+        self,
+        path,
+        url,
+        zip_size,
+        validator,
+        offset,
+        crc32,
+        compressed_size
+    ):
+        self.Path = path
+        self.Header = json.dumps({
+            "url": url,
+            "zip_size": zip_size,
+            "validator": validator,
+            "offset": offset,
+            "crc32": crc32,
+            "compressed_size": compressed_size
+        }, sort_keys=True)
+        self.File = None
+        self.Lock = threading.Lock()
+
+    def load(self):
+        """
+        This function returns the ranges already downloaded, an empty list if
+        there is no journal, or None if the journal belongs to another version
+        of the ZIP (or can't be read).
+        """
+
+        try:
+            with open(self.Path, "r") as f:
+                lines = f.read().split("\n")
+        except FileNotFoundError:
+            return []
+        except OSError:
+            return None
+        if len(lines) < 2 or lines[0] != self.Magic or lines[1] != self.Header:
+            return None
+
+        completed = []
+        # The last element is either empty or a torn line.
+        for line in lines[2:-1]:
+            try:
+                start, end = [int(x) for x in line.split(" ")]
+            except ValueError:
+                break
+            completed.append((start, end))
+        return completed
+
+    def open(self, completed):
+        # Rewrites the journal with the ranges already completed and keeps it
+        # open to append the next ones.
+        with open(self.Path, "w") as f:
+            f.write(f"{self.Magic}\n{self.Header}\n")
+            for start, end in completed:
+                f.write(f"{start} {end}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.File = open(self.Path, "a")
+
+    def record(self, fd, start, end):
+        # Records that the bytes start to end have been written to the part
+        # file fd, once they are on the disk.
+        if end < start:
+            return
+        os.fsync(fd)
+        with self.Lock:
+            self.File.write(f"{start} {end}\n")
+            self.File.flush()
+            os.fsync(self.File.fileno())
+
+    def close(self):
+        if self.File is not None:
+            self.File.close()
+            self.File = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.Path):
+            os.remove(self.Path)
+
+
+def get_missing_ranges(start, end, completed):
+    # Returns the ranges of start to end not covered by completed.
+    missing = []
+    cursor = start
+    for completed_start, completed_end in sorted(completed):
+        if completed_start > cursor:
+            missing.append((cursor, min(completed_start - 1, end)))
+        cursor = max(cursor, completed_end + 1)
+        if cursor > end:
+            break
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+class SegmentedDownload:
+    """
+    Downloads the range of a single large member over several connections.
+    The range is cut into segments which are written in place (os.pwrite) in a
+    preallocated part file, in whatever order they arrive. Each connection
+    sizes its next segment so that it takes about LC.SEGMENT_DURATION seconds
+    at the throughput it measured, and connections are added as long as doing
+    so does not lower the throughput of each connection (i.e. as long as the
+    server throttles connections rather than the link being saturated).
+    """
+
+    def __init__(self, downloader, max_connections=LC.MAX_SEGMENTS):
+        self.Downloader = downloader
+        self.MaxConnections = max_connections
+        self.Lock = threading.Lock()
+
+    def next_segment(self, throughput):
+        # Reserves the next segment for a connection whose throughput (bytes
+        # per second) is known, or None for a new connection.
+        with self.Lock:
+            if not self.Missing:
+                return None
+            if throughput is None:
+                size = LC.MIN_SEGMENT_SIZE
+            else:
+                size = int(throughput * LC.SEGMENT_DURATION)
+                size = min(max(size, LC.MIN_SEGMENT_SIZE), LC.MAX_SEGMENT_SIZE)
+            start, missing_end = self.Missing[0]
+            end = min(start + size - 1, missing_end)
+            if end == missing_end:
+                self.Missing.pop(0)
+            else:
+                self.Missing[0] = (end + 1, missing_end)
+            return start, end
+
+    def connection(self, fd):
+        # Downloads segments until the whole range is reserved.
+        throughput = None
+        while True:
+            segment = self.next_segment(throughput)
+            if segment is None:
+                return
+            start, end = segment
+            begin = time.perf_counter()
+            written = [0]
+
+            def write(offset, datas):
+                datas = datas[max(start - offset, 0):end - offset + 1]
+                os.pwrite(fd, datas, max(offset, start) - self.Start)
+                written[0] += len(datas)
+                with self.Lock:
+                    self.Written += len(datas)
+
+            try:
+                self.Downloader.stream_range(start, end, write)
+            finally:
+                # Even if the transfer failed, the bytes received are kept.
+                if self.Journal is not None:
+                    self.Journal.record(fd, start, start + written[0] - 1)
+            elapsed = max(time.perf_counter() - begin, 1e-6)
+            throughput = (end - start + 1) / elapsed
+            with self.Lock:
+                self.Throughputs.append(throughput)
+
+    def should_add_connection(self, connections):
+        # A connection is added while the latest segments are downloaded as
+        # fast as the best ones, i.e. the connections don't compete.
+        with self.Lock:
+            if connections >= self.MaxConnections or not self.Missing:
+                return False
+            if len(self.Throughputs) < connections:
+                return False
+            best = max(self.Throughputs)
+            recent = self.Throughputs[-connections:]
+            return sum(recent) / len(recent) >= LC.SEGMENT_SCALING * best
+
+    def download(self, start, end, path, journal=None):
+        """
+        This function downloads the bytes start to end (inclusive) of the ZIP
+        to the file path. If a journal is given, the ranges it records are
+        not downloaded again, and the ranges downloaded are added to it.
+        Returns the number of connections used.
+        """
+
+        self.Start = start
+        self.End = end
+        self.Written = 0
+        self.Throughputs = []
+        self.Journal = journal
+
+        completed = []
+        if journal is not None:
+            completed = journal.load()
+            if completed is None:
+                print(f"[!] {path}: the ZIP changed since the interrupted " + \
+                       "download, starting over."
+                )
+                completed = []
+            elif not os.path.exists(path):
+                completed = []
+            journal.open(completed)
+        self.Missing = get_missing_ranges(start, end, completed)
+        self.Written = (end - start + 1) - \
+            sum(missing_end - missing_start + 1
+                for missing_start, missing_end in self.Missing)
+        self.Resumed = self.Written
+        if completed:
+            print(f"[*] {path}: resuming, {self.Written} bytes already " + \
+                   "downloaded."
+            )
+
+        flags = os.O_WRONLY | os.O_CREAT
+        if not completed:
+            flags |= os.O_TRUNC
+        fd = os.open(path, flags, 0o644)
+        connections = 0
+        try:
+            # The range of the member may have been estimated differently by
+            # the interrupted download (see --resolve-extents).
+            os.ftruncate(fd, end - start + 1)
+            with os.fdopen(os.dup(fd), "wb") as f:
+                preallocate(f, end - start + 1)
+            remaining = sum(
+                missing_end - missing_start + 1
+                for missing_start, missing_end in self.Missing
+            )
+            initial = min(
+                LC.INITIAL_SEGMENTS,
+                self.MaxConnections,
+                math.ceil(remaining / LC.MIN_SEGMENT_SIZE)
+            )
+            with ThreadPoolExecutor(max_workers=self.MaxConnections) as executor:
+                futures = {
+                    executor.submit(self.connection, fd)
+                    for _ in range(initial)
+                }
+                connections = initial
+                while futures:
+                    done, futures = wait(
+                        futures,
+                        timeout=LC.SEGMENT_DURATION,
+                        return_when="FIRST_COMPLETED"
+                    )
+                    for future in done:
+                        future.result()
+                    if self.should_add_connection(connections):
+                        futures.add(executor.submit(self.connection, fd))
+                        connections += 1
+        finally:
+            os.close(fd)
+            if journal is not None:
+                journal.close()
+
+        if self.Written != end - start + 1:
+            raise Exception(
+                f"[x] {self.Written} bytes received instead of " + \
+                f"{end - start + 1}."
+            )
+
+        if LC.DEBUG:
+            print(f"[*] {end - start + 1} bytes downloaded with " + \
+                  f"{connections} connection(s).")
+
+        return connections
+
+
+def download_segmented(
+    downloader,
+    index,
+    i,
+    output_directory,
+    max_connections,
+    local_extra_length=None
+):
+    """
+    This function downloads entry i of index (whose local file header has an
+    extra field of local_extra_length bytes, if known) with a
+    SegmentedDownload, then extracts it from the part file, which checks its
+    compressed size and its CRC-32. If the download is interrupted, the part
+    file and its journal are kept so that the next run only downloads the
+    missing bytes. Returns the path written and the number of bytes received.
+    """
+
+    extractor = MemberExtractor(index, i, output_directory)
+    start, end = index.get_member_range(
+        i,
+        local_extra_length,
+        extractor.Raw
+    )
+    part_path = extractor.Path + ".part"
+    journal = DownloadJournal(
+        part_path + ".journal",
+        downloader.Url,
+        downloader.ZipSize,
+        downloader.Validator,
+        index.LocalHeaderOffsets[i],
+        index.CRC32s[i],
+        index.CompressedSizes[i]
+    )
+    segmented_download = SegmentedDownload(downloader, max_connections)
+    try:
+        segmented_download.download(start, end, part_path, journal)
+    except Exception as error:
+        if not str(error).startswith("[x]"):
+            error = Exception(f"[x] {extractor.Name}: {error}.")
+        raise Exception(
+            f"{error} The download will resume from where it stopped."
+        )
+
+    try:
+        with open(part_path, "br") as f:
+            while True:
+                datas = f.read(LC.CHUNK_SIZE)
+                if not datas:
+                    break
+                extractor.feed(datas)
+
+        # The extra field of the local file header may be longer than
+        # expected, in which case the end of the member is still missing.
+        missing = extractor.get_missing(end - start + 1)
+        if missing:
+            def feed(offset, datas):
+                extractor.feed(
+                    datas[max(end + 1 - offset, 0):end + missing - offset + 1]
+                )
+
+            downloader.stream_range(end + 1, end + missing, feed)
+        path = extractor.close()
+    except Exception as error:
+        extractor.abort()
+        if not str(error).startswith("[x]"):
+            error = Exception(f"[x] {extractor.Name}: {error}.")
+        raise error
+    finally:
+        # The part file is either extracted or corrupted, it is never resumed.
+        os.remove(part_path)
+        journal.remove()
+
+    if extractor.Raw:
+        downloader.Fragments.append(path)
+    return path, end - start + 1 - segmented_download.Resumed
@@ -0,0 +1,211 @@
+import fnmatch
+import re
+
+import lib.constants as LC
+
+
+class Selection:
+    """
+    Criteria used to select entries of a CentralDirectoryIndex without asking
+    the user. An entry is selected if its name matches one of the name
+    criteria (exact names, globs, regular expressions, directory prefixes),
+    or if there is none, and if it passes all the other filters.
+    """
+
+    def __init__(
+        self,
+        names=(),
+        globs=(),
+        regexes=(),
+        prefixes=(),
+        min_size=None,
+        max_size=None,
+        after=None,
+        before=None,
+        methods=()
+    ):
+        self.Names = list(names)
+        self.NameSet = set(self.Names)
+        self.Globs = list(globs)
+        self.Regexes = list(regexes)
+        self.Prefixes = list(prefixes)
+        # Bounds of the uncompressed size, in bytes.
+        self.MinSize = min_size
+        self.MaxSize = max_size
+        # Bounds of the modification date, given as "YYYY-MM-DD[ HH:MM:SS]"
+        # and stored as (MS-DOS date << 16 | MS-DOS time).
+        self.After = encode_dos_datetime(after) \
+            if after is not None else None
+        self.Before = encode_dos_datetime(before, True) \
+            if before is not None else None
+        self.Methods = [parse_compression_method(method) for method in methods]
+
+        # Exact names not found by the last call to select().
+        self.Missing = []
+
+        # Compiled globs and regular expressions, see matches().
+        self.Match = None
+
+    def has_name_criteria(self):
+        return bool(self.Names or self.Globs or self.Regexes or self.Prefixes)
+
+    def is_empty(self):
+        return not self.Names and self.is_empty_except_names()
+
+    def get_exact_names(self):
+        """
+        This function returns the raw exact names to look for if they are
+        the only criteria, None otherwise. In that case the central directory
+        does not need to be read past the last of them.
+        """
+
+        if not self.Names or \
+            not self.is_empty_except_names():
+            return None
+        return set(name.encode() for name in self.Names)
+
+    def is_empty_except_names(self):
+        return not (self.Globs or self.Regexes or self.Prefixes) and \
+            self.MinSize is None and \
+            self.MaxSize is None and \
+            self.After is None and \
+            self.Before is None and \
+            not self.Methods
+
+    def compile(self):
+        # Returns the function matching the globs and regular expressions, or
+        # None if there are none. A glob has to match the whole name (the
+        # translated pattern ends with \Z, and is applied with match), while a
+        # regular expression may match anywhere in it (search).
+        checks = []
+        if self.Globs:
+            checks.append(re.compile("|".join(
+                f"(?:{fnmatch.translate(glob)})" for glob in self.Globs
+            )).match)
+        if self.Regexes:
+            checks.append(re.compile("|".join(
+                f"(?:{regex})" for regex in self.Regexes
+            )).search)
+        if not checks:
+            return None
+        if len(checks) == 1:
+            return checks[0]
+        match, search = checks
+        return lambda name: match(name) or search(name)
+
+    def matches(self, index, i):
+        """
+        This function tells whether entry i of index is selected. It is the
+        per-entry version of select(), used while the central directory is
+        still being parsed.
+        """
+
+        if self.has_name_criteria():
+            name = index.get_file_name(i)
+            if self.Match is None:
+                self.Match = self.compile()
+            if not (name in self.NameSet or \
+                any(name.startswith(prefix) for prefix in self.Prefixes) or \
+                (self.Match is not None and self.Match(name))):
+                return False
+        if self.MinSize is not None and \
+            index.UncompressedSizes[i] < self.MinSize:
+            return False
+        if self.MaxSize is not None and \
+            index.UncompressedSizes[i] > self.MaxSize:
+            return False
+        datetime = index.FileLastModificationDates[i] << 16 | \
+            index.FileLastModificationTimes[i]
+        if self.After is not None and datetime < self.After:
+            return False
+        if self.Before is not None and datetime > self.Before:
+            return False
+        if self.Methods and index.CompressionMethods[i] not in self.Methods:
+            return False
+        return True
+
+    def select(self, index):
+        """
+        This function returns the sorted positions of the entries of index
+        selected. Exact names are looked up in the hash table of the index
+        and prefixes in its sorted names, globs and regular expressions are
+        matched with the function returned by compile() over all the names.
+        The exact names which do not exist are listed in self.Missing.
+        """
+
+        self.Missing = []
+        if self.has_name_criteria():
+            selected = set()
+            for name in self.Names:
+                i = index.find(name)
+                if i is None:
+                    self.Missing.append(name)
+                else:
+                    selected.add(i)
+            for prefix in self.Prefixes:
+                selected.update(index.find_prefix(prefix))
+            match = self.compile()
+            if match is not None:
+                selected.update(
+                    i for i, name in enumerate(index.get_file_names())
+                    if match(name)
+                )
+        else:
+            selected = range(len(index))
+
+        if self.MinSize is not None:
+            sizes = index.UncompressedSizes
+            selected = [i for i in selected if sizes[i] >= self.MinSize]
+        if self.MaxSize is not None:
+            sizes = index.UncompressedSizes
+            selected = [i for i in selected if sizes[i] <= self.MaxSize]
+        if self.After is not None or self.Before is not None:
+            dates = index.FileLastModificationDates
+            times = index.FileLastModificationTimes
+            after = self.After if self.After is not None else 0
+            before = self.Before if self.Before is not None else 0xffffffff
+            selected = [
+                i for i in selected
+                if after <= (dates[i] << 16 | times[i]) <= before
+            ]
+        if self.Methods:
+            methods = index.CompressionMethods
+            selected = [i for i in selected if methods[i] in self.Methods]
+
+        return sorted(selected)
+
+
+def parse_compression_method(method):
+    # Accepts a compression method number or its name in
+    # LC.COMPRESSION_METHOD (e.g. "deflated").
+    if str(method).isdigit():
+        return int(method)
+    for number, name in LC.COMPRESSION_METHOD.items():
+        if name == method:
+            return number
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+def encode_dos_datetime(value, end_of_day=False):
+    """
+    This function converts "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS" to the
+    stored MS-DOS date and time, as (date << 16 | time), so that it can be
+    compared to the columns of the index. Without time, the start of the day
+    is used (or its end if end_of_day).
+    """
+
+    date, _, time = value.partition(" ")
+    if time:
+        clock = time
+    elif end_of_day:
+        clock = "23:59:59"
+    else:
+        clock = "00:00:00"
+    try:
+        year, month, day = [int(x) for x in date.split("-")]
+        hour, minute, seconde = [int(x) for x in clock.split(":")]
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | seconde // 2
+    return dos_date << 16 | dos_time
@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+
+
+class Phase:
+    """
+    Counters of one phase of main() (bootstrap, central directory, download,
+    ...): the HTTP requests sent during the phase, the bytes they asked for
+    and received, the connections opened for them and the entries indexed.
+    """
+
+    __slots__ = (
+        "Name",
+        "Begin",
+        "End",
+        "Requests",
+        "Connections",
+        "BytesRequested",
+        "BytesReceived",
+        "Entries",
+        "ParseTime",
+    )
+
+    def __init__(self, name, begin):
+        self.Name = name
+        self.Begin = begin
+        self.End = None
+        self.Requests = 0
+        self.Connections = 0
+        self.BytesRequested = 0
+        self.BytesReceived = 0
+        self.Entries = 0
+        # Time spent parsing the central directory, when it is interleaved
+        # with its download. The parse rate is computed from the duration of
+        # the phase otherwise.
+        self.ParseTime = None
+
+    def get_duration(self):
+        return (self.End or time.perf_counter()) - self.Begin
+
+    def get_metrics(self):
+        duration = self.get_duration()
+        parse_time = self.ParseTime if self.ParseTime is not None else duration
+        metrics = {
+            "duration": duration,
+            "requests": self.Requests,
+            "connections": self.Connections,
+            "reused_connections": self.Requests - self.Connections,
+            "bytes_requested": self.BytesRequested,
+            "bytes_received": self.BytesReceived,
+        }
+        if self.Entries:
+            metrics["entries"] = self.Entries
+            metrics["parse_time"] = parse_time
+            metrics["entries_per_second"] = \
+                self.Entries / max(parse_time, 1e-9)
+        return metrics
+
+
+class NullContext:
+    # Returned by Tracer.phase when tracing is disabled.
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_CONTEXT = NullContext()
+
+
+class PhaseContext:
+    # Makes a new phase of tracer current until it exits. Phases can be
+    # nested, the requests are only counted in the innermost one.
+    def __init__(self, tracer, name):
+        self.Tracer = tracer
+        self.Name = name
+        self.Parent = None
+
+    def __enter__(self):
+        phase = Phase(self.Name, time.perf_counter())
+        self.Parent = self.Tracer.Current
+        self.Tracer.Phases.append(phase)
+        self.Tracer.Current = phase
+        return phase
+
+    def __exit__(self, *exc_info):
+        self.Tracer.Current.End = time.perf_counter()
+        self.Tracer.Current = self.Parent
+        return False
+
+
+class Tracer:
+    """
+    Records the phases of a run and the HTTP requests sent during each of
+    them, then writes them as a JSON file in the Trace Event Format, which
+    can be loaded in chrome://tracing or Perfetto. The totals, including the
+    bytes saved compared with downloading the whole ZIP, are written in its
+    otherData object. When it is disabled (the default), phase() returns a
+    shared no-op context manager and the other methods return immediately.
+    """
+
+    def __init__(self):
+        self.Enabled = False
+        self.Origin = time.perf_counter()
+        self.Phases = []
+        self.Current = None
+        self.Events = []
+        self.ZipSize = None
+        self.Lock = threading.Lock()
+
+    def enable(self):
+        self.Enabled = True
+        self.Origin = time.perf_counter()
+
+    def get_timestamp(self, t):
+        # Microseconds since the tracer was enabled.
+        return (t - self.Origin) * 1e6
+
+    def phase(self, name):
+        if not self.Enabled:
+            return NULL_CONTEXT
+        return PhaseContext(self, name)
+
+    def count_entries(self, entries, parse_time=None):
+        # Adds entries indexed (in parse_time seconds) to the current phase.
+        phase = self.Current
+        if not self.Enabled or phase is None:
+            return
+        phase.Entries += entries
+        if parse_time is not None:
+            phase.ParseTime = (phase.ParseTime or 0) + parse_time
+
+    def count_request(self, r, begin, requested, received):
+        """
+        This function records the request answered by the requests response
+        r, sent at begin (perf_counter), which asked for requested bytes and
+        received received bytes.
+        """
+
+        if not self.Enabled:
+            return
+        end = time.perf_counter()
+        connections = 1 if r.NewConnection else 0
+        # Responses of the block cache may be partly (or entirely) served
+        # from the disk, with fewer requests receiving whole blocks.
+        requests = getattr(r, "Requests", 1)
+        cached = getattr(r, "CachedBytes", 0)
+        received = getattr(r, "NetworkBytes", received)
+        with self.Lock:
+            phase = self.Current
+            if phase is not None:
+                phase.Requests += requests
+                phase.Connections += connections
+                phase.BytesRequested += requested
+                phase.BytesReceived += received
+            self.Events.append({
+                "name": "GET",
+                "cat": "request",
+                "ph": "X",
+                "ts": self.get_timestamp(begin),
+                "dur": (end - begin) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {
+                    "range": r.RequestHeaders.get("Range"),
+                    "status": r.status_code,
+                    "phase": phase.Name if phase is not None else None,
+                    "new_connection": connections > 0,
+                    "bytes_requested": requested,
+                    "bytes_received": received,
+                    "bytes_from_cache": cached,
+                },
+            })
+
+    def get_totals(self):
+        metrics = [phase.get_metrics() for phase in self.Phases]
+        totals = {
+            key: sum(m[key] for m in metrics)
+            for key in (
+                "requests",
+                "connections",
+                "reused_connections",
+                "bytes_requested",
+                "bytes_received",
+            )
+        }
+        # Nested phases overlap, the duration is the one of the whole run.
+        totals["duration"] = max(
+            (phase.Begin + phase.get_duration() for phase in self.Phases),
+            default=self.Origin
+        ) - min((phase.Begin for phase in self.Phases), default=self.Origin)
+        totals["zip_size"] = self.ZipSize
+        if self.ZipSize is not None:
+            totals["bytes_saved"] = self.ZipSize - totals["bytes_received"]
+        return totals
+
+    def write(self, path):
+        # Writes the phases, the requests and the totals to path.
+        if not self.Enabled:
+            return
+        events = [
+            {
+                "name": phase.Name,
+                "cat": "phase",
+                "ph": "X",
+                "ts": self.get_timestamp(phase.Begin),
+                "dur": phase.get_duration() * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.main_thread().ident,
+                "args": phase.get_metrics(),
+            }
+            for phase in self.Phases
+        ]
+        with self.Lock:
+            events += self.Events
+        with open(path, "w") as f:
+            json.dump({
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+                "otherData": {
+                    "phases": {
+                        phase.Name: phase.get_metrics()
+                        for phase in self.Phases
+                    },
+                    "totals": self.get_totals(),
+                },
+            }, f, indent=2)
+        print(f"[*] Trace written to {path}.")
+
+
+# Tracer shared by the modules sending requests, enabled by main.py.
+TRACER = Tracer()
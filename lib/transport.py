@@ -0,0 +1,261 @@
+import threading
+import urllib.parse
+
+import lib.constants as LC
+
+
+# Status codes followed to the URL of their Location header.
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class Response:
+    """
+    Response to a GET request sent by an HttpClientSession. It exposes the
+    part of requests.Response used by the tool (status_code, headers, content,
+    iter_content and the context manager), so that both transports can be
+    used the same way. Its connection goes back to the pool of the session
+    once the body has been entirely read, and is closed otherwise.
+    """
+
+    def __init__(self, session, key, connection, response, request_headers,
+                 new_connection):
+        self.Session = session
+        self.Key = key
+        self.Connection = connection
+        self.Raw = response
+        self.RequestHeaders = request_headers
+        # True if a new connection was opened for the request.
+        self.NewConnection = new_connection
+        self.status_code = response.status
+        # Case-insensitive, like the headers of requests.
+        self.headers = response.msg
+        self.Content = None
+
+    @property
+    def content(self):
+        if self.Content is None:
+            self.Content = self.Raw.read()
+            self.close()
+        return self.Content
+
+    def iter_content(self, chunk_size=LC.CHUNK_SIZE):
+        while True:
+            datas = self.Raw.read(chunk_size)
+            if not datas:
+                break
+            yield datas
+
+    def close(self):
+        if self.Connection is None:
+            return
+        if not self.Raw.isclosed() and self.Raw.length is not None and \
+            self.Raw.length <= LC.CHUNK_SIZE:
+            # A small unread body (a single byte when revalidating) is
+            # drained, so that the connection can be reused.
+            self.Raw.read()
+        if self.Raw.isclosed() and not self.Raw.will_close:
+            self.Session.release(self.Key, self.Connection)
+        else:
+            self.Connection.close()
+        self.Connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class HttpClientSession:
+    """
+    Minimal HTTP/1.1 client built on http.client, much faster to import than
+    requests (it is itself only imported when the first session is created,
+    as a listing from the cache may send no request at all). The connections
+    are kept alive and pooled by host, so that they are shared between the
+    threads (at most pool_size idle connections are kept per host).
+    Redirections are followed.
+    """
+
+    def __init__(self, pool_size=LC.MAX_REQUESTS_PER_HOST):
+        import http.client
+
+        self.Client = http.client
+        # Errors raised when a kept-alive connection was closed by the server
+        # while it was idle. The request is then sent again on a new
+        # connection.
+        self.StaleConnectionErrors = (
+            http.client.RemoteDisconnected,
+            http.client.BadStatusLine,
+            ConnectionResetError,
+            BrokenPipeError,
+        )
+        self.PoolSize = pool_size
+        self.Pools = {}
+        self.Lock = threading.Lock()
+
+    def acquire(self, key):
+        # Returns an idle connection to key, or a new one, and whether it is
+        # new.
+        with self.Lock:
+            pool = self.Pools.get(key)
+            if pool:
+                return pool.pop(), False
+        scheme, host = key
+        if scheme == "https":
+            return self.Client.HTTPSConnection(host), True
+        return self.Client.HTTPConnection(host), True
+
+    def release(self, key, connection):
+        with self.Lock:
+            pool = self.Pools.setdefault(key, [])
+            if len(pool) < self.PoolSize:
+                pool.append(connection)
+                return
+        connection.close()
+
+    def send(self, url, headers):
+        # Sends the request on a pooled connection, and again on a new one if
+        # the pooled connection turns out to be closed.
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"[x] Unsupported URL scheme: {parts.scheme}.")
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        while True:
+            connection, new_connection = self.acquire(key)
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+            except self.StaleConnectionErrors:
+                connection.close()
+                if new_connection:
+                    raise
+                continue
+            except:
+                connection.close()
+                raise
+            return Response(
+                self,
+                key,
+                connection,
+                response,
+                headers,
+                new_connection
+            )
+
+    def get(self, url, headers=None, stream=False):
+        """
+        This function sends a GET request for url with headers and returns
+        its Response. Unless stream is True, the body is read at once and the
+        connection is released.
+        """
+
+        headers = dict(headers or {})
+        for _ in range(LC.MAX_REDIRECTS + 1):
+            r = self.send(url, headers)
+            location = r.headers.get("Location")
+            if r.status_code not in REDIRECT_CODES or location is None:
+                if not stream:
+                    r.content
+                return r
+            r.content
+            url = urllib.parse.urljoin(url, location)
+        raise Exception(f"[x] More than {LC.MAX_REDIRECTS} redirections.")
+
+
+class RequestsSession:
+    """
+    Transport based on requests.Session, imported only when this transport is
+    selected. The responses get the RequestHeaders and NewConnection
+    attributes of the Response of HttpClientSession. Whether a new connection
+    was opened is deduced from the connection counter of the urllib3 pool.
+    """
+
+    def __init__(self, pool_size=LC.MAX_REQUESTS_PER_HOST):
+        import requests
+        import weakref
+
+        self.Session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size
+        )
+        self.Session.mount("http://", adapter)
+        self.Session.mount("https://", adapter)
+        # Number of connections opened by each urllib3 pool when it was last
+        # seen, to count the ones opened since.
+        self.PoolConnections = weakref.WeakKeyDictionary()
+        self.Lock = threading.Lock()
+
+    def get(self, url, headers=None, stream=False):
+        r = self.Session.get(url=url, headers=headers, stream=stream)
+        pool = getattr(r.raw, "_pool", None)
+        connections = 0
+        if pool is not None:
+            with self.Lock:
+                connections = pool.num_connections - \
+                    self.PoolConnections.get(pool, 0)
+                self.PoolConnections[pool] = pool.num_connections
+        r.RequestHeaders = r.request.headers
+        r.NewConnection = connections > 0
+        return r
+
+
+TRANSPORTS = {
+    "http.client": HttpClientSession,
+    "requests": RequestsSession,
+}
+
+# Transport used by new sessions, selected on the command line.
+selected_transport = LC.TRANSPORT
+
+# Block cache put under the range requests of the new sessions (see
+# lib/block_cache.py), set by main.py.
+block_cache = None
+
+# Session shared by the requests sent before the download (bootstrap,
+# revalidation, bisection) and by the Downloader, so that they reuse the same
+# connections.
+default_session = None
+
+
+def select_transport(name):
+    global selected_transport, default_session
+    if name not in TRANSPORTS:
+        raise ValueError(f"[x] Unknown transport: {name}.")
+    selected_transport = name
+    default_session = None
+
+
+def set_block_cache(cache):
+    global block_cache, default_session
+    block_cache = cache
+    default_session = None
+
+
+def get_session(pool_size=LC.MAX_REQUESTS_PER_HOST):
+    # Returns a new session of the selected transport, behind the block
+    # cache if there is one.
+    session = TRANSPORTS[selected_transport](pool_size)
+    if block_cache is not None:
+        from lib.block_cache import CachedSession
+
+        return CachedSession(session, block_cache)
+    return session
+
+
+def get_default_session(pool_size=LC.MAX_REQUESTS_PER_HOST):
+    # Returns the default session, created (with pool_size connections kept
+    # per host) if no request was sent yet.
+    global default_session
+    if default_session is None:
+        default_session = get_session(pool_size)
+    return default_session
+
+
+def get(url, headers=None, stream=False):
+    # Sends a GET request through the default session.
+    return get_default_session().get(url, headers, stream)
@@ -1,7 +1,26 @@
-import lib.constants as LC
 import os
 
 
-def clean():
-    if os.path.exists(LC.JUNK_FILENAME):
-        os.remove(LC.JUNK_FILENAME)
\ No newline at end of file
+def get_name_parts(filename):
+    """
+    This function returns the components of the name of a member kept in its
+    output path: absolute names, "." and ".." components are dropped.
+    """
+
+    return [
+        part for part in filename.replace("\\", "/").split("/")
+        if part not in ("", ".", "..")
+    ]
+
+
+def get_output_path(directory, filename, suffix=""):
+    """
+    This function returns the path where the member filename is written,
+    keeping its directories but never leaving directory (see
+    get_name_parts()).
+    """
+
+    path = os.path.join(directory, *get_name_parts(filename)) + suffix
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,148 @@
+import struct
+
+import lib.constants as LC
+
+
+class Zip64EndOfCentralDirectoryLocator:
+    """
+    The contents of the sctrucure are described by the following URL:
+        - https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT (4.3.15)
+    It immediately precedes the end of central directory record of ZIP64
+    archives.
+    """
+
+    __slots__ = (
+        "DiskWhereZip64EndOfCentralDirectoryStarts",
+        "OffsetOfZip64EndOfCentralDirectoryRecord",
+        "TotalNumberOfDisks",
+    )
+
+    # Offset 0, Bytes 4
+    Zip64EndOfCentralDirectoryLocatorSignature = \
+        LC.ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE
+
+    Struct = struct.Struct("<4sIQI")
+
+    def __init__(self, datas, offset=0):
+        try:
+            if offset < 0 or len(datas) - offset < self.Struct.size:
+                raise Exception(
+                    "[x] Truncated ZIP64 end of central directory locator."
+                )
+
+            (
+                Signature,
+                # Offset 4, Bytes 4
+                self.DiskWhereZip64EndOfCentralDirectoryStarts,
+                # Offset 8, Bytes 8 (relative to start of archive)
+                self.OffsetOfZip64EndOfCentralDirectoryRecord,
+                # Offset 16, Bytes 4
+                self.TotalNumberOfDisks
+            ) = self.Struct.unpack_from(datas, offset)
+
+            if self.Zip64EndOfCentralDirectoryLocatorSignature != Signature:
+                raise Exception(
+                    "[x] Bad signature for: ZIP64 end of central directory " + \
+                    "locator signature."
+                )
+
+        except Exception as error:
+            print(error)
+            exit(-1)
+
+    def get_offset_of_zip64_end_of_central_directory_record(self):
+        OffsetOfZip64EndOfCentralDirectoryRecord = \
+            self.OffsetOfZip64EndOfCentralDirectoryRecord
+
+        if LC.DEBUG:
+            print("\t- Offset of ZIP64 end of central directory record: " + \
+                 f"{hex(OffsetOfZip64EndOfCentralDirectoryRecord)}"
+            )
+
+        return OffsetOfZip64EndOfCentralDirectoryRecord
+
+
+class Zip64EndOfCentralDirectoryRecord:
+    """
+    The contents of the sctrucure are described by the following URL:
+        - https://en.wikipedia.org/wiki/ZIP_(file_format)#ZIP64
+    Its fields replace those of the end of central directory record which are
+    set to 0xffff or 0xffffffff.
+    """
+
+    __slots__ = (
+        "SizeOfZip64EndOfCentralDirectoryRecord",
+        "VersionMadeBy",
+        "VersionNeededToExtract",
+        "NumberOfThisDisk",
+        "DiskWhereCentralDirectoryStarts",
+        "NumberOfCentralDirectoryRecordsOnThisDisk",
+        "TotalNumberOfCentralDirectoryRecords",
+        "SizeOfCentralDirectory",
+        "OffsetOfStartOfCentralDirectory",
+    )
+
+    # Offset 0, Bytes 4
+    Zip64EndOfCentralDirectorySignature = \
+        LC.ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE
+
+    # Fixed part of the record, from offset 0 to offset 56. It may be followed
+    # by an extensible data sector, which is ignored.
+    Struct = struct.Struct("<4sQ2H2I4Q")
+
+    def __init__(self, datas, offset=0):
+        try:
+            if offset < 0 or len(datas) - offset < self.Struct.size:
+                raise Exception(
+                    "[x] Truncated ZIP64 end of central directory record."
+                )
+
+            (
+                Signature,
+                # Offset 4, Bytes 8 (size of the remaining record)
+                self.SizeOfZip64EndOfCentralDirectoryRecord,
+                # Offset 12, Bytes 2
+                self.VersionMadeBy,
+                # Offset 14, Bytes 2
+                self.VersionNeededToExtract,
+                # Offset 16, Bytes 4
+                self.NumberOfThisDisk,
+                # Offset 20, Bytes 4
+                self.DiskWhereCentralDirectoryStarts,
+                # Offset 24, Bytes 8
+                self.NumberOfCentralDirectoryRecordsOnThisDisk,
+                # Offset 32, Bytes 8
+                self.TotalNumberOfCentralDirectoryRecords,
+                # Offset 40, Bytes 8
+                self.SizeOfCentralDirectory,
+                # Offset 48, Bytes 8 (relative to start of archive)
+                self.OffsetOfStartOfCentralDirectory
+            ) = self.Struct.unpack_from(datas, offset)
+
+            if self.Zip64EndOfCentralDirectorySignature != Signature:
+                raise Exception(
+                    "[x] Bad signature for: ZIP64 end of central directory " + \
+                    "signature."
+                )
+
+        except Exception as error:
+            print(error)
+            exit(-1)
+
+        if LC.DEBUG:
+            print("[*] ZIP64 end of central directory record parsed.")
+
+    def pack(self):
+        # Returns the fixed part of the record, without extensible data.
+        return self.Struct.pack(
+            self.Zip64EndOfCentralDirectorySignature,
+            self.Struct.size - 12,
+            self.VersionMadeBy,
+            self.VersionNeededToExtract,
+            self.NumberOfThisDisk,
+            self.DiskWhereCentralDirectoryStarts,
+            self.NumberOfCentralDirectoryRecordsOnThisDisk,
+            self.TotalNumberOfCentralDirectoryRecords,
+            self.SizeOfCentralDirectory,
+            self.OffsetOfStartOfCentralDirectory
+        )
@@ -1,10 +1,26 @@
 import argparse
 import lib.constants as LC
-import requests
+import lib.transport as transport
+import os
+import sys
+import time
 
-from lib.central_directory_file_header import CentralDirectoryFileHeader
-from lib.end_of_central_directory_record import EndOfCentralDirectoryRecord
-from lib.utils import clean
+from lib.bootstrap import bootstrap, revalidate
+from lib.central_directory_index import CentralDirectoryParser
+from lib.index_cache import IndexCache
+from lib.selection import Selection
+from lib.tracer import TRACER
+
+
+def format_entry(index, i, detailed=False):
+    if detailed:
+        return f"\t- {index.get_file_name(i)} " + \
+            f"({index.CompressedSizes[i]} bytes)\n"
+    return f"\t- File name: {index.get_file_name(i)}\n"
+
+
+def print_entry(index, i, detailed=False):
+    sys.stdout.write(format_entry(index, i, detailed))
 
 
 def main(options):
@@ -12,127 +28,333 @@ def main(options):
     zip_name = options["url"].split("/")[-1]
     print(f"[*] ZIP name: {zip_name}")
 
-    # Using an HTTP HEAD request, we retrieve the size of the ZIP file.
-    zip_size = 0
-    r = requests.head(options["url"])
-    for key in r.headers:
-        if key.lower() == "content-length":
-            zip_size = int(r.headers[key])
-    if zip_size == 0:
-        print(f"[x] Can't find Content-Length HTTP header.")
-        exit(-1)
-    print(f"[*] ZIP size: {hex(zip_size)} bytes")
-
-
-    # Then we search for the end of central directory record by downloading only
-    # the last LC.END_OF_CENTRAL_DIRECTORY_RECORD_RANGE bytes.
-    last_bytes = open(LC.JUNK_FILENAME, "bw")
-    headers = {
-        "Range": f"bytes={zip_size-LC.END_OF_CENTRAL_DIRECTORY_RECORD_RANGE}-{zip_size}"
-    }
-    with requests.get(url=options["url"], headers=headers, stream=True) as r:
-        last_bytes.write(r.content)
-    last_bytes.close()
-
-    # Once the end of the file has been downloaded, we'll explore the written
-    # file looking for a signature. The signature (0x504b0506) of interest is
-    # that of structure end of central directory record.
-    last_bytes = open(LC.JUNK_FILENAME, "br")
-    signature = b"\x50\x4b\x05\x06"
-    datas = last_bytes.read()
-    if datas.find(signature) == -1:
-        print(f"[x] Can't find end of central directory signature.")
-        clean()
-        exit(-1)
-    index = datas.find(signature)
-    eocdr_offset = zip_size - index
-    if LC.DEBUG:
-        print("[*] End of central directory record found at " + \
-             f"offset: {hex(eocdr_offset)}"
+    # If the central directory of this ZIP has already been indexed (in the
+    # cache or in the catalog), its index is used, once a tiny conditional
+    # request has confirmed that the ZIP did not change.
+    selection = options["selection"]
+    catalog = options["catalog"]
+    listed = False
+    index_cache = None
+    cached = None
+    source = "cache"
+    with TRACER.phase("cache"):
+        if options["cache"]:
+            index_cache = IndexCache(
+                options["cache_dir"],
+                options["cache_size"]
+            )
+            cached = index_cache.load(options["url"])
+        if cached is None and catalog is not None:
+            cached = catalog.load(options["url"])
+            source = "catalog"
+        if cached is not None and not options["revalidate"]:
+            print(f"[*] Index loaded from {source} without revalidation.")
+        elif cached is not None and revalidate(
+            options["url"],
+            cached.ZipSize,
+            cached.Validator
+        ):
+            print(f"[*] Index loaded from {source}, revalidated in 1 " + \
+                  "round trip(s)."
+            )
+        else:
+            cached = None
+
+    if cached is not None:
+        zip_size = cached.ZipSize
+        validator = cached.Validator
+        index = cached.Index
+        print(f"[*] ZIP size: {hex(zip_size)} bytes")
+    else:
+        # A single suffix range request retrieves the size of the ZIP file
+        # (from the Content-Range HTTP header), the end of central directory
+        # record and, most of the time, the whole central directory. A
+        # follow-up request is only sent for what doesn't fit in the first
+        # window.
+        with TRACER.phase("bootstrap"):
+            metadata = bootstrap(options["url"], options["bootstrap_range"])
+        zip_size = metadata.ZipSize
+        validator = metadata.Validator
+        eocdr = metadata.EndOfCentralDirectoryRecord
+        print(f"[*] ZIP size: {hex(zip_size)} bytes")
+
+        expected = eocdr.get_total_number_of_central_directory_records(1)
+        complete = True
+        wanted = selection.get_exact_names()
+        index = None
+        if options["bisect"] and wanted and metadata.HeadRange is not None:
+            # In a ZIP sorted by name, the requested files are looked up by
+            # bisecting the central directory with small range probes. If it
+            # turns out not to be sorted, it is entirely scanned instead.
+            from lib.remote_lookup import RemoteLookup
+
+            with TRACER.phase("bisect"):
+                lookup = RemoteLookup(
+                    options["url"],
+                    eocdr,
+                    metadata.HeadRange[1] + 1,
+                    metadata.Tail,
+                    validator=validator
+                )
+                index = lookup.lookup_all(wanted)
+            metadata.RoundTrips += lookup.RoundTrips
+            if index is None:
+                print(f"[*] Bisection gave up after {lookup.RoundTrips} " + \
+                      "probe(s) (" + \
+                      ("not found" if lookup.Sorted else "not sorted") + \
+                      "), falling back to a full scan."
+                )
+            else:
+                complete = False
+                print(f"[*] {len(index)} file(s) found by bisection in " + \
+                      f"{lookup.RoundTrips} probe(s)."
+                )
+        if index is None and options["parse_processes"] > 1 and \
+            eocdr.get_size_of_central_directory() > LC.PARALLEL_PARSE_THRESHOLD:
+            # Very large central directories are downloaded first, then
+            # parsed by several processes.
+            from lib.parallel_parser import parse_central_directory_parallel
+
+            with TRACER.phase("central_directory_fetch"):
+                central_directory = metadata.CentralDirectory
+            with TRACER.phase("central_directory_parse"):
+                index = parse_central_directory_parallel(
+                    central_directory,
+                    expected,
+                    options["parse_processes"]
+                )
+                TRACER.count_entries(len(index))
+        elif index is None:
+            # The central directory is parsed while it is downloaded, so that
+            # the files in the ZIP are listed as soon as their header is
+            # received. If only exact names are requested, the download stops
+            # once they have all been found. Otherwise, we check that the
+            # number of headers identified is equal to the number of files
+            # expected. If this is not the case, a problem has occurred.
+            with TRACER.phase("central_directory"):
+                parser = CentralDirectoryParser()
+                index = parser.Index
+                chunks = metadata.iter_central_directory()
+                for datas in chunks:
+                    parse_begin = time.perf_counter()
+                    entries = parser.feed(datas)
+                    TRACER.count_entries(
+                        len(entries),
+                        time.perf_counter() - parse_begin
+                    )
+                    for i in entries:
+                        if selection.is_empty() or (
+                            options["dry_run"] and selection.matches(index, i)
+                        ):
+                            print_entry(index, i, options["dry_run"])
+                        if wanted is not None:
+                            wanted.discard(index.get_raw_file_name(i))
+                    if wanted is not None and not wanted:
+                        break
+                chunks.close()
+            listed = True
+
+            if wanted is not None and not wanted and len(index) < expected:
+                complete = False
+                print("[*] All the requested files found after " + \
+                     f"{len(index)}/{expected} entries, central directory " + \
+                      "download stopped."
+                )
+            else:
+                parser.close(expected)
+
+        print(f"[*] Metadata retrieved in {metadata.RoundTrips} round " + \
+               "trip(s)."
         )
-    eocdr = EndOfCentralDirectoryRecord(datas[index::], zip_size)
-
-    # Thanks to the structure end of central directory record, we can calculate the
-    # offset at which the structure central directory file header is located.
-    cdfhs_offset = eocdr.get_relative_offset_of_start_of_central_directory()
-
-    # We then retrieve only the bytes corresponding to this structure.
-    last_bytes = open(LC.JUNK_FILENAME, "bw")
-    headers = {
-        "Range": f"bytes={zip_size-cdfhs_offset}-{zip_size-eocdr.StructLength}"
-    }
-    with requests.get(url=options["url"], headers=headers, stream=True) as r:
-        last_bytes.write(r.content)
-    last_bytes.close()
-
-    # Once the end of the file has been downloaded, we'll explore the written
-    # file looking for a signature. The signature (0x504b0102) of interest is
-    # that of structure central directory file header.
-    last_bytes = open(LC.JUNK_FILENAME, "br")
-    signature = b"\x50\x4b\x01\x02"
-    datas = last_bytes.read()
-    cdfhs = []
-    start = 0
-    while datas[start::].find(signature) != -1:
-        index = datas[start::].find(signature)
-        cdfh = CentralDirectoryFileHeader(datas[start + index::])
-        cdfhs.append(cdfh)
-        start += index + cdfh.StructLength
-
-    # We check that the number of central directory record headers identified is
-    # equal to the number of files expected. If this is not the case, a problem
-    # has occurred.
-    if eocdr.get_total_number_of_central_directory_records(1) != len(cdfhs):
-        print(f"[x] Can't find all central directory file header.")
-        clean()
-        exit(-1)
+        if complete and index_cache is not None:
+            index_cache.store(
+                options["url"],
+                zip_size,
+                validator,
+                eocdr,
+                index
+            )
+        if complete and catalog is not None:
+            catalog.store(options["url"], zip_size, validator, eocdr, index)
+            catalog.build_indexes()
+
+    TRACER.ZipSize = zip_size
+
+    # Once the central directory has been indexed, we can identify the files
+    # in the ZIP and retrieve their names.
+    if not listed and (selection.is_empty() or options["dry_run"]):
+        sys.stdout.write("".join(
+            format_entry(index, i, options["dry_run"])
+            for i in range(len(index))
+            if selection.is_empty() or selection.matches(index, i)
+        ))
+
+    # If no file was selected on the command line, the user is asked which
+    # file to download.
+    if selection.is_empty():
+        filename = input("Which file do you want to download:\n> ")
+        selection = Selection(names=[filename])
 
-    # Once the central directory record headers have been extracted, we can
-    # identify the files in the ZIP and retrieve their names.
-    for cdfh in cdfhs:
-        cdfh.get_file_name(0)
-
-    # The user is then asked which file to download inside the ZIP file.
-    filename = input("Which file do you want to download:\n> ")
-    # We go through the structures to check that the filename entered by the
-    # user is indeed a valdid filename. If not, a problem has occurred.
-    current_cdfh = None
-    for i in range(len(cdfhs)):
-        if filename == cdfhs[i].get_file_name(1):
-            current_cdfh = i
-            break
-    if current_cdfh == None:
+    # We look for the filenames in the index to check that they are indeed
+    # valdid filenames. If not, a problem has occurred.
+    members = selection.select(index)
+    for filename in selection.Missing:
         print(f"[x] \"{filename}\" does not exist in \"{zip_name}\".")
-        clean()
+    if selection.Missing:
         exit(-1)
 
-    # Depending on the choice made by the user, a range is calculated in which
-    # the local file header structure is supposed to be located. The range only
-    # needs to be larger than the structure + the compressed file + the data
-    # descriptor if it exists.
-    start = cdfhs[current_cdfh].get_relative_offset_of_local_file_header(1)
-    end = cdfhs[current_cdfh].get_relative_offset_of_local_file_header(1) + \
-        30 + \
-        cdfhs[current_cdfh].get_file_name_length(1) + \
-        cdfhs[current_cdfh].get_extra_field_length(1) + \
-        cdfhs[current_cdfh].get_compressed_size(1) + \
-        12
-    truncated_filename = filename.split("/")[-1]
-    last_bytes = open(f"outputs/{truncated_filename}.zip", "bw")
-    headers = {
-        "Range": f"bytes={start}-{end}"
-    }
-    with requests.get(url=options["url"], headers=headers, stream=True) as r:
-        last_bytes.write(r.content)
-    last_bytes.close()
-
-    clean()
-    print(f"[i] Use command: \"7z x outputs/{truncated_filename}.zip\" to " + \
-           "recover file."
+    compressed_size = sum(index.CompressedSizes[i] for i in members)
+    uncompressed_size = sum(index.UncompressedSizes[i] for i in members)
+    print(f"[*] {len(members)} member(s) selected, {compressed_size} " + \
+          f"bytes to download ({uncompressed_size} bytes uncompressed)."
     )
+    if options["dry_run"]:
+        print("[+] Done.")
+        return
+
+    # The members are downloaded concurrently over pooled keep-alive
+    # connections. Members close to each other are downloaded together. The
+    # downloader (and the decompressors) are only imported here, so that
+    # listing a ZIP starts faster.
+    from lib.downloader import Downloader
+
+    downloader = Downloader(
+        options["url"],
+        options["workers"],
+        options["max_requests_per_host"],
+        zip_size,
+        validator
+    )
+
+    # If only a range of the files is wanted, they are read with random
+    # access: only the blocks needed are downloaded, and deflated files are
+    # decompressed from the closest seek point recorded by a previous read.
+    if options["read_range"] is not None:
+        from lib.remote_member import extract_member_range
+
+        start, end = options["read_range"]
+        with TRACER.phase("read"):
+            for i in members:
+                try:
+                    extract_member_range(
+                        downloader,
+                        index,
+                        i,
+                        start,
+                        end,
+                        options["output_dir"],
+                        options["seek_index_dir"]
+                    )
+                except Exception as error:
+                    print(error)
+        print("[+] Done.")
+        return
+
+    with TRACER.phase("download"):
+        paths = downloader.download_members(
+            index,
+            members,
+            options["output_dir"],
+            options["max_gap"],
+            options["ranges_per_request"],
+            options["segmented_threshold"],
+            options["segments"],
+            options["resolve_extents"],
+            options["decompress_processes"]
+        )
+
+    # Members which can't be decompressed by the tool are written as ZIP
+    # fragments.
+    fragments = downloader.Fragments
+    if len(fragments) == 1:
+        print(f"[i] Use command: \"7z x {fragments[0]}\" to recover file.")
+    elif fragments:
+        print(f"[i] {len(fragments)} file(s) could not be decompressed, " + \
+               "use command: \"7z x <file>.zip\" on them to recover them."
+        )
     print("[+] Done.")
 
 
+def search_catalog(options):
+    # Lists the files of the catalog matching the query of options, then
+    # downloads them if asked. As the catalog holds their index, no request
+    # is sent before the download: its range requests carry the validator
+    # of the indexed ZIP (If-Range), so a ZIP changed since is detected.
+    catalog = options["catalog"]
+    matches = catalog.find(
+        glob=options["find"],
+        crc32=options["crc32"],
+        min_size=options["min_size"],
+        max_size=options["max_size"]
+    )
+    names = {}
+    for entry in matches:
+        print(f"\t- {entry.Url}: {entry.Name} ({entry.UncompressedSize} " + \
+              f"bytes, CRC-32 {entry.CRC32:08x})")
+        names.setdefault(entry.Url, []).append(entry.Name)
+    print(f"[*] {len(matches)} file(s) found in {len(names)} ZIP(s).")
+    if not options["download"]:
+        return
+    for url, members in names.items():
+        main(dict(
+            options,
+            url=url,
+            selection=Selection(names=members),
+            cache=False,
+            revalidate=False,
+            bisect=False,
+            dry_run=False
+        ))
+
+
+def crawl_batch(options):
+    # Indexes the ZIPs listed in options["batch"] concurrently and writes one
+    # JSON line per ZIP to options["index_output"] ("-" for the standard
+    # output, the messages then go to the standard error).
+    from lib.crawler import IndexSink, run_crawl
+
+    with open(options["batch"]) as f:
+        urls = [line.strip() for line in f if line.strip()]
+    index_cache = None
+    if options["cache"]:
+        index_cache = IndexCache(options["cache_dir"], options["cache_size"])
+    catalog = options["catalog"]
+    if options["index_output"] == "-":
+        output, log = sys.stdout, sys.stderr
+    else:
+        output, log = open(options["index_output"], "w"), sys.stdout
+    print(f"[*] Indexing {len(urls)} ZIP(s), {options['concurrency']} at " + \
+          "a time.", file=log)
+    sink = IndexSink(output, index_cache, options["entries"], catalog)
+    try:
+        duration, session = run_crawl(
+            urls,
+            sink,
+            options["concurrency"],
+            options["max_requests_per_host"],
+            options["bootstrap_range"]
+        )
+    finally:
+        sink.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"[*] {sink.Indexed} ZIP(s) indexed ({sink.EntryCount} entries), " + \
+          f"{sink.Failed} failed, in {duration:.2f}s " + \
+          f"({len(urls) / max(duration, 1e-9):.1f} ZIP(s)/s).", file=log)
+    print(f"[*] {session.Requests} request(s) " + \
+          f"({sink.RoundTrips / max(sink.Indexed, 1):.2f} round trip(s) " + \
+          f"per ZIP), {session.Connections} connection(s), " + \
+          f"{session.BytesReceived} bytes received.", file=log)
+    if catalog is not None:
+        # The indexes are built once all the entries are inserted.
+        begin = time.perf_counter()
+        catalog.build_indexes()
+        print(f"[*] Catalog indexes built in " + \
+              f"{time.perf_counter() - begin:.2f}s.", file=log)
+    if sink.Failed:
+        exit(-1)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="This tool allows you to download the files inside a" + \
@@ -141,11 +363,413 @@ if __name__ == "__main__":
     parser.add_argument(
         "url",
         default="http://127.0.0.1:8000/junk_file.zip",
-        type=str
+        type=str,
+        nargs="?"
+    )
+    parser.add_argument(
+        "--bootstrap-range",
+        default=LC.BOOTSTRAP_RANGE,
+        type=int,
+        help="Number of bytes requested at the end of the ZIP to find its " + \
+             "central directory"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the central directory index cache"
+    )
+    parser.add_argument(
+        "--no-revalidate",
+        action="store_true",
+        help="Trust the cached index without checking that the ZIP changed"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=LC.CACHE_DIRECTORY,
+        type=str,
+        help="Directory of the central directory index cache"
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=LC.CACHE_SIZE,
+        type=int,
+        help="Maximum size of the index cache in bytes"
+    )
+    parser.add_argument(
+        "--no-block-cache",
+        action="store_true",
+        help="Send the range requests without going through the block cache"
+    )
+    parser.add_argument(
+        "--block-cache-dir",
+        default=LC.BLOCK_CACHE_DIRECTORY,
+        type=str,
+        help="Directory of the block cache"
+    )
+    parser.add_argument(
+        "--block-cache-size",
+        default=LC.BLOCK_CACHE_SIZE,
+        type=int,
+        help="Maximum disk space used by the block cache in bytes"
+    )
+    parser.add_argument(
+        "--cache-inspect",
+        action="store_true",
+        help="List the cached indexes and exit"
+    )
+    parser.add_argument(
+        "--cache-prune",
+        default=None,
+        type=int,
+        metavar="SIZE",
+        help="Evict the least recently used indexes until the cache uses " + \
+             "at most SIZE bytes and exit"
+    )
+    parser.add_argument(
+        "--members",
+        default=[],
+        type=str,
+        nargs="+",
+        metavar="NAME",
+        help="Names of the files to download, instead of asking for one"
+    )
+    parser.add_argument(
+        "--glob",
+        default=[],
+        type=str,
+        action="append",
+        help="Download the files whose name matches this glob pattern"
+    )
+    parser.add_argument(
+        "--regex",
+        default=[],
+        type=str,
+        action="append",
+        help="Download the files whose name matches this regular expression"
+    )
+    parser.add_argument(
+        "--prefix",
+        default=[],
+        type=str,
+        action="append",
+        help="Download the files whose name starts with this prefix " + \
+             "(e.g. a directory)"
+    )
+    parser.add_argument(
+        "--min-size",
+        default=None,
+        type=int,
+        help="Only download the files at least this large (uncompressed)"
+    )
+    parser.add_argument(
+        "--max-size",
+        default=None,
+        type=int,
+        help="Only download the files at most this large (uncompressed)"
+    )
+    parser.add_argument(
+        "--after",
+        default=None,
+        type=str,
+        help="Only download the files modified after this date " + \
+             "(\"YYYY-MM-DD[ HH:MM:SS]\")"
+    )
+    parser.add_argument(
+        "--before",
+        default=None,
+        type=str,
+        help="Only download the files modified before this date " + \
+             "(\"YYYY-MM-DD[ HH:MM:SS]\")"
+    )
+    parser.add_argument(
+        "--method",
+        default=[],
+        type=str,
+        action="append",
+        help="Only download the files compressed with this method " + \
+             "(number or name, e.g. \"deflated\")"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List the selected files and their size without downloading them"
+    )
+    parser.add_argument(
+        "--bisect",
+        action="store_true",
+        help="Look up the files given by name by bisecting the central " + \
+             "directory, for ZIPs whose files are sorted by name"
+    )
+    parser.add_argument(
+        "--members-file",
+        default=None,
+        type=str,
+        help="File listing the names of the files to download, one per line"
+    )
+    parser.add_argument(
+        "--workers",
+        default=LC.WORKERS,
+        type=int,
+        help="Number of files downloaded concurrently"
+    )
+    parser.add_argument(
+        "--max-requests-per-host",
+        default=LC.MAX_REQUESTS_PER_HOST,
+        type=int,
+        help="Maximum number of requests in flight to the same host"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=LC.OUTPUT_DIRECTORY,
+        type=str,
+        help="Directory where the files are written"
+    )
+    parser.add_argument(
+        "--max-gap",
+        default=LC.MAX_RANGE_GAP,
+        type=int,
+        help="Members separated by at most this number of bytes are " + \
+             "downloaded with a single range"
+    )
+    parser.add_argument(
+        "--ranges-per-request",
+        default=LC.RANGES_PER_REQUEST,
+        type=int,
+        help="Number of ranges sent in a single multi-range request, if " + \
+             "the server supports it"
+    )
+    parser.add_argument(
+        "--segmented-threshold",
+        default=LC.SEGMENTED_THRESHOLD,
+        type=int,
+        help="Files whose compressed size is larger than this number of " + \
+             "bytes are downloaded over several connections"
+    )
+    parser.add_argument(
+        "--segments",
+        default=LC.MAX_SEGMENTS,
+        type=int,
+        help="Maximum number of connections used to download a single file"
+    )
+    parser.add_argument(
+        "--resolve-extents",
+        action="store_true",
+        help="Download the local file headers first (one request per " + \
+             "batch), so that each file is downloaded without extra bytes"
+    )
+    parser.add_argument(
+        "--parse-processes",
+        default=1,
+        type=int,
+        help="Number of processes parsing central directories larger than " + \
+            f"{LC.PARALLEL_PARSE_THRESHOLD} bytes (disables the streaming " + \
+             "parser for them)"
+    )
+    parser.add_argument(
+        "--decompress-processes",
+        default=1,
+        type=int,
+        help="Number of processes decompressing the files while the " + \
+             "next ones are downloaded (1 decompresses them in the " + \
+             "download threads)"
+    )
+    parser.add_argument(
+        "--read-range",
+        default=None,
+        type=str,
+        metavar="START-END",
+        help="Only write the bytes START to END (inclusive) of the " + \
+             "selected files, read with random access instead of " + \
+             "downloading them entirely"
+    )
+    parser.add_argument(
+        "--transport",
+        default=LC.TRANSPORT,
+        choices=list(transport.TRANSPORTS),
+        help="Library sending the HTTP requests (requests is only " + \
+             "imported when selected)"
+    )
+    parser.add_argument(
+        "--batch",
+        default=None,
+        type=str,
+        metavar="FILE",
+        help="Index the ZIPs listed in FILE (one URL per line) " + \
+             "concurrently instead of downloading from url"
+    )
+    parser.add_argument(
+        "--concurrency",
+        default=LC.CRAWL_CONCURRENCY,
+        type=int,
+        help="Number of ZIPs indexed at the same time in batch mode"
+    )
+    parser.add_argument(
+        "--index-output",
+        default="-",
+        type=str,
+        metavar="FILE",
+        help="File where the index of each ZIP is written as a JSON line " + \
+             "in batch mode [default: standard output]"
+    )
+    parser.add_argument(
+        "--no-entries",
+        action="store_true",
+        help="Only write the number of entries of each ZIP in batch mode"
+    )
+    parser.add_argument(
+        "--catalog",
+        default=None,
+        type=str,
+        nargs="?",
+        const=LC.CATALOG_PATH,
+        metavar="FILE",
+        help="SQLite catalog where the indexed ZIPs are loaded (in batch " + \
+             "mode too), and where their index is looked up " + \
+            f"[default: {LC.CATALOG_PATH}]"
+    )
+    parser.add_argument(
+        "--catalog-inspect",
+        action="store_true",
+        help="List the ZIPs of the catalog and exit"
+    )
+    parser.add_argument(
+        "--find",
+        default=None,
+        type=str,
+        metavar="GLOB",
+        help="List the files of the catalog whose name matches this glob " + \
+             "pattern (with --crc32, --min-size and --max-size) and exit"
+    )
+    parser.add_argument(
+        "--crc32",
+        default=None,
+        type=lambda value: int(value, 16),
+        help="Only find the files of the catalog with this CRC-32 " + \
+             "(hexadecimal)"
+    )
+    parser.add_argument(
+        "--download",
+        action="store_true",
+        help="Download the files found in the catalog by --find"
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        type=str,
+        metavar="FILE",
+        help="Write the duration, requests, bytes and connections of each " + \
+             "phase to FILE (Trace Event Format JSON)"
     )
     args = parser.parse_args()
 
+    if args.cache_inspect or args.cache_prune is not None:
+        index_cache = IndexCache(args.cache_dir, args.cache_size)
+        if args.cache_prune is not None:
+            removed = index_cache.prune(args.cache_prune)
+            print(f"[*] {removed} cached index(es) removed.")
+        index_cache.inspect()
+        exit(0)
+    catalog = None
+    if args.catalog is not None or args.catalog_inspect or \
+        args.find is not None:
+        from lib.catalog import Catalog
+
+        catalog = Catalog(args.catalog or LC.CATALOG_PATH)
+    if args.catalog_inspect:
+        catalog.inspect()
+        exit(0)
+    if args.batch is not None:
+        crawl_batch({
+            "batch": args.batch,
+            "index_output": args.index_output,
+            "entries": not args.no_entries,
+            "concurrency": args.concurrency,
+            "max_requests_per_host": args.max_requests_per_host,
+            "bootstrap_range": args.bootstrap_range,
+            "cache": not args.no_cache,
+            "cache_dir": args.cache_dir,
+            "cache_size": args.cache_size,
+            "catalog": catalog,
+        })
+        exit(0)
+    if args.url is None and args.find is None:
+        parser.error("the following arguments are required: url")
+
     options = {}
     options["url"] = args.url
+    options["bootstrap_range"] = args.bootstrap_range
+    options["cache"] = not args.no_cache
+    options["revalidate"] = not args.no_revalidate
+    options["cache_dir"] = args.cache_dir
+    options["cache_size"] = args.cache_size
+    options["catalog"] = catalog
+    options["find"] = args.find
+    options["crc32"] = args.crc32
+    options["min_size"] = args.min_size
+    options["max_size"] = args.max_size
+    options["download"] = args.download
+    members = list(args.members)
+    if args.members_file is not None:
+        with open(args.members_file) as f:
+            members += [line.rstrip("\n") for line in f if line.strip()]
+    try:
+        options["selection"] = Selection(
+            members,
+            args.glob,
+            args.regex,
+            args.prefix,
+            args.min_size,
+            args.max_size,
+            args.after,
+            args.before,
+            args.method
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    options["dry_run"] = args.dry_run
+    options["bisect"] = args.bisect
+    options["parse_processes"] = args.parse_processes
+    options["workers"] = args.workers
+    options["max_requests_per_host"] = args.max_requests_per_host
+    options["output_dir"] = args.output_dir
+    options["max_gap"] = args.max_gap
+    options["ranges_per_request"] = args.ranges_per_request
+    options["segmented_threshold"] = args.segmented_threshold
+    options["segments"] = args.segments
+    options["resolve_extents"] = args.resolve_extents
+    options["decompress_processes"] = args.decompress_processes
+    options["read_range"] = None
+    if args.read_range is not None:
+        try:
+            start, end = [int(x) for x in args.read_range.split("-")]
+        except ValueError:
+            parser.error(f"invalid range: {args.read_range}")
+        if start > end:
+            parser.error(f"invalid range: {args.read_range}")
+        options["read_range"] = (start, end)
+    # The seek points of the deflated files are kept with the index cache.
+    options["seek_index_dir"] = \
+        os.path.join(args.cache_dir, "seek") if options["cache"] else None
+
+    transport.select_transport(args.transport)
+    # The range requests go through the block cache, so that the bytes
+    # already received by a previous run (or for another member) are not
+    # downloaded again.
+    block_cache = None
+    if not args.no_block_cache:
+        from lib.block_cache import BlockCache
 
-    main(options)
+        block_cache = BlockCache(args.block_cache_dir, args.block_cache_size)
+        transport.set_block_cache(block_cache)
+    if args.trace is not None:
+        TRACER.enable()
+    try:
+        if options["find"] is not None:
+            search_catalog(options)
+        else:
+            main(options)
+    finally:
+        if block_cache is not None:
+            block_cache.print_statistics()
+            block_cache.close()
+        TRACER.write(args.trace)